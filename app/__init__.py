@@ -1,3 +1,8 @@
+import time
+from contextlib import asynccontextmanager
+
+_import_started = time.perf_counter()
+
 import tracemalloc
 import os
 import logging
@@ -5,9 +10,6 @@ from slowapi import Limiter
 from slowapi.util import get_remote_address
 import openai
 
-tracemalloc.start()
-limiter = Limiter(key_func=get_remote_address)
-
 log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_errors.log')
 logging.basicConfig(
     level=logging.ERROR,
@@ -23,13 +25,48 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.config import Config
 from slowapi.middleware import SlowAPIMiddleware
 
+# With several workers the rate limit counters live in the shared SQLite file
+if Config.SHARED_STATE_BACKEND == "sqlite":
+    from app.services.shared_state import SQLiteState, SQLiteSearchCache, SQLiteSessionStore
+    limiter = Limiter(key_func=get_remote_address, storage_uri=f"sqlite:///{Config.SHARED_STATE_PATH}")
+else:
+    limiter = Limiter(key_func=get_remote_address)
+
+# Tracing every allocation slows the index load considerably, so it is opt-in
+if Config.TRACEMALLOC:
+    tracemalloc.start()
+
+from app.services.startup import StartupTracker, IndexLoader
 from app.services.chatbot_service import ChatbotService
-from app.services.rag_service import RAGPipeline
 from app.services.web_search_service import WebSearchService
+from app.services.search_cache import SearchCache
+from app.services.http_clients import HttpClients
+from app.services.session_store import SessionStore
+from app.services.retrieval_server import RetrievalClient
+
+# llama_index, transformers and torch are imported by the background index load, not here
+startup_tracker = StartupTracker()
+startup_tracker.record("imports", time.perf_counter() - _import_started)
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="FleetOps API", description="Fleet Operations Assistant API", version="1.0.0")
+    create_started = time.perf_counter()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # The services are created below; this runs once the server starts
+        if Config.HTTP_WARM_CONNECTIONS > 0:
+            await http_clients.warm_up()
+        rag_pipeline.start()
+        try:
+            yield
+        finally:
+            rag_pipeline.shutdown()
+            search_cache.save()
+            await http_clients.aclose()
+
+    app = FastAPI(title="FleetOps API", description="Fleet Operations Assistant API", version="1.0.0",
+                  lifespan=lifespan)
 
     # Add CORS middleware
     app.add_middleware(
@@ -38,6 +75,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Session-Id"],
     )
 
     app.add_middleware(SlowAPIMiddleware)
@@ -51,16 +89,63 @@ def create_app() -> FastAPI:
         logger.error("SERP_API_KEY environment variable is not set")
         raise ValueError("SERP_API_KEY environment variable is required")
 
-    openai_client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
-    chatbot_service = ChatbotService(Config.OPENAI_API_KEY)
-    rag_pipeline = RAGPipeline(
-        data_dir="app/source_files/",
-        index_dir="app/index_storage"
+    http_clients = HttpClients(
+        openai_base_url=Config.OPENAI_BASE_URL,
+        search_base_url=Config.SERP_API_BASE_URL,
+        max_connections=Config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY,
+        http2=Config.HTTP2_ENABLED,
+        connect_timeout=Config.HTTP_CONNECT_TIMEOUT,
+        timeout=Config.HTTP_TIMEOUT,
+        warm_connections=Config.HTTP_WARM_CONNECTIONS
     )
-    web_search_service = WebSearchService(openai_client, Config.SERP_API_KEY)
+
+    openai_client = openai.OpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL,
+                                  http_client=http_clients.openai_sync)
+    # Sessions and web search results are shared by all workers when the SQLite backend is on
+    session_kwargs = dict(
+        max_sessions=Config.SESSION_MAX_COUNT,
+        ttl_seconds=Config.SESSION_TTL_SECONDS,
+        token_budget=Config.SESSION_TOKEN_BUDGET,
+        max_bytes=Config.SESSION_MAX_BYTES
+    )
+    if Config.SHARED_STATE_BACKEND == "sqlite":
+        shared_state = SQLiteState(Config.SHARED_STATE_PATH)
+        sessions = SQLiteSessionStore(shared_state, **session_kwargs)
+        search_cache = SQLiteSearchCache(
+            shared_state,
+            max_entries=Config.SEARCH_CACHE_SIZE,
+            ttl_seconds=Config.SEARCH_CACHE_TTL_SECONDS
+        )
+    else:
+        sessions = SessionStore(**session_kwargs)
+        search_cache = SearchCache(
+            max_entries=Config.SEARCH_CACHE_SIZE,
+            ttl_seconds=Config.SEARCH_CACHE_TTL_SECONDS,
+            persist_path=Config.SEARCH_CACHE_PATH
+        )
+
+    chatbot_service = ChatbotService(Config.OPENAI_API_KEY, http_client=http_clients.openai, sessions=sessions)
+    if Config.SHARED_INDEX:
+        # One retrieval server process (started by main.py) holds the model and index for every worker
+        rag_pipeline = RetrievalClient(Config.RETRIEVAL_SOCKET)
+    else:
+        # The embedding model and index load in the background so the server accepts connections at once
+        rag_pipeline = IndexLoader(
+            startup_tracker,
+            data_dir="app/source_files/",
+            index_dir="app/index_storage"
+        )
+    search_cache.load()
+    web_search_service = WebSearchService(openai_client, Config.SERP_API_KEY,
+                                          async_openai_client=chatbot_service.client,
+                                          search_cache=search_cache,
+                                          http_clients=http_clients)
 
     from app.routes.chatbot_routes import init_chatbot_routes
     init_chatbot_routes(app, chatbot_service, rag_pipeline, web_search_service)
+    startup_tracker.record("create_app", time.perf_counter() - create_started)
 
     return app
 
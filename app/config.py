@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import tempfile
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 env_path = os.path.join(base_dir, ".env")
@@ -11,4 +12,132 @@ load_dotenv(dotenv_path=env_path)
 class Config:
 
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    SERP_API_KEY = os.getenv("SERP_API_KEY")
\ No newline at end of file
+    SERP_API_KEY = os.getenv("SERP_API_KEY")
+
+    # Allocation tracing for memory debugging; slows everything down noticeably.
+    # TRACEMALLOC traces from import on, MEMORY_PROFILING enables the /api/memoryProfile endpoints
+    TRACEMALLOC = os.getenv("TRACEMALLOC", "false").lower() == "true"
+    MEMORY_PROFILING = os.getenv("MEMORY_PROFILING", "false").lower() == "true"
+
+    # Conversation sessions
+    SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", 1000))
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 1800))
+    SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", 2000))
+    SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", 50 * 1024 * 1024))
+
+    # Retrieved/web context packed into the system prompt
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+    CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", 50))
+    # Compression before packing: near-duplicate passages across sources are dropped and passages
+    # are cut to the sentences relevant to the question
+    CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "true").lower() == "true"
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", 0.8))  # shared shingle fraction
+    CONTEXT_SENTENCE_KEEP_RATIO = float(os.getenv("CONTEXT_SENTENCE_KEEP_RATIO", 0.3))  # of the passage's best score
+    CONTEXT_MIN_SENTENCES = int(os.getenv("CONTEXT_MIN_SENTENCES", 2))  # always kept per passage
+    CONTEXT_HISTORY_TURNS = int(os.getenv("CONTEXT_HISTORY_TURNS", 2))  # earlier questions scored with the query
+    # Passages whose best sentence matches less of the query's term weight are kept whole
+    CONTEXT_MIN_QUERY_COVERAGE = float(os.getenv("CONTEXT_MIN_QUERY_COVERAGE", 0.5))
+
+    # Retrieval executor ("thread", "process" or "none" to run inline)
+    RETRIEVAL_EXECUTOR = os.getenv("RETRIEVAL_EXECUTOR", "thread")
+    RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", 2))
+    RETRIEVAL_QUEUE_SIZE = int(os.getenv("RETRIEVAL_QUEUE_SIZE", 32))
+    RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", 10))
+    EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", 16))
+    EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))
+
+    # Query embedding / retrieval result cache (per process, cleared on index rebuild)
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+    QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS", 3600))
+
+    # On-disk vector format for newly written indexes: "float32", "float16" or "int8"
+    VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "float32")
+
+    # Retrieval mode: "hybrid" fuses BM25 and dense results, "dense" is vector search only
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+    MODULE_PREFILTER = os.getenv("MODULE_PREFILTER", "true").lower() == "true"
+    HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", 4))
+    LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", 1.0))
+
+    # One index shard per module file; queries search the shards whose centroid is within the margin of the best
+    SHARD_ROUTING = os.getenv("SHARD_ROUTING", "true").lower() == "true"
+    SHARD_ROUTE_MARGIN = float(os.getenv("SHARD_ROUTE_MARGIN", 0.05))
+    SHARD_MAX_FANOUT = int(os.getenv("SHARD_MAX_FANOUT", 0))  # most shards per query, 0 for no cap
+    SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", 4))  # threads searching shards in parallel
+
+    # Index build: page chunking (in tokens) and batched embedding
+    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 384))
+    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 64))
+    CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", 64))
+    EMBED_BUILD_BATCH_SIZE = int(os.getenv("EMBED_BUILD_BATCH_SIZE", 32))
+    EMBED_THREADS = int(os.getenv("EMBED_THREADS", 0))  # intra-op CPU threads, 0 keeps the runtime's default
+
+    # Embedding model and backend ("torch", "torch-int8", "onnx" or "openvino"; the last two need the optional
+    # sentence-transformers[onnx] or [openvino] extras). Each index shard records the model that built it,
+    # and shards built with another EMBED_MODEL are rebuilt at load.
+    EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-large-en-v1.5")
+    EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+    EMBED_MODEL_FILE = os.getenv("EMBED_MODEL_FILE") or None  # e.g. onnx/model_qint8_avx512.onnx
+
+    # research_wrapper stage timeouts in seconds; a stage that runs over contributes nothing
+    RESEARCH_REPHRASE_TIMEOUT = float(os.getenv("RESEARCH_REPHRASE_TIMEOUT", 3))
+    RESEARCH_SEARCH_TIMEOUT = float(os.getenv("RESEARCH_SEARCH_TIMEOUT", 6))
+    RESEARCH_RETRIEVAL_TIMEOUT = float(os.getenv("RESEARCH_RETRIEVAL_TIMEOUT", 5))
+
+    # Web search result cache; set SEARCH_CACHE_PATH empty to keep it in memory only
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 512))
+    SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", 21600))
+    SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", os.path.join(base_dir, "app", "search_cache.json"))
+
+    # Chat models in fallback order; each has a circuit breaker over its last calls
+    CHAT_MODELS = [model.strip() for model in os.getenv("CHAT_MODELS", "gpt-4.1-mini,gpt-5-mini").split(",") if model.strip()]
+    MODEL_HEDGE_AFTER_SECONDS = float(os.getenv("MODEL_HEDGE_AFTER_SECONDS", 0))  # time to first token before hedging, 0 disables
+    BREAKER_WINDOW_SIZE = int(os.getenv("BREAKER_WINDOW_SIZE", 20))
+    BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 5))
+    BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", 0.5))
+    BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 8))
+    BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", 30))
+
+    # Prompt caching: completions share a cache routing key and their streams report token usage, cached tokens included
+    PROMPT_CACHE_KEY = os.getenv("PROMPT_CACHE_KEY", "fleetops-assistant")  # empty disables
+    STREAM_USAGE = os.getenv("STREAM_USAGE", "true").lower() == "true"
+
+    # Shared upstream HTTP connection pools; the base URLs can point at local fakes
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    SERP_API_BASE_URL = os.getenv("SERP_API_BASE_URL", "https://serpapi.com")
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 10))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 60))
+    HTTP_WARM_CONNECTIONS = int(os.getenv("HTTP_WARM_CONNECTIONS", 2))  # per upstream at startup, 0 disables
+
+    # Multi-worker mode: WEB_WORKERS uvicorn processes share rate limits, sessions and the web
+    # search cache through one SQLite file, and a single retrieval server process holds the index
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", 1))
+    SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "sqlite" if WEB_WORKERS > 1 else "memory")
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "fleetops-state.sqlite3"))
+    SHARED_INDEX = os.getenv("SHARED_INDEX", str(WEB_WORKERS > 1)).lower() == "true"
+    RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET", os.path.join(tempfile.gettempdir(), "fleetops-retrieval.sock"))
+
+    # SSE framing: model deltas are coalesced until the interval passes or the byte size is reached
+    SSE_FLUSH_INTERVAL_MS = float(os.getenv("SSE_FLUSH_INTERVAL_MS", 50))  # 0 writes every delta at once
+    SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", 512))
+    SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", 64))  # events buffered ahead of a slow client
+    SSE_DISCONNECT_POLL_SECONDS = float(os.getenv("SSE_DISCONNECT_POLL_SECONDS", 0.5))
+
+    # Admission control for /api/fleetAssistant, per worker: requests beyond the concurrency limit
+    # queue (short questions ahead of research turns) and get a 503 when the queue is full or too slow
+    ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 16))  # 0 disables
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 32))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 10))
+    ADMISSION_SHORT_QUESTION_TOKENS = int(os.getenv("ADMISSION_SHORT_QUESTION_TOKENS", 32))
+
+    # Batch question API: questions per request, completions run at once, and requests per client
+    BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 500))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+    # Seconds a batch question keeps retrying admission before it is reported busy
+    BATCH_ADMISSION_TIMEOUT = float(os.getenv("BATCH_ADMISSION_TIMEOUT", 120))
+    BATCH_RATE_LIMIT = os.getenv("BATCH_RATE_LIMIT", "5/minute")
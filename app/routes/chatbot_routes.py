@@ -1,4 +1,7 @@
 # app/routes/chatbot_routes.py
+import asyncio
+import json
+import time
 from fastapi import Request
 from fastapi.routing import APIRouter
 from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
@@ -6,62 +9,122 @@ from slowapi.errors import RateLimitExceeded
 from starlette.status import HTTP_429_TOO_MANY_REQUESTS
 from app import limiter, logger
 from pydantic import ValidationError
-from app.services.schemas import ChatRequest
+from app.services.schemas import ChatRequest, BatchRequest
+from app.services.query_cache import normalize_query
+from app.services.retrieval_executor import RetrievalQueueFull
+from app.services.research_service import ResearchPipeline
+from app.services.startup import IndexNotReady
+from app.services.metrics import registry, RATE_LIMITED, SSE_STREAM_SECONDS
+from app.services.memory_profiler import MemoryProfiler
+from app.services.sse import SSEStream
+from app.services.admission import AdmissionController, AdmissionRejected, classify_priority, BATCH
+from app.config import Config
 
 chatbot_bp = APIRouter()
 
 
 def _rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    RATE_LIMITED.inc(path=request.url.path)
     return PlainTextResponse("Rate limit exceeded", status_code=HTTP_429_TOO_MANY_REQUESTS)
 
 
-def init_chatbot_routes(app, chatbot_service, db_service, web_search_service):
+class _AdmittedStreamingResponse(StreamingResponse):
+    """Releases the admission slot however the response ends, even if the stream never started."""
+
+    def __init__(self, content, ticket, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
 
-    def research_wrapper(question: str) -> str:
+    async def __call__(self, scope, receive, send):
         try:
-            logger.info(f"Starting web search for: {question}")
-            rephrased_query = web_search_service.rephrase_query(question, chatbot_service.chat_history)
-            logger.info(f"Rephrased query: {rephrased_query}")
-            context_chunks = db_service.get_corpus_data(question)
-            web_context = web_search_service.do_web_search(rephrased_query)
-            logger.info(f"Web search completed, found {len(web_context.split('Title:')) - 1} results")
-            # Combine web context and context chunks into a list
-            combined_context = [web_context] + context_chunks
-            chatbot_service.sent_tokens = combined_context
-            chatbot_service.update_system_message()
-            return web_context + "\n".join(context_chunks)
-        except Exception as e:
-            logger.error(f"Error in research_wrapper: {e}")
-            # Fallback to just context chunks
-            context_chunks = db_service.get_corpus_data(question)
-            chatbot_service.sent_tokens = context_chunks
-            chatbot_service.update_system_message()
-            return "\n".join(context_chunks)
-        
-        
-    
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+
+def init_chatbot_routes(app, chatbot_service, db_service, web_search_service):
+
+    memory_profiler = MemoryProfiler()
+    admission = AdmissionController(
+        max_concurrent=Config.ADMISSION_MAX_CONCURRENT,
+        max_queue=Config.ADMISSION_MAX_QUEUE,
+        queue_timeout=Config.ADMISSION_QUEUE_TIMEOUT
+    )
+    research_pipeline = ResearchPipeline(
+        db_service, web_search_service,
+        rephrase_timeout=Config.RESEARCH_REPHRASE_TIMEOUT,
+        search_timeout=Config.RESEARCH_SEARCH_TIMEOUT,
+        retrieval_timeout=Config.RESEARCH_RETRIEVAL_TIMEOUT
+    )
+
+    async def research_wrapper(question: str, session) -> tuple[str, list, dict]:
+        logger.info(f"Starting web search for: {question}")
+        # Corpus retrieval runs alongside rephrase -> search; slow stages contribute nothing
+        context_chunks, web_results, timings = await research_pipeline.research(question, session.chat_history)
+        # Compress corpus chunks and web results together, then pack them into the context budget by relevance
+        packed, context_stats = chatbot_service.pack_context(context_chunks, web_results, query=question,
+                                                             session=session)
+        context_stats["research_timings"] = timings
+        # The packed context is in the system message; repeating it in the function message doubled the prompt
+        return (f"Research found {len(context_chunks)} corpus passages and {len(web_results)} web results; "
+                f"the relevant parts are now in the CONTEXT section.", packed, context_stats)
+
     chatbot_service.set_function("research_wrapper", research_wrapper)
 
     @chatbot_bp.post('/api/fleetAssistant', response_class=StreamingResponse)
     @limiter.limit("5/minute")
     async def get_bot_response(request: Request):
+        ticket = None
         try:
 
             data = await request.json()
 
             validated = ChatRequest(**data)
             question = validated.question
+            # Held from retrieval until the event stream ends
+            ticket = await admission.acquire(classify_priority(
+                question, validated.research_mode, Config.ADMISSION_SHORT_QUESTION_TOKENS))
+            session = chatbot_service.sessions.get_or_create(validated.session_id)
+
+            try:
+                context_chunks = await db_service.aget_corpus_data(question)
+            except asyncio.TimeoutError:
+                logger.warning(f"Corpus retrieval timed out for: {question}")
+                context_chunks = []
+            context = chatbot_service.pack_context(context_chunks, query=question, session=session)
 
-            context_chunks = db_service.get_corpus_data(question)
-            chatbot_service.sent_tokens = context_chunks  # Keep as list
-            chatbot_service.update_system_message()
+            # Deltas are coalesced into frames; a disconnect cancels the model stream
+            frames = SSEStream(
+                chatbot_service.generate_response(question, session, context),
+                request=request,
+                flush_interval=Config.SSE_FLUSH_INTERVAL_MS / 1000,
+                flush_bytes=Config.SSE_FLUSH_BYTES,
+                queue_size=Config.SSE_QUEUE_SIZE,
+                disconnect_poll=Config.SSE_DISCONNECT_POLL_SECONDS
+            )
 
             async def event_stream():
-                async for chunk in chatbot_service.generate_response(question):
-                    yield chunk
+                with SSE_STREAM_SECONDS.time():
+                    async for frame in frames:
+                        yield frame
 
-            return StreamingResponse(event_stream(), media_type='text/event-stream')
+            response = _AdmittedStreamingResponse(event_stream(), ticket, media_type='text/event-stream',
+                                                  headers={"X-Session-Id": session.session_id})
+            ticket = None  # released by the response from here on
+            return response
 
+        except AdmissionRejected as ar:
+            logger.warning(f"{ar} (retry after {ar.retry_after}s)")
+            return JSONResponse(content={"error": "The assistant is busy. Please try again shortly."},
+                                status_code=503, headers={"Retry-After": str(ar.retry_after)})
+        except IndexNotReady as nr:
+            logger.warning(f"Request before the index finished loading: {nr}")
+            return JSONResponse(content={"error": "The assistant is starting up. Please try again shortly."},
+                                status_code=503, headers={"Retry-After": "5"})
+        except RetrievalQueueFull as qf:
+            logger.warning(f"Retrieval queue full: {qf}")
+            return JSONResponse(content={"error": "The assistant is busy. Please try again shortly."},
+                                status_code=503, headers={"Retry-After": "1"})
         except ValidationError as ve:
             return JSONResponse(content={"error": ve.errors()}, status_code=400)
         except KeyError as ke:
@@ -74,12 +137,130 @@ def init_chatbot_routes(app, chatbot_service, db_service, web_search_service):
             logger.exception("Unexpected error:")
             return JSONResponse(content={"error": "An unexpected error occurred. Please try again later."},
                                 status_code=500)
+        finally:
+            if ticket is not None:
+                ticket.release()
 
-    # Health check endpoint for Render
+    @chatbot_bp.post('/api/fleetAssistant/batch', response_class=StreamingResponse)
+    @limiter.limit(Config.BATCH_RATE_LIMIT)
+    async def get_batch_responses(request: Request):
+        try:
+            validated = BatchRequest(**(await request.json()))
+            # Repeated questions are retrieved and answered once; each result lists the positions it answers
+            positions = {}
+            for position, question in enumerate(validated.questions):
+                positions.setdefault(normalize_query(question), []).append(position)
+            questions = [validated.questions[indices[0]] for indices in positions.values()]
+            # One embedding batch and one vectorized search for the whole request
+            context_chunks = await db_service.aget_corpus_data_batch(questions, validated.top_k)
+        except IndexNotReady as nr:
+            logger.warning(f"Batch request before the index finished loading: {nr}")
+            return JSONResponse(content={"error": "The assistant is starting up. Please try again shortly."},
+                                status_code=503, headers={"Retry-After": "5"})
+        except RetrievalQueueFull as qf:
+            logger.warning(f"Retrieval queue full: {qf}")
+            return JSONResponse(content={"error": "The assistant is busy. Please try again shortly."},
+                                status_code=503, headers={"Retry-After": "1"})
+        except ValidationError as ve:
+            return JSONResponse(content={"error": ve.errors()}, status_code=400)
+        except ValueError as ve:
+            logger.error(f"ValueError: {ve}")
+            return JSONResponse(content={"error": f"Invalid data: {str(ve)}"}, status_code=400)
+        except Exception:
+            logger.exception("Unexpected error:")
+            return JSONResponse(content={"error": "An unexpected error occurred. Please try again later."},
+                                status_code=500)
+
+        async def answer_one(semaphore, question: str, indices: list, chunks: list) -> dict:
+            async with semaphore:
+                # Batch completions queue behind interactive traffic and wait out a full queue, up to a deadline
+                deadline = time.monotonic() + Config.BATCH_ADMISSION_TIMEOUT
+                while True:
+                    try:
+                        ticket = await admission.acquire(BATCH)
+                        break
+                    except AdmissionRejected as ar:
+                        if time.monotonic() + ar.retry_after > deadline:
+                            logger.warning(f"Batch question not admitted in {Config.BATCH_ADMISSION_TIMEOUT}s: {ar}")
+                            return {"question": question, "indices": indices, "error": "busy"}
+                        await asyncio.sleep(ar.retry_after)
+                try:
+                    result = await chatbot_service.answer(question, chunks)
+                except Exception as e:
+                    logger.error(f"Batch answer failed for {question!r}: {e}", exc_info=True)
+                    result = {"error": "An error occurred while answering this question."}
+                finally:
+                    ticket.release()
+            return {"question": question, "indices": indices, **result}
+
+        async def ndjson_stream():
+            semaphore = asyncio.Semaphore(Config.BATCH_CONCURRENCY)
+            tasks = [asyncio.ensure_future(answer_one(semaphore, question, indices, chunks))
+                     for question, indices, chunks in zip(questions, positions.values(), context_chunks)]
+            try:
+                # Results are written as they complete, not in request order
+                for next_result in asyncio.as_completed(tasks):
+                    yield json.dumps(await next_result, ensure_ascii=False) + "\n"
+                yield json.dumps({"done": True, "questions": len(validated.questions),
+                                  "answered": len(questions)}) + "\n"
+            finally:
+                # The client went away; stop the remaining completions
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+    @app.get("/api/retrievalStats")
+    async def retrieval_stats():
+        # From the retrieval server when the index is shared between workers
+        stats = await db_service.aretrieval_stats()
+        if web_search_service.search_cache is not None:
+            stats["web_search"] = web_search_service.search_cache.stats()
+        stats["http"] = web_search_service.http_clients.stats()
+        return stats
+
+    @app.get("/api/admissionStats")
+    async def admission_stats():
+        return admission.stats()
+
+    @app.get("/api/modelStats")
+    async def model_stats():
+        return chatbot_service.model_stats()
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    # On-demand tracemalloc sessions: start, inspect the top allocation sites, stop
+    @app.post("/api/memoryProfile/start")
+    async def memory_profile_start(frames: int = 1):
+        if not Config.MEMORY_PROFILING:
+            return JSONResponse(content={"error": "Memory profiling is disabled"}, status_code=404)
+        return memory_profiler.start(frames)
+
+    @app.get("/api/memoryProfile")
+    async def memory_profile(top: int = 25, growth: bool = False):
+        if not Config.MEMORY_PROFILING:
+            return JSONResponse(content={"error": "Memory profiling is disabled"}, status_code=404)
+        return await asyncio.to_thread(memory_profiler.snapshot, top, growth)
+
+    @app.post("/api/memoryProfile/stop")
+    async def memory_profile_stop():
+        if not Config.MEMORY_PROFILING:
+            return JSONResponse(content={"error": "Memory profiling is disabled"}, status_code=404)
+        return memory_profiler.stop()
+
+    # Health check endpoint for Render; liveness only, it never waits for the index
     @app.get("/")
     async def health_check():
         return {"status": "healthy", "message": "FleetOps API is running"}
 
+    # Readiness: 200 once the embedding model and index are loaded, with startup phase timings
+    @app.get("/ready")
+    async def readiness_check():
+        status = db_service.status()
+        return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+
     app.include_router(chatbot_bp)
     app.state.limiter = limiter
     app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
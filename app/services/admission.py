@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+import math
+import re
+import time
+from app import logger
+from app.services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS, ADMISSION_REJECTIONS
+from app.services.tokens import count_tokens
+
+# Queue priorities, lower is served first
+INTERACTIVE = 0
+RESEARCH = 1
+BATCH = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", RESEARCH: "research", BATCH: "batch"}
+
+# The words the system prompt tells the model to treat as a web search request
+RESEARCH_TRIGGERS = re.compile(r"\b(search|find|look\s*up|check|investigate|explore|compan(y|ies)|competitors?)\b",
+                               re.IGNORECASE)
+
+
+def classify_priority(question: str, research_mode: bool = False, short_question_tokens: int = 32) -> int:
+    """Short questions unlikely to trigger research_wrapper go ahead of research turns."""
+    if research_mode or RESEARCH_TRIGGERS.search(question):
+        return RESEARCH
+    return INTERACTIVE if count_tokens(question) <= short_question_tokens else RESEARCH
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; retry_after is a hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request not admitted: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """An admission slot; release() is idempotent so every exit path can call it."""
+
+    def __init__(self, controller: "AdmissionController", priority: int, waited: float):
+        self.controller = controller
+        self.priority = priority
+        self.waited = waited
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.controller._release(time.monotonic() - self.admitted_at)
+
+
+class AdmissionController:
+    """
+    Global cap on assistant requests in flight in this process.
+
+    A request holds its slot from retrieval until its event stream ends, so
+    the cap bounds concurrent model streams together with the embedding and
+    SerpAPI work they start. Requests beyond max_concurrent wait in a queue
+    ordered by priority, then arrival; when max_queue are already waiting, or
+    a request waits longer than queue_timeout, it is rejected with a
+    Retry-After estimated from recent slot hold times.
+    """
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 32, queue_timeout: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._avg_hold = 5.0  # seconds, exponentially weighted
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    @property
+    def waiting(self) -> int:
+        # The heap may still hold futures of waiters that gave up; they are skipped on release
+        return sum(self._queued.values())
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_hold * (self.waiting + 1) / max(self.max_concurrent, 1)))
+
+    def _update_gauges(self) -> None:
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+        for priority, name in PRIORITY_NAMES.items():
+            ADMISSION_QUEUE_DEPTH.set(self._queued[priority], priority=name)
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        return AdmissionRejected(reason, self.retry_after())
+
+    def _admit(self, priority: int, waited: float) -> AdmissionTicket:
+        self.admitted += 1
+        ADMISSION_WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES[priority])
+        self._update_gauges()
+        return AdmissionTicket(self, priority, waited)
+
+    async def acquire(self, priority: int = INTERACTIVE) -> AdmissionTicket:
+        if not self.enabled or (self.in_flight < self.max_concurrent and not self.waiting):
+            self.in_flight += 1
+            return self._admit(priority, 0.0)
+        if self.waiting >= self.max_queue:
+            raise self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._queued[priority] += 1
+        self._update_gauges()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._queued[priority] -= 1
+                self._update_gauges()
+                logger.warning(f"Request waited {self.queue_timeout}s for admission")
+                raise self._reject("timeout")
+            # The slot was handed over just as the wait ended
+        except asyncio.CancelledError:
+            if future.done():
+                self._release(None)
+            else:
+                future.cancel()
+                self._queued[priority] -= 1
+                self._update_gauges()
+            raise
+        return self._admit(priority, time.monotonic() - started)
+
+    def _release(self, held: float | None) -> None:
+        if held is not None:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        # Hand the slot straight to the next live waiter rather than freeing it
+        while self._waiters:
+            priority, _, future = heapq.heappop(self._waiters)
+            if not future.cancelled():
+                self._queued[priority] -= 1
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self.in_flight -= 1
+        self._update_gauges()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "queued": {PRIORITY_NAMES[priority]: count for priority, count in self._queued.items()},
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_hold_seconds": round(self._avg_hold, 3),
+            "retry_after_seconds": self.retry_after(),
+        }
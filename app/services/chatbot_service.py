@@ -1,26 +1,117 @@
 import json
 import logging
+import httpx
 import openai
 from openai.types.chat import ChatCompletionChunk
 from app import logger
 import asyncio
+import inspect
 from typing import Optional, AsyncGenerator 
 from typing import Callable
 from io import StringIO
-import os
+import time
+import uuid
+from app.config import Config
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpen
+from app.services.metrics import (MODEL_TTFT_SECONDS, MODEL_TOKENS_PER_SECOND, MODEL_RETRIES, MODEL_FALLBACKS,
+                                  CIRCUIT_REJECTIONS, CONTEXT_COMPRESSION_RATIO, CONTEXT_COMPRESSION_SECONDS,
+                                  MODEL_PROMPT_TOKENS, MODEL_CACHED_PROMPT_TOKENS)
+from app.services.session_store import ChatSession, SessionStore
+from app.services.context_packer import ContextPacker
+from app.services.context_compressor import ContextCompressor
+
+# The instructions are identical for every request so the provider can cache them as a prompt prefix;
+# per-request context goes in a later message (see ChatbotService.build_messages)
+SYSTEM_PREFIX = """\
+ROLE & PURPOSE
+You are a professional, helpful AI assistant who communicates with clarity, precision, and empathy. Your goal is to deliver structured, visually clear, and engaging answers.
+
+FUNCTION CALLING
+You can call the `research_wrapper` tool for **company information** or detailed background data. Trigger it when the user:
+- Asks about companies, products, services, or topics not in your internal knowledge
+- Uses trigger words: “search”, “find”, “look up”, “check”, “investigate”, “explore”
+- Requests information that requires web search or external data retrieval.
+
+CONTEXT USAGE
+- You will receive the chat history, then the users conversation context in a CONTEXT message.
+- Always use them internally to understand the user’s needs.
+- Never mention, quote, or hint that they exist.
+- Rephrase or summarize relevant details naturally into your answer without revealing their source.
+
+OUTPUT STRUCTURE
+Every answer must be visually rich, easy to scan, and engaging:
+1. **Main Answer** — Use bold, italics, bullet points, numbered lists, and emojis.
+2. **Steps or Process** — Present in ordered lists when explaining actions.
+3. **Tables** — Use valid Markdown table syntax (header + separator row).
+4. **Code or Formulas** — Wrap in triple backticks (```) with language tag. Keep formulas on a single line.
+5. **Related Questions** — End with 2–3 natural, relevant next questions (never label them as “follow-ups”).
+
+STRICT RULES
+- Always answer using the provided context & history; use outside knowledge only when calling `research_wrapper`.
+- Focus entirely on the query; keep responses free of references to yourself, your capabilities, or the system.
+- Format tables in Markdown or HTML, never using plain-text “pipes”.
+- When something is unclear, ask a concise and polite clarifying question.
+- For sensitive data, respond respectfully and decline to proceed if it cannot be shared.
+
+STYLE & TONE
+- Warm and approachable greeting if the user greets you
+- Calm and supportive for confusion/frustration
+- Concise and energetic for curiosity
+- Empathetic and insightful at all times
+- Stay entirely on the user’s task
+"""
+
 
 class ChatbotService:
-    def __init__(self, openai_api_key: str):
-        self.client = openai.AsyncOpenAI(api_key=openai_api_key)
-        self.response_buffer = StringIO()
-        self.argument_buffer = StringIO()
-        self.directory = "app/source_files/"
-        self.json_files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.json')]
-        self.sent_tokens = []
-        self.chat_history = []
+    def __init__(self, openai_api_key: str, http_client: httpx.AsyncClient | None = None,
+                 sessions: SessionStore | None = None):
+        self.client = openai.AsyncOpenAI(api_key=openai_api_key, base_url=Config.OPENAI_BASE_URL,
+                                         http_client=http_client)
+        if sessions is None:
+            sessions = SessionStore(
+                max_sessions=Config.SESSION_MAX_COUNT,
+                ttl_seconds=Config.SESSION_TTL_SECONDS,
+                token_budget=Config.SESSION_TOKEN_BUDGET,
+                max_bytes=Config.SESSION_MAX_BYTES
+            )
+        self.sessions = sessions
+        self.context_packer = ContextPacker(
+            token_budget=Config.CONTEXT_TOKEN_BUDGET,
+            min_chunk_tokens=Config.CONTEXT_MIN_CHUNK_TOKENS
+        )
+        self.context_compressor = None
+        if Config.CONTEXT_COMPRESSION:
+            self.context_compressor = ContextCompressor(
+                duplicate_threshold=Config.CONTEXT_DUPLICATE_THRESHOLD,
+                keep_ratio=Config.CONTEXT_SENTENCE_KEEP_RATIO,
+                min_sentences=Config.CONTEXT_MIN_SENTENCES,
+                history_turns=Config.CONTEXT_HISTORY_TURNS,
+                min_coverage=Config.CONTEXT_MIN_QUERY_COVERAGE
+            )
         self.research_functions = {}
-        self.current_module_file = None
-        self.system_message = "System initializing."
+        # Models in fallback order, each behind its own circuit breaker
+        self.models = list(Config.CHAT_MODELS)
+        self.hedge_after = Config.MODEL_HEDGE_AFTER_SECONDS
+        # Cleanup of losing attempts runs in the background; the loop only keeps weak task references
+        self._cleanup_tasks = set()
+        # Prompt and cached prompt tokens per model, as reported by the API, to verify prompt cache hits
+        self.prompt_usage = {model: {"prompt_tokens": 0, "cached_tokens": 0, "completions": 0} for model in self.models}
+        self.request_options = {}
+        if Config.PROMPT_CACHE_KEY:
+            self.request_options["prompt_cache_key"] = Config.PROMPT_CACHE_KEY
+        if Config.STREAM_USAGE:
+            self.request_options["stream_options"] = {"include_usage": True}
+        self.breakers = {
+            model: CircuitBreaker(
+                model,
+                window_size=Config.BREAKER_WINDOW_SIZE,
+                min_calls=Config.BREAKER_MIN_CALLS,
+                failure_rate=Config.BREAKER_FAILURE_RATE,
+                slow_call_seconds=Config.BREAKER_SLOW_CALL_SECONDS,
+                cooldown_seconds=Config.BREAKER_COOLDOWN_SECONDS
+            )
+            for model in self.models
+        }
         self.fallback_responses = {
             'greeting': "Hello! I'm having trouble connecting to my main system, please try again later.",
             'help': "I'm currently operating in limited mode. Please try asking your question again in a few minutes.",
@@ -42,63 +133,49 @@ class ChatbotService:
                 }
             }
         ]
-        self.messages = [{"role": "system", "content": self.system_message}]
     
     def set_function(self, name: str, func: Callable):
         self.research_functions[name] = func
     
-    def update_system_message(self):
-        # Handle sent_tokens properly - ensure it's always a list
-        if isinstance(self.sent_tokens, list):
-            context_str = '\n\n'.join(self.sent_tokens)
-        else:
-            context_str = str(self.sent_tokens) if self.sent_tokens else ""
-    
-        self.system_message = f""" 
-        ROLE & PURPOSE  
-        You are a professional, helpful AI assistant who communicates with clarity, precision, and empathy. Your goal is to deliver structured, visually clear, and engaging answers. 
-        
-        FUNCTION CALLING  
-        You can call the `research_wrapper` tool for **company information** or detailed background data. Trigger it when the user: 
-        - Asks about companies, products, services, or topics not in your internal knowledge  
-        - Uses trigger words: “search”, “find”, “look up”, “check”, “investigate”, “explore”  
-        - Requests information that requires web search or external data retrieval.
-
-        CONTEXT USAGE  
-        - You will receive the users conversation context and chat history.  
-        - Always use them internally to understand the user’s needs.  
-        - Never mention, quote, or hint that they exist.  
-        - Rephrase or summarize relevant details naturally into your answer without revealing their source.
-
-        '''
-        CONTEXT
-        {context_str}
-        '''
-
-        OUTPUT STRUCTURE  
-        Every answer must be visually rich, easy to scan, and engaging:  
-        1. **Main Answer** — Use bold, italics, bullet points, numbered lists, and emojis.  
-        2. **Steps or Process** — Present in ordered lists when explaining actions.  
-        3. **Tables** — Use valid Markdown table syntax (header + separator row).  
-        4. **Code or Formulas** — Wrap in triple backticks (```) with language tag. Keep formulas on a single line.  
-        5. **Related Questions** — End with 2–3 natural, relevant next questions (never label them as “follow-ups”).  
-
-        STRICT RULES  
-        - Always answer using the provided context & history; use outside knowledge only when calling `research_wrapper`.  
-        - Focus entirely on the query; keep responses free of references to yourself, your capabilities, or the system.  
-        - Format tables in Markdown or HTML, never using plain-text “pipes”.  
-        - When something is unclear, ask a concise and polite clarifying question.  
-        - For sensitive data, respond respectfully and decline to proceed if it cannot be shared.
-
-        
-        STYLE & TONE  
-        - Warm and approachable greeting if the user greets you  
-        - Calm and supportive for confusion/frustration  
-        - Concise and energetic for curiosity  
-        - Empathetic and insightful at all times  
-        - Stay entirely on the user’s task
+    def pack_context(self, *sources: list, query: str | None = None,
+                     session: ChatSession | None = None) -> tuple[list, dict]:
+        """
+        Pack ranked context sources into the token budget for the CONTEXT
+        message. Returns the packed chunks and the packing stats; they belong
+        to the one request, never to the session, which concurrent requests share.
+        Given the query, the sources are compressed to what is relevant to it,
+        and to the session's earlier questions, first.
         """
-        self.messages[0] = {"role": "system", "content": self.system_message}
+        compression = None
+        if query and self.context_compressor is not None:
+            history = [turn['user'] for turn in session.chat_history] if session is not None else None
+            sources, compression = self.context_compressor.compress(query, *sources, history=history)
+            CONTEXT_COMPRESSION_RATIO.observe(compression.ratio)
+            CONTEXT_COMPRESSION_SECONDS.observe(compression.seconds)
+        packed, stats = self.context_packer.pack(*sources)
+        context_stats = stats.to_dict()
+        if compression is not None:
+            context_stats["compression"] = compression.to_dict()
+        logger.info(f"Context packed: {context_stats}")
+        return packed, context_stats
+
+    @staticmethod
+    def context_message(packed: list) -> dict:
+        """The per-request CONTEXT message holding the packed context."""
+        return {"role": "system", "content": "CONTEXT\n'''\n" + "\n\n".join(packed) + "\n'''"}
+
+    def build_messages(self, session: ChatSession, query: str, packed: list) -> list:
+        """
+        Assemble the prompt as the static instructions, the session's bounded
+        history, the packed context and the new question. Everything before
+        the context is a stable prefix, so the provider's prompt cache can
+        reuse it across requests and across the turns of a conversation.
+        """
+        messages = [{"role": "system", "content": SYSTEM_PREFIX}]
+        messages.extend(session.history_messages())
+        messages.append(self.context_message(packed))
+        messages.append({"role": "user", "content": query})
+        return messages
 
     def get_fallback_response(self, query: str) -> str:
         """Provide fallback responses when OpenAI is down"""
@@ -112,79 +189,225 @@ class ChatbotService:
 
         return self.fallback_responses['default']
 
-    async def gpt_engine(self, max_retries=3, delay=2) -> Optional[AsyncGenerator[ChatCompletionChunk, None]]:
-        retries = 0
-        models = ["gpt-4.1-mini", "gpt-5-mini"]  # Model fallback mechanism
+    async def _open_stream(self, model: str, messages: list) -> tuple:
+        """
+        Start a completion stream on model and wait for its first chunk, so the
+        time to first token is what the model's breaker records.
+        Returns (first chunk or None, stream).
+        """
+        breaker = self.breakers[model]
+        started = time.perf_counter()
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                functions=self.functions,  # Add function calling capability
+                function_call="auto",  # Let GPT decide when to call a function
+                max_completion_tokens=1000,  # Increased max tokens for more detailed responses
+                temperature=0.3,
+                stream=True,
+                **self.request_options
+            )
+            try:
+                first_chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                first_chunk = None
+            except BaseException:
+                await stream.close()
+                raise
+        except asyncio.CancelledError:
+            # A cancelled hedge says nothing about the model's health
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        ttft = time.perf_counter() - started
+        breaker.record_success(ttft)
+        MODEL_TTFT_SECONDS.observe(ttft, model=model)
+        return first_chunk, stream
+
+    async def _attempt_model(self, model: str, messages: list, max_retries: int, delay: float) -> tuple:
+        """Open a stream on one model, retrying with linear backoff while its breaker allows calls."""
+        for attempt in range(max_retries + 1):
+            if not self.breakers[model].allow():
+                CIRCUIT_REJECTIONS.inc(model=model)
+                raise CircuitOpen(f"Circuit open for {model}")
+            try:
+                return await self._open_stream(model, messages)
+            except Exception as e:
+                logging.error(f"Error with {model}: {str(e)}")
+                if attempt == max_retries:
+                    raise
+                MODEL_RETRIES.inc(model=model)
+                await asyncio.sleep(delay * (attempt + 1))
 
-        for model in models:
-            while True:
-                try:
-                    response = await self.client.chat.completions.create(
-                        model=model,
-                        messages=self.messages,
-                        functions=self.functions,  # Add function calling capability
-                        function_call="auto",  # Let GPT decide when to call a function
-                        max_completion_tokens=1000,  # Increased max tokens for more detailed responses
-                        temperature=0.3,
-                        stream=True
-                    )
+    @staticmethod
+    def _cached_tokens(usage) -> int:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+
+    def _record_usage(self, model: str, usage) -> None:
+        cached = self._cached_tokens(usage)
+        totals = self.prompt_usage[model]
+        totals["prompt_tokens"] += usage.prompt_tokens
+        totals["cached_tokens"] += cached
+        totals["completions"] += 1
+        MODEL_PROMPT_TOKENS.inc(usage.prompt_tokens, model=model)
+        MODEL_CACHED_PROMPT_TOKENS.inc(cached, model=model)
+
+    async def _replay(self, model: str, first_chunk, stream) -> AsyncGenerator[ChatCompletionChunk, None]:
+        """Yield the stream from its first chunk on, recording the content streaming rate and token usage."""
+        started = time.perf_counter()
+        content_chunks = 0
+        try:
+            if first_chunk is not None:
+                if first_chunk.usage is not None:
+                    self._record_usage(model, first_chunk.usage)
+                yield first_chunk
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content_chunks += 1
+                # With include_usage the last chunk has no choices and carries the request's token usage
+                if chunk.usage is not None:
+                    self._record_usage(model, chunk.usage)
+                yield chunk
+        finally:
+            await stream.close()
+            elapsed = time.perf_counter() - started
+            if content_chunks and elapsed > 0:
+                MODEL_TOKENS_PER_SECOND.observe(content_chunks / elapsed, model=model)
+
+    @staticmethod
+    async def _discard(tasks) -> None:
+        """Cancel losing model attempts and close any stream one opened anyway."""
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, tuple):
+                await result[1].close()
+
+    async def gpt_engine(self, messages: list, max_retries=3, delay=2) -> Optional[AsyncGenerator[ChatCompletionChunk, None]]:
+        """
+        Stream a completion from the first healthy model in Config.CHAT_MODELS.
+
+        Models whose breaker is open are skipped, and a model that fails after
+        its retries hands over to the next one. With hedging enabled, the next
+        model is also started when the current one has produced no first
+        token within hedge_after seconds; whichever streams first is used and
+        the other attempt is cancelled. Returns None when every model failed.
+        """
+        remaining = list(self.models)
+        running = {}
+
+        def start_next():
+            model = remaining.pop(0)
+            running[asyncio.ensure_future(self._attempt_model(model, messages, max_retries, delay))] = model
+
+        start_next()
+        try:
+            while running:
+                timeout = self.hedge_after if self.hedge_after and remaining else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logging.warning(f"No first token within {self.hedge_after}s, hedging with {remaining[0]}")
+                    MODEL_FALLBACKS.inc(kind="hedge")
+                    start_next()
+                    continue
+                winner = None
+                for task in done:
+                    model = running.pop(task)
+                    if task.exception() is not None:
+                        logging.warning(f"{model} unavailable: {task.exception()}")
+                    elif winner is None:
+                        winner = (model, task.result())
+                    else:
+                        await task.result()[1].close()
+                if winner is not None:
+                    model, (first_chunk, stream) = winner
                     logging.info(f"Successfully used {model} for response")
-                    return response
-                except Exception as e:
-                    logging.error(f"Error with {model}: {str(e)}")
-                    if retries < max_retries:
-                        retries += 1
-                        await asyncio.sleep(delay * retries)
-                        continue
-                    # If all retries failed for this model, try the next model
-                    break
+                    if model != self.models[0]:
+                        MODEL_FALLBACKS.inc(kind="next_model")
+                    return self._replay(model, first_chunk, stream)
+                if remaining and not running:
+                    start_next()
+        finally:
+            if running:
+                cleanup = asyncio.ensure_future(self._discard(list(running)))
+                self._cleanup_tasks.add(cleanup)
+                cleanup.add_done_callback(self._cleanup_tasks.discard)
         # If all models failed, use fallback
         logger.warning("All GPT models failed, using fallback response")
+        MODEL_FALLBACKS.inc(kind="canned_response")
         return None
 
-    async def generate_response(self, query: str) -> AsyncGenerator[str, None]:
-        import app.routes.chatbot_routes as chatbot_routes 
-        """Generate a streaming response."""
+    def model_stats(self) -> dict:
+        return {
+            "hedge_after_seconds": self.hedge_after,
+            "models": [self.breakers[model].to_dict() for model in self.models],
+            "prompt_cache": {
+                model: {**usage, "hit_rate": round(usage["cached_tokens"] / usage["prompt_tokens"], 3)
+                        if usage["prompt_tokens"] else 0.0}
+                for model, usage in self.prompt_usage.items()
+            },
+        }
+
+    def _add_usage(self, totals: dict, usage) -> None:
+        totals["prompt_tokens"] += usage.prompt_tokens
+        totals["cached_tokens"] += self._cached_tokens(usage)
+        totals["completion_tokens"] += usage.completion_tokens
+
+    async def generate_response(self, query: str, session: ChatSession, context: tuple[list, dict],
+                                remember: bool = True) -> AsyncGenerator[dict, None]:
+        """
+        Generate a streaming response as events: {'content': delta} per model delta,
+        then {'end': True, ...} or {'error': ...}. SSEStream turns them into frames.
+        context is the (packed chunks, stats) pair from pack_context for this request.
+        The end event carries the token usage of the completions, cached prompt tokens included.
+        With remember=False the exchange is not added to the session's history.
+        """
+        stream = None
+        followup_stream = None
         try:
-            # Add user message to chat history
-            self.messages.append({"role": "user", "content": query})
+            # Only this session's bounded history goes into the prompt
+            packed, context_stats = context
+            messages = self.build_messages(session, query, packed)
 
             # Get the stream from gpt_engine
-            stream = await self.gpt_engine()
+            stream = await self.gpt_engine(messages)
             if stream is None:
-                fallback_text = self.get_fallback_response(query)
-                for chunk in fallback_text.splitlines():
-                    yield chunk
+                yield {'content': self.get_fallback_response(query)}
                 return
 
             function_call = None
-          
-            # Reset buffers for each new query - use fresh instances to prevent memory fragmentation
-            if hasattr(self, 'response_buffer'):
-                self.response_buffer.close()
-            if hasattr(self, 'argument_buffer'):
-                self.argument_buffer.close()
-            
-            self.response_buffer = StringIO()
-            self.argument_buffer = StringIO()
+            followup_response = ""
+            usage = {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+            # Buffers are per request so concurrent sessions never share them
+            response_buffer = StringIO()
+            argument_buffer = StringIO()
             
             async for chunk in stream:
+                if chunk.usage is not None:
+                    self._add_usage(usage, chunk.usage)
+                if not chunk.choices:
+                    continue
                 delta = chunk.choices[0].delta
                 if hasattr(delta, "function_call") and delta.function_call:
                     if delta.function_call.name:
                         function_call = delta.function_call.name
                     if delta.function_call.arguments:
-                        self.argument_buffer.write(delta.function_call.arguments)
+                        argument_buffer.write(delta.function_call.arguments)
                     continue
 
                 if hasattr(delta, "content") and delta.content:
                     content = delta.content
-                    self.response_buffer.write(content)
-                    yield f"data: {json.dumps({'content': content})}\n\n"
+                    response_buffer.write(content)
+                    yield {'content': content}
 
             # Get function arguments after the loop ends
-            function_args_str = self.argument_buffer.getvalue()
-            self.argument_buffer.close()
+            function_args_str = argument_buffer.getvalue()
+            argument_buffer.close()
 
             if function_call == "research_wrapper":
                 logging.info(f"Web search triggered for query: {query}")
@@ -203,72 +426,82 @@ class ChatbotService:
                 # Check if research_wrapper function exists
                 if "research_wrapper" not in self.research_functions:
                     logging.error("research_wrapper function not found")
-                    yield f"data: {json.dumps({'error': 'Research function not available'})}\n\n"
+                    yield {'error': 'Research function not available'}
                     return
                     
-                context = self.research_functions["research_wrapper"](question_arg)
-                self.messages.append({
+                research = self.research_functions["research_wrapper"](question_arg, session)
+                if inspect.isawaitable(research):
+                    research = await research
+                function_content, packed, context_stats = research
+                # Only the CONTEXT message changes, so the follow-up still shares the cached prefix
+                messages[-2] = self.context_message(packed)
+                messages.append({
                     "role": "function",
                     "name": function_call,
-                    "content": context if function_call == "research_wrapper" else ""
+                    "content": function_content if function_call == "research_wrapper" else ""
                 })
 
-                followup_stream = await self.gpt_engine()
+                followup_stream = await self.gpt_engine(messages)
                 
                 if followup_stream is None:
-                    yield f"data: {json.dumps({'error': 'Failed to generate followup response'})}\n\n"
+                    yield {'error': 'Failed to generate followup response'}
                     return
                 
                 # Use StringIO for followup stream too
                 followup_buffer = StringIO()
                 try:
                     async for chunk in followup_stream:
-                        if chunk.choices[0].delta.content:
+                        if chunk.usage is not None:
+                            self._add_usage(usage, chunk.usage)
+                        if chunk.choices and chunk.choices[0].delta.content:
                             content = chunk.choices[0].delta.content
                             followup_buffer.write(content)
-                            yield f"data: {json.dumps({'content': content})}\n\n"
+                            yield {'content': content}
                     
                     # Get the followup response
                     followup_response = followup_buffer.getvalue()
                 finally:
                     followup_buffer.close()
-                
-                # Combine with main response
-                full_response = self.response_buffer.getvalue() + followup_response
-
-            # Get the final response from the buffer
-            full_response = self.response_buffer.getvalue()
-            
-            # Handle sent_tokens properly - it could be a string or list
-            context_reference = ""
-            if self.sent_tokens:
-                if isinstance(self.sent_tokens, list):
-                    context_reference = "\n".join(self.sent_tokens)
-                else:
-                    context_reference = str(self.sent_tokens)
 
-            
-            self.response_buffer.write("\n\n")
-            self.response_buffer.write(context_reference)
-
-            assistant_message = self.response_buffer.getvalue()
-            self.response_buffer.close()
+            # Combine the main response with any followup after a function call
+            full_response = response_buffer.getvalue() + followup_response
+            response_buffer.close()
 
-            self.messages.append({"role": "assistant", "content": assistant_message})
-            self.add_to_history(user_message=query, bot_response=full_response)
+            if remember:
+                self.add_to_history(session, user_message=query, bot_response=full_response)
 
-            yield f"data: {json.dumps({'end': True})}\n\n"
+            yield {'end': True, 'context': context_stats, 'usage': usage}
 
         except Exception as e:
             logging.error(f"Error in generate_response: {e}", exc_info=True)
             error_message = f"An error occurred while processing your request. Please try again."
-            yield f"data: {json.dumps({'error': error_message})}\n\n"
-
-    def add_to_history(self, user_message: str, bot_response: str) -> None:
-        """Add a conversation exchange to the chat history."""
-        self.chat_history.append({
-            'user': user_message,
-            'bot': bot_response
-        })
+            yield {'error': error_message}
+        finally:
+            # Closed early when the client goes away; stop the completion now rather than at garbage collection
+            for open_stream in (stream, followup_stream):
+                if open_stream is not None:
+                    await open_stream.aclose()
+
+    async def answer(self, question: str, context_chunks: list) -> dict:
+        """
+        A complete answer to a stand-alone question, for the batch API. It runs
+        in a throwaway session, so nothing reaches the session store.
+        """
+        session = ChatSession(uuid.uuid4().hex, Config.SESSION_TOKEN_BUDGET)
+        context = self.pack_context(context_chunks, query=question)
+        parts = []
+        usage = None
+        async for event in self.generate_response(question, session, context, remember=False):
+            if 'content' in event:
+                parts.append(event['content'])
+            elif 'error' in event:
+                return {'error': event['error']}
+            elif 'end' in event:
+                usage = event['usage']
+        return {'answer': ''.join(parts), 'context': context[1], 'usage': usage}
+
+    def add_to_history(self, session: ChatSession, user_message: str, bot_response: str) -> None:
+        """Add a conversation exchange to the session's bounded chat history."""
+        self.sessions.add_turn(session, user_message, bot_response)
     
     
@@ -0,0 +1,141 @@
+import re
+import time
+from llama_index.core.schema import Document, MetadataMode, NodeRelationship, TextNode
+from app.services.tokens import count_tokens, truncate_to_tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class PageChunker:
+    """
+    Splits wiki page Documents into token-bounded TextNodes.
+
+    A page's text is cut into sections at line breaks, which html_to_text
+    puts after every heading and block element, and each section into sentences.
+    Sentences are packed into chunks of at most chunk_size tokens; a chunk is
+    closed early at a section boundary once it holds min_chunk_tokens, so
+    headings start new chunks, and the last chunk_overlap tokens of sentences
+    are carried into the next chunk of the same section. A page with no text
+    beyond its title (a module landing page, say) becomes a single node, so it
+    stays searchable by its title metadata. Every chunk keeps the page's id and
+    breadcrumb title metadata and points back to the page, so a page's chunks
+    can be replaced together.
+    """
+
+    def __init__(self, chunk_size: int = 384, chunk_overlap: int = 64, min_chunk_tokens: int = 64):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def _sentences(self, text: str) -> list:
+        """(sentence, tokens, starts_section) triples, with over-long sentences hard-split."""
+        sentences = []
+        for section in text.splitlines():
+            starts_section = True
+            for sentence in _SENTENCE_END.split(section.strip()):
+                if not sentence:
+                    continue
+                tokens = count_tokens(sentence)
+                while tokens > self.chunk_size:
+                    head = truncate_to_tokens(sentence, self.chunk_size)
+                    sentences.append((head, count_tokens(head), starts_section))
+                    starts_section = False
+                    sentence = sentence[len(head):].lstrip()
+                    tokens = count_tokens(sentence)
+                if sentence:
+                    sentences.append((sentence, tokens, starts_section))
+                    starts_section = False
+        return sentences
+
+    def split_text(self, text: str) -> list:
+        chunks = []
+        current = []
+        current_tokens = 0
+
+        for sentence, tokens, starts_section in self._sentences(text):
+            at_heading = starts_section and current_tokens >= self.min_chunk_tokens
+            if current and (at_heading or current_tokens + tokens > self.chunk_size):
+                chunks.append(" ".join(s for s, _ in current))
+                if at_heading:
+                    current, current_tokens = [], 0
+                else:
+                    # Carry trailing sentences of this section into the next chunk
+                    overlap = []
+                    overlap_tokens = 0
+                    for s, t in reversed(current):
+                        if overlap_tokens + t > self.chunk_overlap or overlap_tokens + t + tokens > self.chunk_size:
+                            break
+                        overlap.insert(0, (s, t))
+                        overlap_tokens += t
+                    current, current_tokens = overlap, overlap_tokens
+            current.append((sentence, tokens))
+            current_tokens += tokens
+
+        if current:
+            chunks.append(" ".join(s for s, _ in current))
+        return chunks
+
+    def chunk_documents(self, documents: list[Document]) -> list[TextNode]:
+        nodes = []
+        for document in documents:
+            # Empty and title-only pages still get a node, embedded with their title
+            chunks = self.split_text(document.text) or [document.text.strip()]
+            for i, chunk in enumerate(chunks):
+                node = TextNode(
+                    id_=f"{document.doc_id}#{i}",
+                    text=chunk,
+                    metadata=dict(document.metadata)
+                )
+                node.relationships[NodeRelationship.SOURCE] = document.as_related_node_info()
+                nodes.append(node)
+        return nodes
+
+
+class EmbeddingReport:
+    """Progress and throughput of one batched embedding pass."""
+
+    def __init__(self, total_nodes: int, batch_size: int):
+        self.total_nodes = total_nodes
+        self.batch_size = batch_size
+        self.nodes = 0
+        self.batches = 0
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "nodes": self.nodes,
+            "total_nodes": self.total_nodes,
+            "batches": self.batches,
+            "batch_size": self.batch_size,
+            "tokens": self.tokens,
+            "seconds": round(self.seconds, 2),
+            "nodes_per_sec": round(self.nodes / self.seconds, 1) if self.seconds else 0.0,
+            "tokens_per_sec": round(self.tokens / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+
+def embed_nodes(embed_model, nodes: list[TextNode], batch_size: int = 32, progress=None) -> EmbeddingReport:
+    """
+    Embed nodes that have no embedding yet, batch_size texts per model call,
+    calling progress(report) after each batch. Texts include the embed
+    metadata (the breadcrumb title), exactly as VectorStoreIndex would send them.
+    """
+    pending = [node for node in nodes if node.embedding is None]
+    report = EmbeddingReport(len(pending), batch_size)
+    started = time.perf_counter()
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        for node, embedding in zip(batch, embed_model.get_text_embedding_batch(texts)):
+            node.embedding = embedding
+        report.batches += 1
+        report.nodes += len(batch)
+        report.tokens += sum(count_tokens(text) for text in texts)
+        report.seconds = time.perf_counter() - started
+        if progress is not None:
+            progress(report)
+    report.seconds = time.perf_counter() - started
+    return report
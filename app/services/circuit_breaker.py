@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpen(Exception):
+    """Raised when a model is skipped because its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Rolling error-rate and latency breaker for one upstream model.
+
+    The outcome of the last window_size calls is kept with its time to first
+    token. A call counts against the model when it fails or its first token
+    takes longer than slow_call_seconds. Once at least min_calls are recorded
+    and the share of bad calls reaches failure_rate, the breaker opens and the
+    model is skipped for cooldown_seconds. After that a single trial call is
+    let through (half open): success closes the breaker, failure reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, window_size: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_seconds: float = 8.0, cooldown_seconds: float = 30.0):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self._calls = deque(maxlen=window_size)  # (ok, seconds to first token or None)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.opened_count = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go to this model now; claims the trial call when half open."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, seconds: float) -> None:
+        with self._lock:
+            self._calls.append((seconds <= self.slow_call_seconds, seconds))
+            if self.state == self.HALF_OPEN:
+                self._close()
+            else:
+                self._evaluate()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._calls.append((False, None))
+            if self.state == self.HALF_OPEN:
+                self._open()
+            else:
+                self._evaluate()
+
+    def release(self) -> None:
+        """Give back a half-open trial that ended without an outcome, e.g. a cancelled hedge."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _evaluate(self) -> None:
+        if self.state == self.CLOSED and len(self._calls) >= self.min_calls:
+            bad = sum(1 for ok, _ in self._calls if not ok)
+            if bad / len(self._calls) >= self.failure_rate:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+        self.opened_count += 1
+
+    def _close(self) -> None:
+        self.state = self.CLOSED
+        self._calls.clear()
+        self._trial_in_flight = False
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            calls = len(self._calls)
+            errors = sum(1 for _, seconds in self._calls if seconds is None)
+            latencies = sorted(seconds for _, seconds in self._calls if seconds is not None)
+            slow = sum(1 for seconds in latencies if seconds > self.slow_call_seconds)
+            retry_in = 0.0
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.cooldown_seconds - (time.monotonic() - self._opened_at))
+            return {
+                "model": self.name,
+                "state": self.state,
+                "calls": calls,
+                "error_rate": round(errors / calls, 4) if calls else 0.0,
+                "slow_rate": round(slow / calls, 4) if calls else 0.0,
+                "ttft_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                "ttft_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+                "opened_count": self.opened_count,
+                "rejected": self.rejected,
+                "retry_in_seconds": round(retry_in, 1),
+            }
@@ -0,0 +1,182 @@
+import math
+import re
+import time
+from app.services.lexical_index import tokenize
+from app.services.tokens import count_tokens
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[*])")
+# Web results are "Title: ...\nSnippet: ...\nLink: ..."; only the snippet is compressed
+_HEADER_RE = re.compile(r"^\s*(Title|Link|Source|URL):", re.IGNORECASE)
+
+
+class CompressionStats:
+    """What one compression pass removed, and how long it took."""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.duplicate_passages = 0
+        self.passages_kept_whole = 0
+        self.sentences_kept = 0
+        self.sentences_dropped = 0
+        self.seconds = 0.0
+
+    @property
+    def ratio(self) -> float:
+        return self.output_tokens / self.input_tokens if self.input_tokens else 1.0
+
+    def to_dict(self) -> dict:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "ratio": round(self.ratio, 3),
+            "duplicate_passages": self.duplicate_passages,
+            "passages_kept_whole": self.passages_kept_whole,
+            "sentences_kept": self.sentences_kept,
+            "sentences_dropped": self.sentences_dropped,
+            "ms": round(self.seconds * 1000, 2),
+        }
+
+
+class ContextCompressor:
+    """
+    Shrinks retrieved passages before ContextPacker fits them into the prompt.
+
+    A passage whose word shingles are mostly contained in another passage,
+    from any source, is dropped as a near-duplicate. The rest are cut down to
+    their query-relevant sentences: a sentence scores the IDF-weighted query
+    terms it contains, IDF taken over all candidate sentences, and sentences
+    scoring at least keep_ratio of their passage's best are kept along with
+    the sentence following each. The min_sentences best always stay, and
+    kept sentences keep their order. Sources keep their shape and order so
+    the packer's rank fusion still applies.
+
+    Query terms include those of the last history_turns questions of the
+    conversation, at history_weight, so a follow-up such as "And then?" is
+    scored against what it follows up. A passage whose best sentence holds
+    less than min_coverage of the query's term weight is kept whole: dense
+    retrieval found it for its meaning (a paraphrase, say), which a word or
+    two in common cannot judge.
+    """
+
+    def __init__(self, duplicate_threshold: float = 0.8, keep_ratio: float = 0.3, min_sentences: int = 2,
+                 shingle_size: int = 3, history_turns: int = 2, history_weight: float = 0.5,
+                 min_coverage: float = 0.5):
+        self.duplicate_threshold = duplicate_threshold
+        self.keep_ratio = keep_ratio
+        self.min_sentences = min_sentences
+        self.shingle_size = shingle_size
+        self.history_turns = history_turns
+        self.history_weight = history_weight
+        self.min_coverage = min_coverage
+
+    def _shingles(self, passage: str) -> set:
+        text = "\n".join(line for line in passage.split("\n") if not _HEADER_RE.match(line))
+        words = tokenize(text)
+        if len(words) < self.shingle_size:
+            return {tuple(words)} if words else set()
+        return {tuple(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def _contained(self, shingles: set, other: set) -> bool:
+        return bool(shingles) and len(shingles & other) >= self.duplicate_threshold * len(shingles)
+
+    def _drop_duplicates(self, sources: list, stats: CompressionStats) -> list:
+        # Visit passages by rank across sources; of two near-identical passages the earlier one stays
+        order = [(s, rank) for rank in range(max((len(source) for source in sources), default=0))
+                 for s, source in enumerate(sources) if rank < len(source)]
+        shingles = {(s, rank): self._shingles(sources[s][rank]) for s, rank in order
+                    if sources[s][rank] and sources[s][rank].strip()}
+        for position, passage in enumerate(order):
+            if passage not in shingles:
+                continue
+            for other_position, other in enumerate(order):
+                if other == passage or other not in shingles:
+                    continue
+                # Mostly repeated by another passage: drop it unless that one is an exact-ish copy ranked lower
+                if self._contained(shingles[passage], shingles[other]) and (
+                        other_position < position or not self._contained(shingles[other], shingles[passage])):
+                    del shingles[passage]
+                    stats.duplicate_passages += 1
+                    break
+        return [[passage for rank, passage in enumerate(source) if (s, rank) in shingles]
+                for s, source in enumerate(sources)]
+
+    @staticmethod
+    def _split(passage: str) -> list:
+        """(line number, sentence or None for a header line, text) for every unit of the passage."""
+        units = []
+        for line_number, line in enumerate(passage.split("\n")):
+            if not line.strip():
+                continue
+            if _HEADER_RE.match(line):
+                units.append((line_number, None, line))
+            else:
+                units.extend((line_number, sentence, sentence) for sentence in _SENTENCE_RE.split(line.strip()))
+        return units
+
+    def _query_terms(self, query: str, history: list) -> dict:
+        """Term weights: 1 for the query's terms, history_weight for those only in recent questions."""
+        terms = {}
+        for question in (history[-self.history_turns:] if self.history_turns else []):
+            terms.update((term, self.history_weight) for term in tokenize(question))
+        terms.update((term, 1.0) for term in tokenize(query))
+        return terms
+
+    def _select(self, passage: str, units: list, query_terms: dict, idf: dict, min_score: float,
+                stats: CompressionStats) -> str:
+        sentences = [i for i, (_, sentence, _) in enumerate(units) if sentence is not None]
+        scores = {i: sum(idf.get(term, 0.0) * query_terms[term]
+                         for term in set(tokenize(units[i][1])) & query_terms.keys())
+                  for i in sentences}
+        best = max(scores.values(), default=0.0)
+        if best == 0 or best < min_score:
+            stats.passages_kept_whole += 1
+            stats.sentences_kept += len(sentences)
+            return passage
+        relevant = {i for i in sentences if scores[i] >= self.keep_ratio * best}
+        # The sentence after a relevant one is usually the step or detail it introduces
+        keep = relevant | {i + 1 for i in relevant if i + 1 in scores}
+        keep.update(sorted(sentences, key=lambda i: (-scores[i], i))[:self.min_sentences])
+        stats.sentences_kept += len(keep)
+        stats.sentences_dropped += len(sentences) - len(keep)
+
+        lines = {}
+        for i, (line_number, sentence, text) in enumerate(units):
+            if sentence is None or i in keep:
+                lines.setdefault(line_number, []).append(text)
+        return "\n".join(" ".join(parts) for _, parts in sorted(lines.items()))
+
+    def compress(self, query: str, *sources: list, history: list | None = None) -> tuple[list, CompressionStats]:
+        """
+        Return the compressed sources, in the order given, and the compression
+        stats. history holds the conversation's earlier questions, oldest first.
+        """
+        started = time.perf_counter()
+        stats = CompressionStats()
+        sources = [list(source or []) for source in sources]
+        stats.input_tokens = sum(count_tokens(passage) for source in sources for passage in source if passage)
+
+        sources = self._drop_duplicates(sources, stats)
+        query_terms = self._query_terms(query, history or [])
+        if query_terms:
+            units = [[self._split(passage) for passage in source] for source in sources]
+            document_frequency = {}
+            sentence_count = 0
+            for source in units:
+                for passage in source:
+                    for _, sentence, _ in passage:
+                        if sentence is None:
+                            continue
+                        sentence_count += 1
+                        for term in set(tokenize(sentence)) & query_terms.keys():
+                            document_frequency[term] = document_frequency.get(term, 0) + 1
+            # A term no candidate sentence contains weighs as much as the rarest one would
+            idf = {term: math.log(1 + sentence_count / document_frequency.get(term, 1)) for term in query_terms}
+            min_score = self.min_coverage * sum(idf[term] * weight for term, weight in query_terms.items())
+            sources = [[self._select(passage, passage_units, query_terms, idf, min_score, stats)
+                        for passage, passage_units in zip(source, source_units)]
+                       for source, source_units in zip(sources, units)]
+
+        stats.output_tokens = sum(count_tokens(passage) for source in sources for passage in source)
+        stats.seconds = time.perf_counter() - started
+        return sources, stats
@@ -0,0 +1,78 @@
+from app.services.tokens import count_tokens, truncate_to_tokens
+
+
+class PackStats:
+    """Token accounting for one packing pass."""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.packed_tokens = 0
+        self.dropped_tokens = 0
+        self.packed_chunks = 0
+        self.dropped_chunks = 0
+        self.truncated_chunks = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "budget": self.budget,
+            "packed_tokens": self.packed_tokens,
+            "dropped_tokens": self.dropped_tokens,
+            "packed_chunks": self.packed_chunks,
+            "dropped_chunks": self.dropped_chunks,
+            "truncated_chunks": self.truncated_chunks,
+        }
+
+
+class ContextPacker:
+    """
+    Fits ranked context chunks from one or more sources into a token budget.
+
+    Each source is a list of strings already ordered by relevance (retriever
+    results, web results, ...). Sources are merged with reciprocal rank fusion
+    so no single source can crowd out the others, then chunks are taken in
+    fused order until the budget is spent.
+    """
+
+    RRF_K = 60
+
+    def __init__(self, token_budget: int = 3000, min_chunk_tokens: int = 50):
+        self.token_budget = token_budget
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def rank(self, *sources: list) -> list:
+        scores = {}
+        for source in sources:
+            for rank, chunk in enumerate(source or []):
+                if not chunk or not chunk.strip():
+                    continue
+                scores[chunk] = scores.get(chunk, 0.0) + 1.0 / (self.RRF_K + rank + 1)
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def pack(self, *sources: list) -> tuple[list, PackStats]:
+        """Return the chunks that fit the budget, in relevance order, and the packing stats."""
+        stats = PackStats(self.token_budget)
+        packed = []
+        remaining = self.token_budget
+
+        for chunk in self.rank(*sources):
+            tokens = count_tokens(chunk)
+            if tokens <= remaining:
+                packed.append(chunk)
+                remaining -= tokens
+                stats.packed_tokens += tokens
+                stats.packed_chunks += 1
+            elif remaining >= self.min_chunk_tokens:
+                # Keep the head of a chunk that only partly fits rather than losing it entirely
+                truncated = truncate_to_tokens(chunk, remaining)
+                truncated_tokens = count_tokens(truncated)
+                packed.append(truncated)
+                remaining -= truncated_tokens
+                stats.packed_tokens += truncated_tokens
+                stats.dropped_tokens += tokens - truncated_tokens
+                stats.packed_chunks += 1
+                stats.truncated_chunks += 1
+            else:
+                stats.dropped_tokens += tokens
+                stats.dropped_chunks += 1
+
+        return packed, stats
@@ -1,12 +1,123 @@
+import argparse
 import json
+import time
 from bs4 import BeautifulSoup
-import pyodbc
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 import os 
 
+HTML_PARSERS = ("html.parser", "lxml", "selectolax")
+# Headings and block elements end a line of the text, so PageChunker can split pages into sections
+BLOCK_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6", "p", "div", "li", "tr", "table", "ul", "ol", "dl", "dt", "dd",
+              "blockquote", "pre", "section", "article", "header", "footer", "br", "hr")
+# Bumped whenever html_to_text output changes, so WikiIndexSync converts every page again
+TEXT_FORMAT = 2
+_BREAK = "\ue000"
+
+
+def _lines(text: str) -> str:
+    lines = (" ".join(part.split()) for part in text.split(_BREAK))
+    return "\n".join(line for line in lines if line)
+
+
+def html_to_text(html: str, parser: str = "html.parser") -> str:
+    """
+    Convert HTML content to plain text, dropping images. Each heading and
+    block element becomes its own line, with whitespace inside a line
+    collapsed. "lxml" and "selectolax" are faster optional backends;
+    "html.parser" needs nothing beyond BeautifulSoup.
+    """
+    if parser == "selectolax":
+        from selectolax.parser import HTMLParser
+        tree = HTMLParser(html)
+        for img in tree.css('img'):
+            img.decompose()
+        for block in tree.css(",".join(BLOCK_TAGS)):
+            block.insert_before(_BREAK)
+            block.insert_after(_BREAK)
+        root = tree.body or tree.root
+        return _lines(root.text(separator=' ', strip=True)) if root is not None else ""
+
+    soup = BeautifulSoup(html, parser)
+    for img in soup.find_all('img'):
+        img.decompose()
+    # A marker rather than "\n", which get_text(strip=True) would strip and source markup already contains
+    for block in soup.find_all(BLOCK_TAGS):
+        block.insert_before(_BREAK)
+        block.insert_after(_BREAK)
+    return _lines(soup.get_text(separator=' ', strip=True))
+
+
+def available_parser(parser: str) -> str:
+    """Return parser if its backend is installed, else fall back to html.parser."""
+    if parser not in HTML_PARSERS:
+        raise ValueError(f"Unknown HTML parser {parser!r}, expected one of {HTML_PARSERS}")
+    try:
+        if parser == "selectolax":
+            import selectolax.parser  # noqa: F401
+        elif parser == "lxml":
+            import lxml  # noqa: F401
+    except ImportError:
+        print(f"HTML parser {parser!r} is not installed, using html.parser")
+        return "html.parser"
+    return parser
+
+
+def convert_rows(rows: list, parser: str = "html.parser") -> list:
+    """Turn (WikiDocId, Title, ContentHtml, ParentId) tuples into pages. Runs in pool workers."""
+    pages = []
+    for wiki_doc_id, title, content_html, parent_id in rows:
+        plain_text = html_to_text(content_html or "", parser).replace('\u00a0', ' ')
+        pages.append({
+            "id": wiki_doc_id,
+            "title": title,
+            "content": plain_text + " ",
+            "parent_id": parent_id
+        })
+    return pages
+
+
+class IngestReport:
+    """Throughput of one streaming ingestion run."""
+
+    def __init__(self, parser: str, workers: int, batch_size: int):
+        self.parser = parser
+        self.workers = workers
+        self.batch_size = batch_size
+        self.rows = 0
+        self.batches = 0
+        self.html_bytes = 0
+        self.text_bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.html_bytes / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "parser": self.parser,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "rows": self.rows,
+            "batches": self.batches,
+            "html_mb": round(self.html_bytes / (1024 * 1024), 2),
+            "text_mb": round(self.text_bytes / (1024 * 1024), 2),
+            "seconds": round(self.seconds, 2),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+            "mb_per_sec": round(self.mb_per_sec, 2),
+        }
+
+
 class DatabaseService:
 
     def __init__(self):
+        # Imported here so the parser pool workers, which only convert HTML, do not need the ODBC driver
+        import pyodbc
         self.__conn = pyodbc.connect(
             "DRIVER={ODBC Driver 17 for SQL Server};"
             "SERVER=xxx;"
@@ -19,41 +130,165 @@ class DatabaseService:
         self.img_sources = []
         self.root_pages = []
         self.trees_by_module = defaultdict(list)
+        self.pages_by_id = {}
+        self.orphans = []
+        self.cycles = []
+        self.spool_path = None
+        self._spool = None
 
     def html_to_text(self, html: str) -> str:
         """Convert HTML content to plain text."""
-        soup = BeautifulSoup(html, "html.parser")
-        for img in soup.find_all('img'):
-            img.decompose()
-        return soup.get_text(separator=' ', strip=True)
+        return html_to_text(html)
+
+    def _row_to_page(self, row) -> dict:
+        content_html = row.ContentHtml if row.ContentHtml else ""
+        plain_text = self.html_to_text(content_html).replace('\u00a0', ' ')
+
+        full_text = plain_text + " "
+
+        return {
+            "id": row.WikiDocId,
+            "title": row.Title,
+            "content": full_text,
+            "parent_id": row.ParentId
+        }
 
     def database_fetch(self):
         self.cursor.execute("SELECT WikiDocId,Title,ContentHtml, ParentId FROM Wikidocs;")
 
         rows = self.cursor.fetchall()
         for row in rows:
-            wiki_doc_id = row.WikiDocId
-            title = row.Title
-            content_html = row.ContentHtml if row.ContentHtml else ""
-            parent_id = row.ParentId
-            plain_text = self.html_to_text(content_html).replace('\u00a0', ' ')
+            self.pages.append(self._row_to_page(row))
 
-            full_text = plain_text + " "
+        self.close()
 
-            self.pages.append({
-                "id": wiki_doc_id,
-                "title": title,
-                "content": full_text,
-                "parent_id": parent_id
-            })
+    def iter_rows(self, batch_size: int = 500):
+        """Yield Wikidocs rows as plain tuples in fetchmany batches, never the whole table."""
+        self.cursor.execute("SELECT WikiDocId,Title,ContentHtml, ParentId FROM Wikidocs;")
+        while True:
+            rows = self.cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [(row.WikiDocId, row.Title, row.ContentHtml, row.ParentId) for row in rows]
 
+    def stream_pages(self, batch_size: int = 500, workers: int | None = None,
+                     parser: str = "html.parser", report: IngestReport | None = None):
+        """
+        Yield converted pages in table order while the next batches are fetched
+        and parsed. HTML->text runs in a process pool of `workers` processes
+        (inline when workers is 0); at most two batches per worker are in
+        flight, so memory stays bounded by the batch size, not the table size.
+        """
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        report = report or IngestReport(parser, workers, batch_size)
+        started = time.perf_counter()
+
+        def account(batch: list) -> list:
+            report.batches += 1
+            report.rows += len(batch)
+            report.text_bytes += sum(len(page["content"].encode("utf-8")) for page in batch)
+            return batch
+
+        try:
+            if workers == 0:
+                for rows in self.iter_rows(batch_size):
+                    report.html_bytes += sum(len((row[2] or "").encode("utf-8")) for row in rows)
+                    yield from account(convert_rows(rows, parser))
+                return
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                in_flight = deque()
+                for rows in self.iter_rows(batch_size):
+                    report.html_bytes += sum(len((row[2] or "").encode("utf-8")) for row in rows)
+                    in_flight.append(executor.submit(convert_rows, rows, parser))
+                    if len(in_flight) >= workers * 2:
+                        yield from account(in_flight.popleft().result())
+                while in_flight:
+                    yield from account(in_flight.popleft().result())
+        finally:
+            report.seconds = time.perf_counter() - started
+
+    def database_fetch_streaming(self, spool_path: str, batch_size: int = 500,
+                                 workers: int | None = None, parser: str = "html.parser") -> IngestReport:
+        """
+        Streaming replacement for database_fetch. Page text is appended to a
+        JSON-lines spool file as it is parsed; self.pages only keeps ids, titles,
+        parents and spool offsets, and content is read back per page when the
+        trees are built.
+        """
+        parser = available_parser(parser)
+        report = IngestReport(parser, (os.cpu_count() or 1) if workers is None else workers, batch_size)
+        os.makedirs(os.path.dirname(spool_path) or ".", exist_ok=True)
+        with open(spool_path, "wb") as spool:
+            for page in self.stream_pages(batch_size, workers, parser, report):
+                offset = spool.tell()
+                spool.write(json.dumps(page["content"], ensure_ascii=False).encode("utf-8") + b"\n")
+                self.pages.append({
+                    "id": page["id"],
+                    "title": page["title"],
+                    "parent_id": page["parent_id"],
+                    "spool_offset": offset
+                })
+        self.spool_path = spool_path
+        self.close()
+        return report
+
+    def page_content(self, page: dict) -> str:
+        """A page's text, read back from the spool for pages fetched by database_fetch_streaming."""
+        if "content" in page:
+            return page["content"]
+        if "spool_offset" not in page:
+            return ""
+        if self._spool is None:
+            self._spool = open(self.spool_path, "rb")
+        self._spool.seek(page["spool_offset"])
+        return json.loads(self._spool.readline())
+
+    def fetch_page_hashes(self) -> dict:
+        """
+        Return {WikiDocId: {"hash", "title", "parent_id"}} for every page. The hash
+        is computed by SQL Server so unchanged page bodies never leave the database.
+        """
+        self.cursor.execute(
+            "SELECT WikiDocId, Title, ParentId, "
+            "CONVERT(VARCHAR(64), HASHBYTES('SHA2_256', CONCAT(Title, '|', ParentId, '|', ContentHtml)), 2) AS ContentHash "
+            "FROM Wikidocs;"
+        )
+        return {
+            row.WikiDocId: {"hash": row.ContentHash, "title": row.Title, "parent_id": row.ParentId}
+            for row in self.cursor.fetchall()
+        }
+
+    def fetch_pages(self, wiki_doc_ids) -> list:
+        """Fetch and convert to text only the given pages."""
+        wiki_doc_ids = list(wiki_doc_ids)
+        pages = []
+        # SQL Server caps a statement at 2100 parameters
+        for start in range(0, len(wiki_doc_ids), 1000):
+            batch = wiki_doc_ids[start:start + 1000]
+            placeholders = ",".join("?" * len(batch))
+            self.cursor.execute(
+                f"SELECT WikiDocId,Title,ContentHtml, ParentId FROM Wikidocs WHERE WikiDocId IN ({placeholders});",
+                batch
+            )
+            pages.extend(self._row_to_page(row) for row in self.cursor.fetchall())
+        return pages
+
+    def close(self):
         self.cursor.close()
         self.__conn.close()
 
-    def build_navigation_tree(self):
-        
-        all_trees_data = {}
+    def index_pages(self) -> dict:
+        """
+        Index self.pages by parent in one pass and return {module name: root page}.
 
+        Pages that cannot be reached from a root are left out of every tree and
+        recorded instead: self.orphans for pages whose ancestor chain ends at a
+        missing parent, self.cycles for pages whose ancestor chain loops.
+        """
+        self.pages_by_id = {page["id"]: page for page in self.pages}
+        self.root_pages = []
+        self.trees_by_module = defaultdict(list)
         for page in self.pages:
             parent_id = page["parent_id"]
             if parent_id is None:
@@ -61,58 +296,129 @@ class DatabaseService:
             else:
                 self.trees_by_module[parent_id].append(page)
 
-        def build_subtree(parent_id=None):
-            return [
-                {
-                    "title": page["title"].strip(),
-                    "id": page["id"],
-                    "content": page.get("content", ""),
-                    "children": build_subtree(page["id"])
-                }
-                for page in self.trees_by_module.get(parent_id, [])
-            ]
-        
-        for root_page in self.root_pages:
-            module_name = root_page["title"].strip()
-            all_trees_data[module_name] = {
-                "title": module_name,
-                "id": root_page["id"],
-                "content": root_page.get("content", ""),
-                "children": build_subtree(root_page["id"])
-            }
+        reached = set()
+        stack = [page["id"] for page in self.root_pages]
+        while stack:
+            page_id = stack.pop()
+            reached.add(page_id)
+            stack.extend(child["id"] for child in self.trees_by_module.get(page_id, []))
+
+        # Classify unreachable pages by following parent pointers, each page at most once
+        status = {}
+        for page_id in self.pages_by_id.keys() - reached:
+            path = []
+            on_path = set()
+            node = page_id
+            while node in self.pages_by_id and node not in status and node not in on_path:
+                path.append(node)
+                on_path.add(node)
+                node = self.pages_by_id[node]["parent_id"]
+            if node in status:
+                result = status[node]
+            else:
+                result = "cycle" if node in on_path else "orphan"
+            for path_node in path:
+                status[path_node] = result
+        self.orphans = sorted(page_id for page_id, kind in status.items() if kind == "orphan")
+        self.cycles = sorted(page_id for page_id, kind in status.items() if kind == "cycle")
+        if self.orphans:
+            print(f"Skipped {len(self.orphans)} orphaned pages: {self.orphans[:20]}")
+        if self.cycles:
+            print(f"Skipped {len(self.cycles)} pages in parent cycles: {self.cycles[:20]}")
+
+        return {root_page["title"].strip(): root_page for root_page in self.root_pages}
+
+    def build_navigation_tree(self):
+        """Build every module tree as nested dicts, iteratively and in O(n)."""
+        all_trees_data = {}
+
+        for module_name, root_page in self.index_pages().items():
+            root = {"title": module_name, "id": root_page["id"], "content": self.page_content(root_page), "children": []}
+            stack = [(root_page["id"], root["children"])]
+            while stack:
+                parent_id, children = stack.pop()
+                for page in self.trees_by_module.get(parent_id, []):
+                    node = {"title": page["title"].strip(), "id": page["id"],
+                            "content": self.page_content(page), "children": []}
+                    children.append(node)
+                    stack.append((page["id"], node["children"]))
+            all_trees_data[module_name] = root
 
         return all_trees_data
-    
-        
-    def tree_to_json(self,filename: str, nav_tree: dict | list) -> None:
+
+    def _iter_documents(self, root_page: dict):
+        """Yield a module's pages in depth-first order with their breadcrumb titles."""
+        stack = [(root_page, "")]
+        while stack:
+            page, parent_breadcrumb = stack.pop()
+            title = page["title"].strip()
+            breadcrumb = f"{parent_breadcrumb} > {title}" if parent_breadcrumb else title
+            yield {
+                "id": page["id"],
+                "parent_id": page["parent_id"],
+                "title": title,
+                "breadcrumb": breadcrumb,
+                "content": self.page_content(page)
+            }
+            children = self.trees_by_module.get(page["id"], [])
+            stack.extend((child, breadcrumb) for child in reversed(children))
+
+    def module_to_json(self, filename: str, root_page: dict) -> None:
         """
-        Save the navigation tree to a JSON file.
+        Stream one module to a compact JSON file holding the tree as a flat
+        "documents" table in depth-first order, one page per line with its
+        parent id, breadcrumb title and content. Nothing is nested, so neither
+        writing nor loading depends on the depth of the hierarchy, and only one
+        page's content is held in memory at a time. Call index_pages first.
         """
         if not filename.endswith(".json"):
             filename += ".json"
-        
+
         os.makedirs("app/source_files", exist_ok=True)
         filepath = os.path.join("app", "source_files", filename)
+        tmp_path = f"{filepath}.tmp"
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(nav_tree, f, indent=2, ensure_ascii=False)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(f'{{"title":{json.dumps(root_page["title"].strip(), ensure_ascii=False)},'
+                    f'"id":{json.dumps(root_page["id"])},"documents":[')
+            for i, document in enumerate(self._iter_documents(root_page)):
+                f.write(",\n" if i else "\n")
+                f.write(json.dumps(document, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n]}\n")
+        os.replace(tmp_path, filepath)
 
     def save_all_trees(self):
         """
         Orchestrates the process of building all trees and saving them to individual JSON files.
         """
-        all_trees = self.build_navigation_tree()
-        
-        for module_name, tree_data in all_trees.items():
+        for module_name, root_page in self.index_pages().items():
             # Sanitize filename for spaces and case
             sanitized_filename = module_name.replace(" ", "_").lower()
-            self.tree_to_json(sanitized_filename, tree_data)
+            self.module_to_json(sanitized_filename, root_page)
             print(f"Saved navigation tree for module '{module_name}' to {sanitized_filename}.json")
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
 
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Export Wikidocs into per-module navigation trees.")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="fetch in batches and parse HTML in a process pool with bounded memory")
+    arg_parser.add_argument("--batch-size", type=int, default=500)
+    arg_parser.add_argument("--workers", type=int, default=None, help="parser processes (0 parses inline)")
+    arg_parser.add_argument("--parser", choices=HTML_PARSERS, default="html.parser")
+    arg_parser.add_argument("--spool", default=os.path.join("app", "source_files", ".pages.spool"))
+    args = arg_parser.parse_args()
+
     parser_obj = DatabaseService()
-    parser_obj.database_fetch()
-    parser_obj.save_all_trees()
+    if args.stream:
+        ingest_report = parser_obj.database_fetch_streaming(args.spool, args.batch_size, args.workers, args.parser)
+        print(f"Ingested {json.dumps(ingest_report.to_dict())}")
+        parser_obj.save_all_trees()
+        os.remove(args.spool)
+    else:
+        parser_obj.database_fetch()
+        parser_obj.save_all_trees()
 
 
@@ -0,0 +1,88 @@
+import importlib.util
+import json
+import os
+from app import logger
+
+EMBED_BACKENDS = ("torch", "torch-int8", "onnx", "openvino")
+# Optional extras, not in requirements.txt: pip install "sentence-transformers[onnx]" or "[openvino]"
+BACKEND_PACKAGES = {"onnx": ("optimum", "onnxruntime"), "openvino": ("optimum", "openvino")}
+EMBEDDING_META_FILE = "embedding_model.json"
+# Indexes persisted before the model was recorded were all built with this one
+LEGACY_EMBED_MODEL = "BAAI/bge-large-en-v1.5"
+
+
+def load_embed_model(model_name: str, backend: str = "torch", threads: int = 0, batch_size: int = 32,
+                     model_file: str | None = None):
+    """
+    Load a sentence-transformers model through llama_index's HuggingFaceEmbedding.
+
+    backend "torch" runs the model as published; "torch-int8" applies dynamic
+    int8 quantization to its Linear layers; "onnx" and "openvino" run an
+    exported graph (model_file picks one, e.g. a quantized
+    "onnx/model_qint8_avx512.onnx"). threads sets the intra-op thread count,
+    0 keeps the runtime's default. Quantized and exported variants of a model
+    produce vectors compatible with an index built by the plain model.
+    """
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unsupported embedding backend {backend!r}, expected one of {EMBED_BACKENDS}")
+    missing = [package for package in BACKEND_PACKAGES.get(backend, ()) if importlib.util.find_spec(package) is None]
+    if missing:
+        raise ImportError(f"Embedding backend {backend!r} needs the optional packages {', '.join(missing)}: "
+                          f"pip install \"sentence-transformers[{backend}]\", or use EMBED_BACKEND=torch")
+    # Imported here: pulling in transformers and torch takes seconds
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    model_kwargs = {}
+    if model_file:
+        model_kwargs["file_name"] = model_file
+    if backend == "onnx" and threads:
+        import onnxruntime
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        model_kwargs["session_options"] = session_options
+    if backend in ("torch", "torch-int8") and threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    embed_model = HuggingFaceEmbedding(
+        model_name=model_name,
+        embed_batch_size=batch_size,
+        backend="torch" if backend == "torch-int8" else backend,
+        model_kwargs=model_kwargs
+    )
+    if backend == "torch-int8":
+        import torch
+        embed_model._model = torch.quantization.quantize_dynamic(embed_model._model, {torch.nn.Linear},
+                                                                dtype=torch.qint8)
+    logger.info(f"Loaded embedding model {model_name} ({backend}, threads={threads or 'default'})")
+    return embed_model
+
+
+def read_index_model(index_dir: str) -> dict | None:
+    """The embedding model recorded for the index under index_dir, or None without a record."""
+    path = os.path.join(index_dir, EMBEDDING_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_index_model(index_dir: str, model_name: str, dim: int) -> None:
+    path = os.path.join(index_dir, EMBEDDING_META_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "dim": dim}, f)
+    os.replace(tmp_path, path)
+
+
+def index_model_mismatch(recorded: dict | None, model_name: str, model_dim: int, index_dim: int) -> str | None:
+    """
+    Why vectors built by the recorded model cannot be searched with model_name,
+    or None when they can. Searching them anyway would return noise without
+    any error. A missing record means LEGACY_EMBED_MODEL.
+    """
+    recorded_name = recorded["model_name"] if recorded else LEGACY_EMBED_MODEL
+    if recorded_name != model_name or (index_dim and model_dim != index_dim):
+        return (f"built with {recorded_name} ({index_dim} dims) but EMBED_MODEL is {model_name} "
+                f"({model_dim} dims)")
+    return None
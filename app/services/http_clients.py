@@ -0,0 +1,122 @@
+import asyncio
+import importlib.util
+import time
+import httpx
+from app import logger
+
+
+class HttpClients:
+    """
+    The process's shared, pooled HTTP clients for OpenAI and SerpAPI.
+
+    Every service talks to an upstream through these clients, so connections
+    (and TLS sessions) are reused across requests within the configured pool
+    limits. HTTP/2 is used when enabled and the h2 package is installed.
+    warm_up() opens connections at startup so the first user requests after a
+    deploy skip connection setup; aclose() releases them on shutdown.
+    """
+
+    def __init__(self, openai_base_url: str, search_base_url: str, max_connections: int = 20,
+                 max_keepalive_connections: int = 10, keepalive_expiry: float = 60.0, http2: bool = True,
+                 connect_timeout: float = 5.0, timeout: float = 60.0, warm_connections: int = 2):
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.openai_base_url = openai_base_url.rstrip("/")
+        self.search_base_url = search_base_url.rstrip("/")
+        self.warm_connections = warm_connections
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.requests = {}
+        self.warm_up_seconds = None
+
+        self.openai = self._async_client("openai")
+        self.openai_sync = self._sync_client("openai_sync")
+        self.search = self._async_client("search", base_url=self.search_base_url)
+        self.search_sync = self._sync_client("search_sync", base_url=self.search_base_url)
+
+    def _count(self, name: str):
+        self.requests[name] = 0
+
+        def on_request(request):
+            self.requests[name] += 1
+
+        return on_request
+
+    def _async_client(self, name: str, base_url: str = "") -> httpx.AsyncClient:
+        counter = self._count(name)
+
+        async def on_request(request):
+            counter(request)
+
+        return httpx.AsyncClient(base_url=base_url, limits=self.limits, timeout=self.timeout, http2=self.http2,
+                                 event_hooks={"request": [on_request]})
+
+    def _sync_client(self, name: str, base_url: str = "") -> httpx.Client:
+        return httpx.Client(base_url=base_url, limits=self.limits, timeout=self.timeout, http2=self.http2,
+                            event_hooks={"request": [self._count(name)]})
+
+    async def _warm(self, client: httpx.AsyncClient, url: str) -> bool:
+        try:
+            # Any response means the connection is open; the status does not matter
+            await client.head(url)
+            return True
+        except httpx.HTTPError as e:
+            logger.warning(f"Connection warm-up to {url} failed: {e}")
+            return False
+
+    async def warm_up(self) -> None:
+        """Open warm_connections connections to each upstream; failures are logged, never fatal."""
+        started = time.perf_counter()
+        # With HTTP/2 a single connection is multiplexed, so one request per upstream is enough
+        count = 1 if self.http2 else self.warm_connections
+        results = await asyncio.gather(
+            *[self._warm(self.openai, self.openai_base_url) for _ in range(count)],
+            *[self._warm(self.search, self.search_base_url) for _ in range(count)]
+        )
+        self.warm_up_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Warmed {sum(results)}/{len(results)} upstream connections in {self.warm_up_seconds}s")
+
+    async def aclose(self) -> None:
+        await self.openai.aclose()
+        await self.search.aclose()
+        self.openai_sync.close()
+        self.search_sync.close()
+
+    @staticmethod
+    def _pool_stats(client) -> dict:
+        # httpx keeps its connection pool on the transport and the pool is httpcore's. Neither is public API,
+        # so when a release moves them the pool figures are left out rather than failing the stats endpoint
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        try:
+            connections = list(pool.connections)
+            idle = sum(1 for connection in connections if connection.is_idle())
+            http2 = sum(1 for connection in connections if "HTTP/2" in connection.info())
+        except (AttributeError, TypeError):
+            return {}
+        return {
+            "connections": len(connections),
+            "idle": idle,
+            "active": len(connections) - idle,
+            "http2": http2,
+        }
+
+    def stats(self) -> dict:
+        clients = {"openai": self.openai, "openai_sync": self.openai_sync,
+                   "search": self.search, "search_sync": self.search_sync}
+        return {
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "http2": self.http2,
+            "warm_up_seconds": self.warm_up_seconds,
+            "clients": {
+                name: {"requests": self.requests[name], **self._pool_stats(client)}
+                for name, client in clients.items()
+            },
+        }
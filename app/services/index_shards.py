@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
+from app import logger
+from app.services.vector_store import MmapVectorStore
+
+SHARD_DIR_NAME = "shards"
+SHARD_META_FILE = "shard.json"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexShard:
+    """
+    The vector index of one module file in data_dir, kept in its own storage
+    directory (index_dir/shards/<name>) with its own docstore and vector store.
+
+    shard.json records the hash of the module file the shard was built from
+    and the embedding model that built it, so a shard whose file or model
+    changed is rebuilt on its own while the others load as they are.
+    """
+
+    def __init__(self, name: str, index_dir: str, source_path: str, module: str | None = None):
+        self.name = name
+        self.shard_dir = os.path.join(index_dir, SHARD_DIR_NAME, name)
+        self.source_path = source_path
+        self.module = module
+        self.model_name = None
+        self.index = None
+        self.centroid = None
+        self.node_ids = frozenset()
+        self.searches = 0
+
+    @property
+    def vector_store(self) -> MmapVectorStore:
+        return self.index.vector_store
+
+    @property
+    def count(self) -> int:
+        return self.vector_store.count if self.index is not None else 0
+
+    def read_meta(self) -> dict | None:
+        path = os.path.join(self.shard_dir, SHARD_META_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def is_current(self) -> bool:
+        """Whether the persisted shard was built from the module file as it is now."""
+        meta = self.read_meta()
+        return (meta is not None and os.path.exists(self.source_path)
+                and meta["source_hash"] == file_hash(self.source_path))
+
+    def load(self, embed_model, quantization: str = "float32") -> None:
+        vector_store = MmapVectorStore.from_persist_dir(self.shard_dir, quantization=quantization)
+        storage_context = StorageContext.from_defaults(persist_dir=self.shard_dir, vector_store=vector_store)
+        self.index = load_index_from_storage(storage_context, embed_model=embed_model)
+        meta = self.read_meta()
+        self.module = meta.get("module") or self.module
+        # Shards persisted before the model was recorded here leave it to the index-wide record
+        self.model_name = meta.get("embed_model")
+        self._changed()
+
+    def build(self, embed_model, nodes: list, quantization: str = "float32", model_name: str | None = None) -> None:
+        """Index nodes as a new shard and persist it; nodes that already carry an embedding are not re-embedded."""
+        self.model_name = model_name or self.model_name
+        storage_context = StorageContext.from_defaults(vector_store=MmapVectorStore(quantization=quantization))
+        self.index = VectorStoreIndex(nodes=nodes, storage_context=storage_context, embed_model=embed_model)
+        self.persist()
+
+    def persist(self) -> None:
+        self.index.storage_context.persist(persist_dir=self.shard_dir)
+        self.write_meta()
+        self._changed()
+
+    def write_meta(self) -> None:
+        # Written last: a shard without it, or with an old hash, is rebuilt
+        meta = {"module": self.module, "source": os.path.basename(self.source_path),
+                "source_hash": file_hash(self.source_path), "nodes": self.count,
+                "embed_model": self.model_name, "dim": self.vector_store.dim}
+        path = os.path.join(self.shard_dir, SHARD_META_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    def _changed(self) -> None:
+        self.centroid = self.vector_store.centroid()
+        self.node_ids = frozenset(self.index.docstore.docs)
+
+    def nodes(self) -> list:
+        return list(self.index.docstore.docs.values())
+
+    def search(self, embeddings: list, top_k: int) -> list:
+        """Top-k (similarity, node id) pairs per query embedding."""
+        self.searches += len(embeddings)
+        return [list(zip(result.similarities, result.ids))
+                for result in self.vector_store.query_batch(embeddings, top_k)]
+
+    def remove(self) -> None:
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+        logger.info(f"Removed index shard {self.name}")
+
+    def to_dict(self) -> dict:
+        return {"module": self.module, "source": os.path.basename(self.source_path), "nodes": self.count,
+                "searches": self.searches}
+
+
+class ShardRouter:
+    """
+    Chooses the shards a query searches from the cosine similarity of its
+    embedding to each shard's centroid.
+
+    Every shard within margin of the best similarity is searched, best first
+    and at most max_fanout of them (0 for no cap). A module's centroid is the
+    average of very different pages, so the margin keeps the runners-up in
+    play rather than betting the query on the closest average.
+    """
+
+    def __init__(self, shards: list, margin: float = 0.05, max_fanout: int = 0):
+        self.shards = [shard for shard in shards if shard.centroid is not None]
+        self.margin = margin
+        self.max_fanout = max_fanout
+        self.centroids = np.stack([shard.centroid for shard in self.shards]) if self.shards else None
+        self.routed = 0
+        self.shards_searched = 0
+
+    def route(self, embeddings: list) -> list:
+        """The shards to search for each query embedding, most similar first."""
+        if len(self.shards) < 2:
+            return [list(self.shards) for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        similarities = self.centroids @ queries.T
+        routes = []
+        for column in range(similarities.shape[1]):
+            scores = similarities[:, column]
+            order = np.argsort(-scores)
+            chosen = [self.shards[i] for i in order if scores[i] >= scores[order[0]] - self.margin]
+            routes.append(chosen[:self.max_fanout] if self.max_fanout else chosen)
+        self.routed += len(routes)
+        self.shards_searched += sum(len(route) for route in routes)
+        return routes
+
+    def stats(self) -> dict:
+        return {
+            "margin": self.margin,
+            "max_fanout": self.max_fanout,
+            "centroid_routed_queries": self.routed,
+            "avg_shards_per_query": round(self.shards_searched / self.routed, 3) if self.routed else 0.0,
+        }
@@ -0,0 +1,196 @@
+import glob
+import json
+import os
+import time
+from app import logger
+from app.services.database_service import TEXT_FORMAT
+
+
+class SyncReport:
+    """What one incremental sync changed."""
+
+    def __init__(self):
+        self.inserted = []
+        self.updated = []
+        self.deleted = []
+        self.orphaned = []
+        self.embedded_nodes = 0
+        self.seconds = 0.0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.deleted)
+
+    def to_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "deleted": self.deleted,
+            "orphaned": self.orphaned,
+            "embedded_nodes": self.embedded_nodes,
+            "seconds": round(self.seconds, 2),
+        }
+
+
+class WikiIndexSync:
+    """
+    Brings the module JSON files and the vector index up to date with Wikidocs
+    by touching only the pages that changed.
+
+    A manifest next to the index records the database-side content hash, title
+    and parent of every page seen by the last sync. A sync compares it with
+    fresh hashes, fetches and converts only inserted or changed pages, rewrites
+    the module trees and re-embeds just those pages. A page whose title or
+    parent changed is re-embedded with all its descendants, since their titles
+    include the path to the root. Pages left without a path to a root, such
+    as the children of a deleted page, are dropped from the trees and their
+    vectors removed until they are re-parented. The first sync against an index without a
+    manifest, or with one written for an older TEXT_FORMAT of the HTML
+    conversion, re-converts and re-embeds every page once.
+    """
+
+    MANIFEST_FILE = "wiki_manifest.json"
+
+    def __init__(self, db_service, pipeline):
+        self.db_service = db_service
+        self.pipeline = pipeline
+        self.manifest_path = os.path.join(pipeline.index_dir, self.MANIFEST_FILE)
+
+    def load_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        pages = {int(page_id): entry for page_id, entry in manifest["pages"].items()}
+        if manifest.get("text_format") != TEXT_FORMAT:
+            # Pages converted by an older html_to_text count as changed, so they are fetched again
+            for entry in pages.values():
+                entry["hash"] = None
+        return pages
+
+    def save_manifest(self, pages: dict) -> None:
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": pages, "text_format": TEXT_FORMAT}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def load_source_pages(self) -> tuple[dict, dict]:
+        """
+        Read the module files back into {id: page} with parent ids, from the
+        documents table when present or by walking older nested trees. Also
+        returns {root id: file name} so each tree is rewritten in place.
+        """
+        pages = {}
+        module_files = {}
+        stack = []
+        for file in glob.glob(os.path.join(self.pipeline.data_dir, "*.json")):
+            with open(file, "r", encoding="utf-8") as f:
+                tree = json.load(f)
+            module_files[tree["id"]] = os.path.basename(file)
+            if "documents" in tree:
+                for document in tree["documents"]:
+                    pages[document["id"]] = {
+                        "id": document["id"],
+                        "title": document["title"],
+                        "content": document["content"],
+                        "parent_id": document["parent_id"]
+                    }
+            else:
+                stack.append((tree, None))
+        while stack:
+            node, parent_id = stack.pop()
+            pages[node["id"]] = {
+                "id": node["id"],
+                "title": node["title"],
+                "content": node.get("content", ""),
+                "parent_id": parent_id
+            }
+            stack.extend((child, node["id"]) for child in node.get("children", []))
+        return pages, module_files
+
+    def _with_descendants(self, page_ids: set, hashes: dict) -> set:
+        children = {}
+        for page_id, entry in hashes.items():
+            children.setdefault(entry["parent_id"], []).append(page_id)
+        result = set()
+        stack = list(page_ids)
+        while stack:
+            page_id = stack.pop()
+            if page_id in result:
+                continue
+            result.add(page_id)
+            stack.extend(children.get(page_id, []))
+        return result
+
+    def save_trees(self, pages: dict, module_files: dict) -> set:
+        """
+        Rewrite the module trees from pages, keeping each module's existing
+        file name. Returns the ids of pages left out of every tree.
+        """
+        self.db_service.pages = list(pages.values())
+        written = set()
+        for module_name, root_page in self.db_service.index_pages().items():
+            filename = module_files.get(root_page["id"]) or module_name.replace(" ", "_").lower() + ".json"
+            self.db_service.module_to_json(filename, root_page)
+            written.add(filename)
+        for filename in set(module_files.values()) - written:
+            os.remove(os.path.join(self.pipeline.data_dir, filename))
+        return set(self.db_service.orphans) | set(self.db_service.cycles)
+
+    def sync(self) -> SyncReport:
+        report = SyncReport()
+        started = time.perf_counter()
+
+        manifest = self.load_manifest()
+        hashes = self.db_service.fetch_page_hashes()
+
+        report.inserted = sorted(page_id for page_id in hashes if page_id not in manifest)
+        report.updated = sorted(page_id for page_id in hashes
+                                if page_id in manifest and manifest[page_id]["hash"] != hashes[page_id]["hash"])
+        report.deleted = sorted(page_id for page_id in manifest if page_id not in hashes)
+
+        if not report.changed:
+            report.seconds = time.perf_counter() - started
+            logger.info(f"Wiki index sync: no changes ({report.seconds:.2f}s)")
+            return report
+
+        moved = {page_id for page_id in report.updated
+                 if (manifest[page_id]["title"], manifest[page_id]["parent_id"])
+                 != (hashes[page_id]["title"], hashes[page_id]["parent_id"])}
+        reembed = set(report.inserted) | set(report.updated) | self._with_descendants(moved, hashes)
+
+        pages, module_files = self.load_source_pages()
+        for page_id in report.deleted:
+            pages.pop(page_id, None)
+        # Pages dropped by an earlier sync are fetched again in case this change gives them a root
+        dropped_before = set(hashes) - set(pages) - set(report.inserted)
+        reembed |= self._with_descendants(dropped_before, hashes)
+        for page in self.db_service.fetch_pages(set(report.inserted) | set(report.updated) | dropped_before):
+            pages[page["id"]] = page
+
+        report.orphaned = sorted(self.save_trees(pages, module_files) - dropped_before)
+
+        documents = []
+        for file in glob.glob(os.path.join(self.pipeline.data_dir, "*.json")):
+            with open(file, "r", encoding="utf-8") as f:
+                documents.extend(doc for doc in self.pipeline.flatten_pages(json.load(f))
+                                 if doc.metadata["id"] in reembed)
+        report.embedded_nodes = self.pipeline.apply_changes(documents, report.deleted + report.orphaned)
+
+        self.save_manifest(hashes)
+        report.seconds = time.perf_counter() - started
+        logger.info(f"Wiki index sync: {report.to_dict()}")
+        return report
+
+
+if __name__ == "__main__":
+    from app.services.database_service import DatabaseService
+    from app.services.rag_service import RAGPipeline
+
+    db_service = DatabaseService()
+    try:
+        pipeline = RAGPipeline(executor="none")
+        result = WikiIndexSync(db_service, pipeline).sync()
+    finally:
+        db_service.close()
+    print(json.dumps(result.to_dict(), indent=2))
@@ -0,0 +1,96 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+# Keep codes such as "ME-2041", "v1.2" or "crew_list" whole; their parts are indexed too
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it its me my of on or "
+    "the this that to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over node texts.
+
+    Postings map each term to (document position, term frequency) pairs, so a
+    query only touches documents sharing at least one term with it. Search can
+    be restricted to an allowed set of node ids for metadata prefiltering.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.node_ids = []
+        self.doc_lengths = []
+        self.postings = defaultdict(list)
+        self.idf = {}
+        self.avg_length = 0.0
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @classmethod
+    def from_texts(cls, items, k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Build from (node_id, text) pairs."""
+        index = cls(k1, b)
+        for node_id, text in items:
+            terms = Counter(tokenize(text))
+            position = len(index.node_ids)
+            index.node_ids.append(node_id)
+            index.doc_lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                index.postings[term].append((position, frequency))
+
+        count = len(index.node_ids)
+        index.avg_length = sum(index.doc_lengths) / count if count else 0.0
+        index.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in index.postings.items()
+        }
+        return index
+
+    def search(self, query: str, top_k: int = 10, allowed_ids: set | None = None) -> list:
+        """Return up to top_k (node_id, score) pairs, best first."""
+        if not self.node_ids:
+            return []
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for position, frequency in postings:
+                if allowed_ids is not None and self.node_ids[position] not in allowed_ids:
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[position] / self.avg_length
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(self.node_ids[position], score) for position, score in best]
+
+
+def reciprocal_rank_fusion(*rankings: list, weights: tuple | None = None, k: int = 60) -> list:
+    """Merge ranked id lists by weighted reciprocal rank fusion, best first."""
+    weights = weights or (1.0,) * len(rankings)
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking):
+            scores[item] += weight / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
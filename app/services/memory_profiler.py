@@ -0,0 +1,65 @@
+import tracemalloc
+
+# Allocations by tracemalloc itself and the import machinery; left out of every snapshot, baseline included
+_EXCLUDED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_EXCLUDED_TRACES)
+
+
+class MemoryProfiler:
+    """
+    On-demand tracemalloc sessions. Tracing slows every allocation, so it only
+    runs between start() and stop(); snapshot() reports the top allocation
+    sites meanwhile, optionally as growth since start().
+    """
+
+    def __init__(self):
+        self._baseline = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = _take_snapshot()
+        return self.status()
+
+    def stop(self) -> dict:
+        status = self.status()
+        tracemalloc.stop()
+        self._baseline = None
+        return status
+
+    def snapshot(self, top: int = 25, growth: bool = False) -> dict:
+        if not tracemalloc.is_tracing():
+            return {**self.status(), "top": []}
+        snapshot = _take_snapshot()
+        if growth and self._baseline is not None:
+            stats = snapshot.compare_to(self._baseline, "lineno")[:top]
+            top_sites = [{"site": str(stat.traceback), "size_kb": round(stat.size / 1024, 1),
+                          "size_diff_kb": round(stat.size_diff / 1024, 1), "count": stat.count}
+                         for stat in stats]
+        else:
+            stats = snapshot.statistics("lineno")[:top]
+            top_sites = [{"site": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                         for stat in stats]
+        return {**self.status(), "top": top_sites}
+
+    def status(self) -> dict:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "overhead_kb": round(tracemalloc.get_tracemalloc_memory() / 1024, 1),
+        }
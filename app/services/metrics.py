@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cached embedding lookup up to a slow model stream
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+FRAME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+SHARD_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16)
+BYTE_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if position < len(self.buckets):
+                series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_format_value(round(series[-2], 6))}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, rendered in the Prometheus text
+    format by /metrics. Safe to update from retrieval worker threads.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Gauge:
+        metric = Gauge(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+QUERY_EMBEDDING_SECONDS = registry.histogram(
+    "fleetops_query_embedding_seconds", "Query embedding model calls, per batch", ("path",))
+VECTOR_SEARCH_SECONDS = registry.histogram(
+    "fleetops_vector_search_seconds", "Index search for one query, dense and lexical", ("mode",))
+RESEARCH_STAGE_SECONDS = registry.histogram(
+    "fleetops_research_stage_seconds", "research_wrapper stages: rephrase, search, retrieval", ("stage",))
+RESEARCH_STAGE_FAILURES = registry.counter(
+    "fleetops_research_stage_failures_total", "research_wrapper stages that timed out or failed", ("stage", "reason"))
+SHARD_FANOUT = registry.histogram(
+    "fleetops_index_shards_searched", "Index shards searched per query", buckets=SHARD_BUCKETS)
+CONTEXT_COMPRESSION_RATIO = registry.histogram(
+    "fleetops_context_compression_ratio", "Context tokens kept by compression, as a fraction of those retrieved",
+    buckets=RATIO_BUCKETS)
+CONTEXT_COMPRESSION_SECONDS = registry.histogram(
+    "fleetops_context_compression_seconds", "Time spent compressing retrieved context per request")
+MODEL_TTFT_SECONDS = registry.histogram(
+    "fleetops_model_ttft_seconds", "Time from completion request to first streamed chunk", ("model",))
+MODEL_TOKENS_PER_SECOND = registry.histogram(
+    "fleetops_model_tokens_per_second", "Streamed content chunks per second after the first", ("model",),
+    buckets=RATE_BUCKETS)
+MODEL_PROMPT_TOKENS = registry.counter(
+    "fleetops_model_prompt_tokens_total", "Prompt tokens sent, as reported by the API", ("model",))
+MODEL_CACHED_PROMPT_TOKENS = registry.counter(
+    "fleetops_model_cached_prompt_tokens_total", "Prompt tokens served from the provider's prompt cache", ("model",))
+SSE_STREAM_SECONDS = registry.histogram(
+    "fleetops_sse_stream_seconds", "Duration of /api/fleetAssistant event streams")
+SSE_FRAMES = registry.histogram(
+    "fleetops_sse_frames", "SSE frames written per /api/fleetAssistant response", buckets=FRAME_BUCKETS)
+SSE_BYTES = registry.histogram(
+    "fleetops_sse_bytes", "SSE bytes written per /api/fleetAssistant response", buckets=BYTE_BUCKETS)
+SSE_DISCONNECTS = registry.counter(
+    "fleetops_sse_disconnects_total", "Responses cut short by the client disconnecting")
+MODEL_RETRIES = registry.counter(
+    "fleetops_model_retries_total", "Completion requests retried after an error", ("model",))
+MODEL_FALLBACKS = registry.counter(
+    "fleetops_model_fallbacks_total",
+    "Responses not served by the first model: next model, hedge, or canned text", ("kind",))
+CIRCUIT_REJECTIONS = registry.counter(
+    "fleetops_model_circuit_rejections_total", "Model calls skipped because the breaker was open", ("model",))
+ADMISSION_IN_FLIGHT = registry.gauge(
+    "fleetops_admission_in_flight", "Assistant requests holding an admission slot")
+ADMISSION_QUEUE_DEPTH = registry.gauge(
+    "fleetops_admission_queue_depth", "Assistant requests waiting for an admission slot", ("priority",))
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "fleetops_admission_wait_seconds", "Time admitted requests waited in the queue", ("priority",))
+ADMISSION_REJECTIONS = registry.counter(
+    "fleetops_admission_rejections_total", "Assistant requests turned away with 503", ("reason",))
+RATE_LIMITED = registry.counter(
+    "fleetops_rate_limited_total", "Requests rejected by the rate limiter", ("path",))
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from app.services.lexical_index import tokenize
+
+# Words in module names that say nothing about the module itself
+GENERIC_MODULE_WORDS = frozenset({"module", "modules", "page", "pages"})
+
+
+def _stem(token: str) -> str:
+    return token[:-1] if len(token) > 3 and token.endswith("s") else token
+
+
+class ModuleRouter:
+    """
+    Picks the wiki module a question is about from the breadcrumb titles in
+    the node metadata ("Operations Module > Voyage > Port Call").
+
+    A module scores two points when its own name is mentioned and one point
+    per page title, found verbatim in the question, that no other module
+    shares. The question is routed only when one module strictly wins;
+    otherwise retrieval searches the whole corpus.
+    """
+
+    def __init__(self):
+        self.module_node_ids = defaultdict(set)
+        self.module_keywords = {}
+        self.title_modules = defaultdict(set)
+
+    @classmethod
+    def from_nodes(cls, nodes) -> "ModuleRouter":
+        router = cls()
+        for node in nodes:
+            breadcrumb = [part.strip() for part in str(node.metadata.get("title", "")).split(">")]
+            if not breadcrumb[0]:
+                continue
+            module = breadcrumb[0]
+            router.module_node_ids[module].add(node.node_id)
+            for title in breadcrumb[1:]:
+                phrase = " ".join(tokenize(title))
+                if phrase:
+                    router.title_modules[phrase].add(module)
+
+        for module in router.module_node_ids:
+            router.module_keywords[module] = {_stem(token) for token in tokenize(module)} - GENERIC_MODULE_WORDS
+        # Titles used in several modules cannot tell them apart
+        router.title_modules = {phrase: modules.pop() for phrase, modules in router.title_modules.items()
+                                if len(modules) == 1}
+        return router
+
+    @property
+    def modules(self) -> list:
+        return sorted(self.module_node_ids)
+
+    def route(self, question: str) -> str | None:
+        tokens = tokenize(question)
+        if not tokens or len(self.module_node_ids) < 2:
+            return None
+        stems = {_stem(token) for token in tokens}
+        padded = f" {' '.join(tokens)} "
+
+        scores = defaultdict(int)
+        for module, keywords in self.module_keywords.items():
+            if keywords and keywords <= stems:
+                scores[module] += 2
+        for phrase, module in self.title_modules.items():
+            if f" {phrase} " in padded:
+                scores[module] += 1
+
+        if not scores:
+            return None
+        ranked = sorted(scores.values(), reverse=True)
+        if len(ranked) > 1 and ranked[0] == ranked[1]:
+            return None
+        return max(scores, key=scores.get)
+
+    def node_ids(self, module: str) -> set:
+        return self.module_node_ids.get(module, set())
@@ -1,58 +1,550 @@
+import asyncio
 import glob
 import json
 import os
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import Document, VectorStoreIndex, StorageContext, load_index_from_storage
-from llama_index.embeddings.openai import OpenAIEmbedding
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from llama_index.core import Document, StorageContext, load_index_from_storage
 import app
+from app.config import Config
+from app.services.retrieval_executor import RetrievalExecutor
+from app.services.query_cache import QueryCache, normalize_query
+from app.services.vector_store import MmapVectorStore, LEGACY_VECTOR_STORE_FILE
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion
+from app.services.module_router import ModuleRouter
+from app.services.index_shards import IndexShard, ShardRouter, SHARD_DIR_NAME
+from app.services.chunking import PageChunker, embed_nodes
+from app.services.metrics import QUERY_EMBEDDING_SECONDS, VECTOR_SEARCH_SECONDS, SHARD_FANOUT
+from app.services.embeddings import load_embed_model, index_model_mismatch, read_index_model, write_index_model
+
+# Below this many rows in total, searching the chosen shards one after another beats handing them to threads
+_PARALLEL_MIN_ROWS = 4096
 
 
 class RAGPipeline:
-    def __init__(self, data_dir="app/source_files/", index_dir="app/index_storage"):
+    """
+    Retrieval over the wiki: one index shard per module file in data_dir.
+
+    A question is routed to the shards worth searching, by the module it
+    names or else by centroid similarity; the chosen shards are searched in
+    parallel and their hits merged by similarity into one ranking, which in
+    hybrid mode is fused with BM25 over the same shards.
+    """
+
+    def __init__(self, data_dir="app/source_files/", index_dir="app/index_storage", executor=None, tracker=None):
         self.data_dir = data_dir
         self.index_dir = index_dir
-        self.index = None
-        self._build_or_load_index()
+        self.shards = {}
+        self.rebuilt_shards = []
+        self.embed_model = None
+        self.embed_dim = 0
+        self.index_version = 0
+        self.module_names = []
+        self.lexical_index = BM25Index()
+        self.module_router = ModuleRouter()
+        self.shard_router = ShardRouter([])
+        self._node_shards = {}
+        self._module_shards = {}
+        self._route_node_ids = {}
+        self.module_routed = 0
+        self._shard_pool = None
+        if Config.SHARD_SEARCH_WORKERS > 1:
+            self._shard_pool = ThreadPoolExecutor(max_workers=Config.SHARD_SEARCH_WORKERS,
+                                                  thread_name_prefix="shard-search")
+        self.chunker = PageChunker(Config.CHUNK_SIZE, Config.CHUNK_OVERLAP, Config.CHUNK_MIN_TOKENS)
+        self.embedding_cache = QueryCache(Config.QUERY_CACHE_SIZE, Config.QUERY_CACHE_TTL_SECONDS)
+        self.result_cache = QueryCache(Config.QUERY_CACHE_SIZE, Config.QUERY_CACHE_TTL_SECONDS)
+        self.tracker = tracker
+        executor = executor or Config.RETRIEVAL_EXECUTOR
+        if executor == "process":
+            # Each worker process loads the index itself; this process only builds what is stale for them
+            self._prepare_index()
+        else:
+            self._build_or_load_index()
 
-    def get_corpus_data(self, question: str, top_k: int = 2) -> list:
+        self.retrieval_executor = None
+        if executor != "none":
+            self.retrieval_executor = RetrievalExecutor(
+                self,
+                kind=executor,
+                workers=Config.RETRIEVAL_WORKERS,
+                queue_size=Config.RETRIEVAL_QUEUE_SIZE,
+                timeout=Config.RETRIEVAL_TIMEOUT,
+                batch_size=Config.EMBED_BATCH_MAX_SIZE,
+                batch_wait_ms=Config.EMBED_BATCH_WAIT_MS
+            )
+
+    def _phase(self, name: str):
+        """Time a load step on the startup tracker, when there is one."""
+        return self.tracker.phase(name) if self.tracker is not None else nullcontext()
+
+    def _index_changed(self):
+        """Rebuild everything derived from the index and invalidate the previous version."""
+        self.index_version += 1
+        nodes = [node for shard in self.shards.values() for node in shard.nodes()]
+        self.lexical_index = BM25Index.from_texts(
+            (node.node_id, f"{node.metadata.get('title', '')}\n{node.get_content()}") for node in nodes
+        )
+        self.module_router = ModuleRouter.from_nodes(nodes)
+        self.module_names = self.module_router.modules
+        self._node_shards = {node_id: shard for shard in self.shards.values() for node_id in shard.node_ids}
+        self._module_shards = {shard.module: shard for shard in self.shards.values() if shard.module}
+        self.shard_router = ShardRouter(list(self.shards.values()), margin=Config.SHARD_ROUTE_MARGIN,
+                                        max_fanout=Config.SHARD_MAX_FANOUT)
+        self._route_node_ids = {}
+        self.embedding_cache.clear()
+        self.result_cache.clear()
+
+    def query_context(self, question: str) -> str:
+        if Config.RETRIEVAL_MODE == "dense":
+            return f"{question}, Company System: MIPS, Modules: {', '.join(self.module_names)}"
+        # Hybrid search routes by module instead of padding every query with all module names
+        return question
+
+    def cached_embedding(self, query_context: str) -> list | None:
+        return self.embedding_cache.get(normalize_query(query_context))
+
+    def cache_embedding(self, query_context: str, embedding: list) -> None:
+        self.embedding_cache.put(normalize_query(query_context), embedding)
+
+    def cached_results(self, query_context: str, top_k: int) -> list | None:
+        """Context chunks for a previously seen query, resolved from cached node ids."""
+        node_ids = self.result_cache.get((normalize_query(query_context), top_k))
+        if node_ids is None:
+            return None
+        return self.node_texts(node_ids)
+
+    def node_texts(self, node_ids: list) -> list:
+        """The text of each node, in order, looked up in the shard that holds it."""
+        return [self._node_shards[node_id].index.docstore.get_node(node_id).get_content()
+                for node_id in node_ids if node_id in self._node_shards]
+
+    def route_shards(self, query_contexts: list, embeddings: list) -> list:
         """
-        Retrieve top-k relevant context chunks for a question using LlamaIndex.
+        The shards to search for each query. In hybrid mode a query that
+        clearly names a module searches only that module's shard; the rest
+        are routed by the similarity of their embedding to the shard centroids.
         """
-        module_names = [os.path.splitext(f)[0].replace('_', ' ').title()
-                        for f in os.listdir(self.data_dir) if f.endswith('.json')]
-        question_context = f"{question}, Company System: MIPS, Modules: {', '.join(module_names)}"
+        shards = list(self.shards.values())
+        if not Config.SHARD_ROUTING:
+            return [shards for _ in query_contexts]
+        routes = [None] * len(query_contexts)
+        if Config.RETRIEVAL_MODE != "dense" and Config.MODULE_PREFILTER:
+            for position, query_context in enumerate(query_contexts):
+                shard = self._module_shards.get(self.module_router.route(query_context))
+                if shard is not None:
+                    routes[position] = [shard]
+                    self.module_routed += 1
+        pending = [position for position, route in enumerate(routes) if route is None]
+        if pending:
+            for position, route in zip(pending, self.shard_router.route([embeddings[i] for i in pending])):
+                routes[position] = route
+        return routes
+
+    def _search_shards(self, embeddings: list, routes: list, top_k: int) -> list:
+        """Dense top-k node ids per query over its routed shards, each shard searched once for all its queries."""
+        work = {}
+        for position, route in enumerate(routes):
+            for shard in route:
+                work.setdefault(shard, []).append(position)
+
+        def search(item):
+            shard, positions = item
+            return positions, shard.search([embeddings[position] for position in positions], top_k)
+
+        parallel = (self._shard_pool is not None and len(work) > 1
+                    and sum(shard.count for shard in work) >= _PARALLEL_MIN_ROWS)
+        # Similarities are cosine against one embedding model, so hits from different shards compare directly
+        hits = [[] for _ in routes]
+        for positions, results in (self._shard_pool.map(search, work.items()) if parallel
+                                   else map(search, work.items())):
+            for position, result in zip(positions, results):
+                hits[position].extend(result)
+        return [[node_id for _, node_id in sorted(query_hits, key=lambda hit: -hit[0])[:top_k]]
+                for query_hits in hits]
+
+    def _route_ids(self, route: list) -> set | None:
+        """Node ids of the routed shards for the BM25 search, None when the route covers every shard."""
+        if len(route) == len(self.shards):
+            return None
+        key = tuple(sorted(shard.name for shard in route))
+        node_ids = self._route_node_ids.get(key)
+        if node_ids is None:
+            node_ids = set().union(*(shard.node_ids for shard in route))
+            self._route_node_ids[key] = node_ids
+        return node_ids
+
+    def embed_queries(self, queries: list) -> list:
+        """Embed several queries in one model call when the backend supports batching."""
+        embed = getattr(self.embed_model, "_embed", None)
+        if callable(embed):
+            return embed(queries, prompt_name="query")
+        return [self.embed_model.get_query_embedding(query) for query in queries]
+
+    def search(self, query_context: str, embedding: list | None = None, top_k: int = 2) -> list:
+        """Run the vector search, answering repeated queries from the result cache."""
+        cached = self.cached_results(query_context, top_k)
+        if cached is not None:
+            return cached
+
+        if embedding is None:
+            embedding = self.cached_embedding(query_context)
+        if embedding is None:
+            with QUERY_EMBEDDING_SECONDS.time(path="inline"):
+                embedding = self.embed_model.get_query_embedding(query_context)
+            self.cache_embedding(query_context, embedding)
+        return self.search_index(query_context, embedding, top_k)
+
+    def search_index(self, query_context: str, embedding: list, top_k: int = 2) -> list:
+        """Query the index with a precomputed embedding and cache the matching node ids."""
         try:
-            nodes = self.index.as_retriever(similarity_top_k=top_k).retrieve(question_context)
-            context_chunks = [node.get_content() for node in nodes]
-            return context_chunks
+            return self.node_texts(self.search_index_batch([query_context], [embedding], top_k)[0])
         except Exception as e:
             app.logger.error(f"Error retrieving corpus data: {e}", exc_info=True)
             raise
 
+    def get_corpus_data(self, question: str, top_k: int = 2) -> list:
+        """
+        Retrieve top-k relevant context chunks for a question using LlamaIndex.
+        """
+        return self.search(self.query_context(question), top_k=top_k)
+
+    async def aget_corpus_data(self, question: str, top_k: int = 2, timeout: float | None = None) -> list:
+        """
+        Retrieve top-k context chunks without blocking the event loop.
+        Raises RetrievalQueueFull when the executor is saturated and
+        asyncio.TimeoutError when the retrieval exceeds its timeout.
+        """
+        if self.retrieval_executor is None:
+            return self.get_corpus_data(question, top_k)
+        return await self.retrieval_executor.get_corpus_data(question, top_k, timeout)
+
+    def search_index_batch(self, query_contexts: list, embeddings: list, top_k: int = 2) -> list:
+        """
+        Search the routed shards for many queries: every shard is searched
+        once, vectorized over the queries routed to it, and in hybrid mode
+        each query's dense ranking is fused with BM25 over the same shards
+        by reciprocal rank fusion. Returns the node ids per query and caches them.
+        """
+        search_started = time.perf_counter()
+        routes = self.route_shards(query_contexts, embeddings)
+        candidates = top_k if Config.RETRIEVAL_MODE == "dense" else top_k * Config.HYBRID_CANDIDATE_FACTOR
+        dense_ids = self._search_shards(embeddings, routes, candidates)
+
+        node_ids = []
+        for query_context, route, dense in zip(query_contexts, routes, dense_ids):
+            SHARD_FANOUT.observe(len(route))
+            if Config.RETRIEVAL_MODE == "dense":
+                node_ids.append(dense[:top_k])
+                continue
+            lexical_ids = [node_id for node_id, _ in
+                           self.lexical_index.search(query_context, candidates, self._route_ids(route))]
+            node_ids.append(reciprocal_rank_fusion(dense, lexical_ids, weights=(1.0, Config.LEXICAL_WEIGHT))[:top_k])
+            app.logger.debug(f"Hybrid retrieval for {query_context!r}: shards={[shard.name for shard in route]}, "
+                             f"dense={len(dense)}, lexical={len(lexical_ids)}")
+
+        if query_contexts:
+            # Recorded per query so batch and single searches share one histogram
+            per_query = (time.perf_counter() - search_started) / len(query_contexts)
+            for _ in query_contexts:
+                VECTOR_SEARCH_SECONDS.observe(per_query, mode=Config.RETRIEVAL_MODE)
+        for query_context, ids in zip(query_contexts, node_ids):
+            self.result_cache.put((normalize_query(query_context), top_k), ids)
+        return node_ids
+
+    def get_corpus_data_batch(self, questions: list, top_k: int = 2) -> list:
+        """
+        Retrieve top-k context chunks for many questions, in input order.
+
+        Repeated questions are searched once, every uncached query is embedded
+        in a single model call and the dense search is vectorized per shard.
+        """
+        query_contexts = {}
+        for question in questions:
+            query_context = self.query_context(question)
+            query_contexts.setdefault(normalize_query(query_context), query_context)
+
+        chunks = {}
+        missing = []
+        for key, query_context in query_contexts.items():
+            cached = self.cached_results(query_context, top_k)
+            if cached is None:
+                missing.append(key)
+            else:
+                chunks[key] = cached
+
+        embeddings = {key: self.cached_embedding(query_contexts[key]) for key in missing}
+        to_embed = [key for key in missing if embeddings[key] is None]
+        if to_embed:
+            with QUERY_EMBEDDING_SECONDS.time(path="bulk"):
+                vectors = self.embed_queries([query_contexts[key] for key in to_embed])
+            for key, vector in zip(to_embed, vectors):
+                embeddings[key] = vector
+                self.cache_embedding(query_contexts[key], vector)
+
+        node_ids = self.search_index_batch([query_contexts[key] for key in missing],
+                                           [embeddings[key] for key in missing], top_k)
+        for key, ids in zip(missing, node_ids):
+            chunks[key] = self.node_texts(ids)
+        return [chunks[normalize_query(self.query_context(question))] for question in questions]
+
+    async def aget_corpus_data_batch(self, questions: list, top_k: int = 2) -> list:
+        """get_corpus_data_batch off the event loop, on the retrieval executor when there is one."""
+        if self.retrieval_executor is None:
+            return await asyncio.to_thread(self.get_corpus_data_batch, questions, top_k)
+        return await self.retrieval_executor.get_corpus_data_batch(questions, top_k)
+
     def flatten_pages(self, page, parent_title=""):
+        if "documents" in page:
+            # Module files written by DatabaseService.module_to_json are already flat
+            return [Document(id_=str(doc["id"]), text=doc["content"].strip(),
+                             metadata={"title": doc["breadcrumb"], "id": doc["id"]})
+                    for doc in page["documents"]]
+
         docs = []
         title = page["title"]
         content = page.get("content", "").strip()
         full_title = f"{parent_title} > {title}" if parent_title else title
-        docs.append(Document(text=content, metadata={"title": full_title, "id": page["id"]}))
+        # The wiki page id doubles as the ref doc id so a page's vectors can be replaced in place
+        docs.append(Document(id_=str(page["id"]), text=content, metadata={"title": full_title, "id": page["id"]}))
         for child in page.get("children", []):
             docs.extend(self.flatten_pages(child, full_title))
         return docs
 
+    def _load_vector_store(self) -> MmapVectorStore:
+        vector_store = MmapVectorStore.from_persist_dir(self.index_dir, quantization=Config.VECTOR_QUANTIZATION)
+        if vector_store.count == 0 and os.path.exists(os.path.join(self.index_dir, LEGACY_VECTOR_STORE_FILE)):
+            # One-off conversion of an index persisted as SimpleVectorStore JSON
+            app.logger.info(f"Converting {LEGACY_VECTOR_STORE_FILE} to a memory-mapped vector store")
+            vector_store = MmapVectorStore.from_legacy_json(self.index_dir, quantization=Config.VECTOR_QUANTIZATION)
+            vector_store.persist()
+            vector_store = MmapVectorStore.from_persist_dir(self.index_dir, quantization=Config.VECTOR_QUANTIZATION)
+        return vector_store
+
+    def _embed_chunks(self, documents: list) -> list:
+        """Chunk page documents and embed the chunks in batches, logging progress and throughput."""
+        nodes = self.chunker.chunk_documents(documents)
+
+        def progress(report):
+            app.logger.info(f"Embedded {report.nodes}/{report.total_nodes} chunks "
+                            f"({report.to_dict()['nodes_per_sec']} chunks/s)")
+
+        report = embed_nodes(self.embed_model, nodes, Config.EMBED_BUILD_BATCH_SIZE, progress)
+        app.logger.info(f"Embedded {len(documents)} pages as {len(nodes)} chunks: {report.to_dict()}")
+        return nodes
+
     def _build_or_load_index(self):
-        embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-large-en-v1.5")
+        with self._phase("embedding_model"):
+            embed_model = load_embed_model(
+                Config.EMBED_MODEL,
+                backend=Config.EMBED_BACKEND,
+                threads=Config.EMBED_THREADS,
+                batch_size=Config.EMBED_BUILD_BATCH_SIZE,
+                model_file=Config.EMBED_MODEL_FILE
+            )
+            # One query embedding gives the model's dimension and warms it up
+            self.embed_dim = len(embed_model.get_query_embedding("warm up"))
+        self.embed_model = embed_model
 
-        if os.path.exists(self.index_dir) and os.listdir(self.index_dir):
-            # Load index if it exists
-            storage_context = StorageContext.from_defaults(persist_dir=self.index_dir)
-            self.index = load_index_from_storage(storage_context, embed_model=embed_model)
-        else:
-            # Build new index from JSON documents
-            documents = []
-            for file in glob.glob(os.path.join(self.data_dir, "*.json")):
-                with open(file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    flattened = self.flatten_pages(data)
-                    documents.extend(flattened)
-            self.index = VectorStoreIndex.from_documents(documents, embed_model=embed_model)
-            self.index.storage_context.persist(persist_dir=self.index_dir)
+        sources = self._module_sources()
+        shards_dir = os.path.join(self.index_dir, SHARD_DIR_NAME)
+        if not os.path.isdir(shards_dir) and os.path.exists(os.path.join(self.index_dir, "index_store.json")):
+            with self._phase("index_split"):
+                self._split_legacy_index(sources)
+
+        stale = []
+        with self._phase("index_load"):
+            for name, (path, module) in sources.items():
+                shard = IndexShard(name, self.index_dir, path, module)
+                if not shard.is_current():
+                    stale.append(shard)
+                    continue
+                shard.load(embed_model, Config.VECTOR_QUANTIZATION)
+                recorded = {"model_name": shard.model_name} if shard.model_name else read_index_model(self.index_dir)
+                mismatch = index_model_mismatch(recorded, Config.EMBED_MODEL, self.embed_dim, shard.vector_store.dim)
+                if mismatch:
+                    # Its vectors would load fine and every search would quietly return noise
+                    app.logger.warning(f"Index shard {name} was {mismatch}; rebuilding it")
+                    stale.append(shard)
+                    continue
+                shard.model_name = Config.EMBED_MODEL
+                self.shards[name] = shard
+            # Shards of module files that no longer exist
+            for name in (os.listdir(shards_dir) if os.path.isdir(shards_dir) else []):
+                if name not in sources:
+                    IndexShard(name, self.index_dir, "").remove()
+        if stale:
+            # Only shards whose module file or embedding model changed are embedded again
+            with self._phase("index_build"):
+                for shard in stale:
+                    self._build_shard(shard)
+                    self.rebuilt_shards.append(shard.name)
+                write_index_model(self.index_dir, Config.EMBED_MODEL, self.embed_dim)
+        with self._phase("lexical_index"):
+            self._index_changed()
+
+    def _needs_build(self, sources: dict) -> bool:
+        """Whether a load would split the single index or rebuild a shard, judged without loading anything."""
+        if not os.path.isdir(os.path.join(self.index_dir, SHARD_DIR_NAME)):
+            return True
+        index_model = read_index_model(self.index_dir)
+        for name, (path, module) in sources.items():
+            shard = IndexShard(name, self.index_dir, path, module)
+            if not shard.is_current():
+                return True
+            recorded = shard.read_meta().get("embed_model")
+            if index_model_mismatch({"model_name": recorded} if recorded else index_model, Config.EMBED_MODEL, 0, 0):
+                return True
+        return False
+
+    def _prepare_index(self) -> None:
+        """
+        Bring the shards up to date for processes that load them, keeping
+        nothing loaded here. A process pool's workers each load the index, so
+        a full load in the parent as well would double its memory.
+        """
+        if not self._needs_build(self._module_sources()):
+            return
+        self._build_or_load_index()
+        self.shards = {}
+        self.embed_model = None
+        self._index_changed()
+
+    def _module_sources(self) -> dict:
+        """{shard name: (module file path, root page title)} for every module file in data_dir."""
+        sources = {}
+        for file in sorted(glob.glob(os.path.join(self.data_dir, "*.json"))):
+            with open(file, "r", encoding="utf-8") as f:
+                title = str(json.load(f).get("title", "")).strip()
+            sources[os.path.splitext(os.path.basename(file))[0]] = (file, title)
+        return sources
+
+    def _build_shard(self, shard: IndexShard) -> None:
+        with open(shard.source_path, "r", encoding="utf-8") as f:
+            documents = self.flatten_pages(json.load(f))
+        app.logger.info(f"Building index shard {shard.name} from {len(documents)} pages")
+        shard.build(self.embed_model, self._embed_chunks(documents), Config.VECTOR_QUANTIZATION,
+                    model_name=Config.EMBED_MODEL)
+        self.shards[shard.name] = shard
+
+    def _split_legacy_index(self, sources: dict) -> None:
+        """
+        One-off split of an index persisted as a single VectorStoreIndex into
+        per-module shards, reusing its vectors. A module missing from it, or
+        every module when it was built with another embedding model, is left
+        for the normal build.
+        """
+        vector_store = self._load_vector_store()
+        mismatch = index_model_mismatch(read_index_model(self.index_dir), Config.EMBED_MODEL, self.embed_dim,
+                                        vector_store.dim)
+        if mismatch:
+            app.logger.warning(f"Single index in {self.index_dir} was {mismatch}; building shards instead")
+            return
+        storage_context = StorageContext.from_defaults(persist_dir=self.index_dir, vector_store=vector_store)
+        index = load_index_from_storage(storage_context, embed_model=self.embed_model)
+
+        names = {module: name for name, (_, module) in sources.items()}
+        groups = {}
+        for node in index.docstore.docs.values():
+            name = names.get(str(node.metadata.get("title", "")).split(">")[0].strip())
+            if name is not None:
+                groups.setdefault(name, []).append(node)
+        for name, nodes in groups.items():
+            stored = [node for node in nodes if vector_store.has_node(node.node_id)]
+            for node, embedding in zip(stored, vector_store.get_embeddings([node.node_id for node in stored])):
+                node.embedding = embedding.tolist()
+            path, module = sources[name]
+            IndexShard(name, self.index_dir, path, module).build(self.embed_model, nodes, Config.VECTOR_QUANTIZATION,
+                                                                 model_name=Config.EMBED_MODEL)
+            app.logger.info(f"Split {len(nodes)} nodes of {module!r} from the single index into shard {name}")
+
+    def rebuild_shard(self, name: str) -> int:
+        """Re-embed one module file into its shard, leaving the other shards as they are. Returns its node count."""
+        sources = self._module_sources()
+        if name not in sources:
+            raise KeyError(f"No module file {name}.json in {self.data_dir}")
+        self._build_shard(IndexShard(name, self.index_dir, *sources[name]))
+        write_index_model(self.index_dir, Config.EMBED_MODEL, self.embed_dim)
+        self._index_changed()
+        return self.shards[name].count
+
+    def apply_changes(self, documents: list, removed_ids) -> int:
+        """
+        Replace the vectors of changed wiki pages and drop those of removed ones,
+        then persist the shards they touched. Only the given documents are
+        chunked and embedded, each into the shard of its module file.
+        Returns the number of chunks embedded.
+        """
+        stale = {str(doc.metadata["id"]) for doc in documents} | {str(page_id) for page_id in removed_ids}
+        touched = set()
+        for shard in self.shards.values():
+            # Look pages up by metadata id: indexes built before ids were stable used random ref doc ids
+            ref_doc_ids = [ref_doc_id for ref_doc_id, info in shard.index.docstore.get_all_ref_doc_info().items()
+                           if str(info.metadata.get("id")) in stale]
+            for ref_doc_id in ref_doc_ids:
+                shard.index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            if ref_doc_ids:
+                touched.add(shard.name)
+
+        sources = self._module_sources()
+        names = {module: name for name, (_, module) in sources.items()}
+        by_shard = {}
+        for doc in documents:
+            name = names.get(str(doc.metadata["title"]).split(">")[0].strip())
+            if name is None:
+                app.logger.warning(f"Page {doc.metadata['id']} is not in any module file, not indexed")
+                continue
+            by_shard.setdefault(name, []).append(doc)
+
+        embedded = 0
+        for name, shard_documents in by_shard.items():
+            nodes = self._embed_chunks(shard_documents)
+            embedded += len(nodes)
+            if name in self.shards:
+                if nodes:
+                    self.shards[name].index.insert_nodes(nodes)
+                touched.add(name)
+            else:
+                shard = IndexShard(name, self.index_dir, *sources[name])
+                shard.build(self.embed_model, nodes, Config.VECTOR_QUANTIZATION)
+                self.shards[name] = shard
+
+        for name in list(self.shards):
+            if name not in sources:
+                self.shards.pop(name).remove()
+            elif name in touched:
+                self.shards[name].persist()
+            else:
+                # Its module file may have been rewritten; the shard already matches it
+                self.shards[name].write_meta()
+        self._index_changed()
+        return embedded
+
+    def shard_stats(self) -> dict:
+        return {
+            "routing": Config.SHARD_ROUTING,
+            "module_routed_queries": self.module_routed,
+            **self.shard_router.stats(),
+            "shards": {name: shard.to_dict() for name, shard in self.shards.items()},
+        }
+
+    def cache_stats(self) -> dict:
+        return {
+            "index_version": self.index_version,
+            "embeddings": self.embedding_cache.stats(),
+            "results": self.result_cache.stats(),
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python -m app.services.rag_service [shard ...] re-embeds the named shards (all without arguments).
+    # Loading already rebuilds stale shards, those built with another EMBED_MODEL included.
+    pipeline = RAGPipeline(executor="none")
+    for shard_name in sys.argv[1:] or sorted(pipeline.shards):
+        if shard_name in pipeline.rebuilt_shards:
+            print(f"Rebuilt shard {shard_name} while loading: {pipeline.shards[shard_name].count} nodes")
+            continue
+        print(f"Rebuilt shard {shard_name}: {pipeline.rebuild_shard(shard_name)} nodes")
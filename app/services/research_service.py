@@ -0,0 +1,66 @@
+import asyncio
+import time
+from app import logger
+from app.services.metrics import RESEARCH_STAGE_SECONDS, RESEARCH_STAGE_FAILURES
+
+
+class ResearchPipeline:
+    """
+    Gathers context for a research_wrapper call without blocking the event loop.
+
+    Corpus retrieval runs concurrently with the rephrase -> web search chain.
+    Every stage has its own timeout; a stage that fails or runs out of time
+    contributes its fallback (the original question, or no results) so the
+    answer is built from whatever finished in time. Stage timings are logged
+    and kept on the session's context stats.
+    """
+
+    def __init__(self, rag_pipeline, web_search_service, rephrase_timeout: float = 3.0,
+                 search_timeout: float = 6.0, retrieval_timeout: float = 5.0):
+        self.rag_pipeline = rag_pipeline
+        self.web_search_service = web_search_service
+        self.rephrase_timeout = rephrase_timeout
+        self.search_timeout = search_timeout
+        self.retrieval_timeout = retrieval_timeout
+
+    async def _stage(self, name: str, awaitable, timeout: float, fallback, timings: dict):
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Research stage '{name}' timed out after {timeout}s")
+            RESEARCH_STAGE_FAILURES.inc(stage=name, reason="timeout")
+            return fallback
+        except Exception as e:
+            logger.error(f"Research stage '{name}' failed: {e}")
+            RESEARCH_STAGE_FAILURES.inc(stage=name, reason="error")
+            return fallback
+        finally:
+            elapsed = time.perf_counter() - started
+            RESEARCH_STAGE_SECONDS.observe(elapsed, stage=name)
+            timings[name] = round(elapsed, 3)
+
+    async def _web_results(self, question: str, chat_history, timings: dict) -> list:
+        rephrased_query = await self._stage(
+            "rephrase", self.web_search_service.arephrase_query(question, chat_history),
+            self.rephrase_timeout, question, timings
+        )
+        logger.info(f"Rephrased query: {rephrased_query}")
+        return await self._stage(
+            "search", self.web_search_service.aweb_search_results(rephrased_query),
+            self.search_timeout, [], timings
+        )
+
+    async def research(self, question: str, chat_history) -> tuple[list, list, dict]:
+        """Return (corpus chunks, web results, stage timings in seconds)."""
+        timings = {}
+        started = time.perf_counter()
+        context_chunks, web_results = await asyncio.gather(
+            self._stage("retrieval", self.rag_pipeline.aget_corpus_data(question),
+                        self.retrieval_timeout, [], timings),
+            self._web_results(question, chat_history, timings)
+        )
+        timings["total"] = round(time.perf_counter() - started, 3)
+        logger.info(f"Research for '{question}': {len(context_chunks)} corpus chunks, "
+                    f"{len(web_results)} web results, timings {timings}")
+        return context_chunks, web_results, timings
@@ -0,0 +1,206 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from app import logger
+from app.services.metrics import QUERY_EMBEDDING_SECONDS
+
+
+class RetrievalQueueFull(Exception):
+    """Raised when more retrievals are waiting than the executor queue allows."""
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent query embeddings into one batched model call.
+
+    The first caller opens a batch and waits up to max_wait_ms for others to
+    join; the batch is flushed early once it reaches max_batch_size. The model
+    call itself runs on the executor so the event loop is never blocked.
+    Batches in flight are held in _tasks, since the event loop only keeps a
+    weak reference to a task; close() cancels them.
+    """
+
+    def __init__(self, embed_fn, executor, max_batch_size: int = 16, max_wait_ms: float = 5):
+        self.embed_fn = embed_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending = []
+        self._flush_handle = None
+        self._tasks = set()
+        self.batches = 0
+        self.embedded = 0
+
+    async def embed(self, text: str) -> list:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list):
+        texts = [text for text, _ in batch]
+        try:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            embeddings = await loop.run_in_executor(self.executor, self.embed_fn, texts)
+            QUERY_EMBEDDING_SECONDS.observe(time.perf_counter() - started, path="batched")
+            self.batches += 1
+            self.embedded += len(texts)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    def close(self):
+        """Cancel the batches in flight and any queries still waiting for a batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        for _, future in batch:
+            future.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+
+# Per-process pipeline used when retrieval runs in a process pool
+_worker_pipeline = None
+
+
+def _init_process_worker(data_dir: str, index_dir: str):
+    global _worker_pipeline
+    from app.services.rag_service import RAGPipeline
+    _worker_pipeline = RAGPipeline(data_dir=data_dir, index_dir=index_dir, executor="none")
+
+
+def _process_get_corpus_data(question: str, top_k: int) -> list:
+    return _worker_pipeline.get_corpus_data(question, top_k)
+
+
+def _process_get_corpus_data_batch(questions: list, top_k: int) -> list:
+    return _worker_pipeline.get_corpus_data_batch(questions, top_k)
+
+
+class RetrievalExecutor:
+    """
+    Runs RAGPipeline retrieval off the event loop.
+
+    In "thread" mode query embeddings from concurrent callers are batched
+    through EmbeddingBatcher and the vector search runs on the same thread
+    pool. In "process" mode each worker process loads its own pipeline and
+    runs the whole retrieval, trading memory for CPU parallelism. Either way
+    at most queue_size retrievals may be outstanding and each call is bounded
+    by a timeout. A retrieval holds its queue slot until its work is done,
+    not until its caller stops waiting, so timed-out work still counts
+    while it occupies the pool.
+    """
+
+    def __init__(self, pipeline, kind: str = "thread", workers: int = 2, queue_size: int = 32,
+                 timeout: float = 10.0, batch_size: int = 16, batch_wait_ms: float = 5):
+        self.pipeline = pipeline
+        self.kind = kind
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._outstanding = 0
+        self._tasks = set()
+
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_process_worker,
+                initargs=(pipeline.data_dir, pipeline.index_dir)
+            )
+            self.batcher = None
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+            self.batcher = EmbeddingBatcher(pipeline.embed_queries, self.executor, batch_size, batch_wait_ms)
+
+    def _admit(self, work) -> asyncio.Task:
+        """Run the work coroutine as a task holding a queue slot until it finishes."""
+        if self._outstanding >= self.queue_size:
+            work.close()
+            raise RetrievalQueueFull(f"{self._outstanding} retrievals already queued")
+        self._outstanding += 1
+        task = asyncio.ensure_future(work)
+        self._tasks.add(task)
+        task.add_done_callback(self._release)
+        return task
+
+    def _release(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._outstanding -= 1
+        # Nobody may be waiting any more; a failure is logged rather than reported as never retrieved
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Retrieval failed: {task.exception()!r}")
+
+    async def get_corpus_data(self, question: str, top_k: int = 2, timeout: float | None = None) -> list:
+        task = self._admit(self._retrieve(question, top_k))
+        # Shielded: on timeout the caller gives up, but the work keeps its slot until the pool is done with it
+        return await asyncio.wait_for(asyncio.shield(task), timeout or self.timeout)
+
+    async def get_corpus_data_batch(self, questions: list, top_k: int = 2) -> list:
+        """
+        Retrieve for many questions as one job on one worker. It takes a single
+        queue slot and no timeout, since its duration grows with the batch.
+        """
+        async def work():
+            loop = asyncio.get_running_loop()
+            if self.batcher is None:
+                return await loop.run_in_executor(self.executor, _process_get_corpus_data_batch, questions, top_k)
+            return await loop.run_in_executor(self.executor, self.pipeline.get_corpus_data_batch, questions, top_k)
+
+        return await asyncio.shield(self._admit(work()))
+
+    async def _retrieve(self, question: str, top_k: int) -> list:
+        loop = asyncio.get_running_loop()
+        if self.batcher is None:
+            return await loop.run_in_executor(self.executor, _process_get_corpus_data, question, top_k)
+
+        query_context = self.pipeline.query_context(question)
+        cached = self.pipeline.cached_results(query_context, top_k)
+        if cached is not None:
+            return cached
+
+        embedding = self.pipeline.cached_embedding(query_context)
+        if embedding is None:
+            embedding = await self.batcher.embed(query_context)
+            self.pipeline.cache_embedding(query_context, embedding)
+        return await loop.run_in_executor(self.executor, self.pipeline.search_index, query_context, embedding, top_k)
+
+    def stats(self) -> dict:
+        stats = {"kind": self.kind, "outstanding": self._outstanding, "queue_size": self.queue_size}
+        if self.batcher is not None:
+            stats["embedding_batches"] = self.batcher.batches
+            stats["embedded_queries"] = self.batcher.embedded
+        return stats
+
+    def shutdown(self):
+        logger.info("Shutting down retrieval executor")
+        if self.batcher is not None:
+            self.batcher.close()
+        for task in list(self._tasks):
+            task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import struct
+from app import logger
+from app.services.retrieval_executor import RetrievalQueueFull
+from app.services.startup import IndexNotReady, IndexLoader, StartupTracker
+
+_HEADER = struct.Struct("!I")
+
+
+async def _send(writer: asyncio.StreamWriter, message: dict) -> None:
+    payload = json.dumps(message).encode("utf-8")
+    writer.write(_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def _receive(reader: asyncio.StreamReader) -> dict:
+    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return json.loads(await reader.readexactly(length))
+
+
+class RetrievalServer:
+    """
+    Owns the one copy of the embedding model and index when several uvicorn
+    workers run, and answers their retrievals over a Unix socket.
+
+    Requests are length-prefixed JSON. Queries from all workers go through
+    the same RetrievalExecutor, so they share its embedding batches and its
+    query and result caches. Runs in its own process, started by main.py.
+    """
+
+    def __init__(self, socket_path: str, **pipeline_kwargs):
+        self.socket_path = socket_path
+        self.loader = IndexLoader(StartupTracker(), **pipeline_kwargs)
+
+    async def _answer(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "status":
+            return {"ok": True, "status": self.loader.status()}
+        if op == "stats":
+            return {"ok": True, "stats": await self.loader.aretrieval_stats()}
+        if op in ("corpus", "corpus_batch"):
+            try:
+                if op == "corpus_batch":
+                    chunks = await self.loader.aget_corpus_data_batch(request["questions"], request.get("top_k", 2))
+                else:
+                    chunks = await self.loader.aget_corpus_data(request["question"], request.get("top_k", 2),
+                                                                request.get("timeout"))
+                return {"ok": True, "chunks": chunks}
+            except IndexNotReady as e:
+                return {"ok": False, "error": "not_ready", "message": str(e)}
+            except RetrievalQueueFull as e:
+                return {"ok": False, "error": "queue_full", "message": str(e)}
+            except asyncio.TimeoutError:
+                return {"ok": False, "error": "timeout", "message": "Retrieval timed out"}
+        return {"ok": False, "error": "bad_request", "message": f"Unknown op {op!r}"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await _receive(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    response = await self._answer(request)
+                except Exception as e:
+                    logger.error(f"Retrieval server request failed: {e}", exc_info=True)
+                    response = {"ok": False, "error": "internal", "message": str(e)}
+                await _send(writer, response)
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.loader.start()
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info(f"Retrieval server listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.loader.shutdown()
+
+
+def run_retrieval_server(socket_path: str, **pipeline_kwargs) -> None:
+    """Process entry point for the shared retrieval server."""
+    asyncio.run(RetrievalServer(socket_path, **pipeline_kwargs).serve())
+
+
+class RetrievalClient:
+    """
+    A worker's handle on the RetrievalServer, used in place of the pipeline.
+
+    Mirrors IndexLoader: ready and status() come from a background poll of
+    the server, aget_corpus_data raises IndexNotReady, RetrievalQueueFull and
+    asyncio.TimeoutError like the local pipeline does. Each call opens a
+    short-lived Unix socket connection.
+    """
+
+    def __init__(self, socket_path: str, poll_interval: float = 1.0):
+        self.socket_path = socket_path
+        self.poll_interval = poll_interval
+        self._status = {"ready": False, "state": "connecting", "error": None}
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self._status["ready"]
+
+    def status(self) -> dict:
+        return {**self._status, "shared": True}
+
+    async def _call(self, request: dict, timeout: float | None = None) -> dict:
+        async def exchange():
+            reader, writer = await asyncio.open_unix_connection(self.socket_path)
+            try:
+                await _send(writer, request)
+                return await _receive(reader)
+            finally:
+                writer.close()
+
+        try:
+            return await asyncio.wait_for(exchange(), timeout)
+        except (FileNotFoundError, ConnectionError, asyncio.IncompleteReadError) as e:
+            raise IndexNotReady(f"Retrieval server unavailable: {e}")
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                self._status = (await self._call({"op": "status"}, timeout=5))["status"]
+            except (IndexNotReady, asyncio.TimeoutError) as e:
+                self._status = {"ready": False, "state": "connecting", "error": str(e)}
+            await asyncio.sleep(self.poll_interval if not self._status["ready"] else self.poll_interval * 10)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._poll())
+
+    def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def aget_corpus_data(self, question: str, top_k: int = 2, timeout: float | None = None) -> list:
+        # The server applies the timeout; the margin covers the socket round trip
+        response = await self._call({"op": "corpus", "question": question, "top_k": top_k, "timeout": timeout},
+                                    timeout=(timeout + 1) if timeout else None)
+        return self._chunks(response)
+
+    async def aget_corpus_data_batch(self, questions: list, top_k: int = 2) -> list:
+        return self._chunks(await self._call({"op": "corpus_batch", "questions": questions, "top_k": top_k}))
+
+    @staticmethod
+    def _chunks(response: dict) -> list:
+        if response["ok"]:
+            return response["chunks"]
+        if response["error"] == "not_ready":
+            raise IndexNotReady(response["message"])
+        if response["error"] == "queue_full":
+            raise RetrievalQueueFull(response["message"])
+        if response["error"] == "timeout":
+            raise asyncio.TimeoutError(response["message"])
+        raise RuntimeError(response["message"])
+
+    async def aretrieval_stats(self) -> dict:
+        try:
+            return (await self._call({"op": "stats"}, timeout=5))["stats"]
+        except (IndexNotReady, asyncio.TimeoutError):
+            return {}
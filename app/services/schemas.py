@@ -1,16 +1,34 @@
 import re
+from typing import Annotated, List, Optional
 from pydantic import BaseModel, Field, field_validator
+from app.config import Config
+
+
+def clean_question(v: str) -> str:
+    v = re.sub(r'<[^>]+>', '', v)  # Remove HTML tags
+    v = re.sub(r'[\x00-\x1F\x7F-\x9F]', '', v)
+    if not v.strip():
+        raise ValueError('Question cannot be empty or whitespace')
+    return v
 
 
 class ChatRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=1000)
     research_mode: bool = False
+    session_id: Optional[str] = Field(None, min_length=1, max_length=64, pattern=r'^[A-Za-z0-9_\-]+$')
 
     @field_validator('question')
     @classmethod
     def no_empty_or_whitespace(cls, v: str):
-        v = re.sub(r'<[^>]+>', '', v)  # Remove HTML tags
-        v = re.sub(r'[\x00-\x1F\x7F-\x9F]', '', v)
-        if not v.strip():
-            raise ValueError('Question cannot be empty or whitespace')
-        return v
+        return clean_question(v)
+
+
+class BatchRequest(BaseModel):
+    questions: List[Annotated[str, Field(min_length=1, max_length=1000)]] = Field(..., min_length=1,
+                                                                               max_length=Config.BATCH_MAX_QUESTIONS)
+    top_k: int = Field(2, ge=1, le=10)
+
+    @field_validator('questions')
+    @classmethod
+    def clean_questions(cls, v: list):
+        return [clean_question(question) for question in v]
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from app import logger
+from app.services.query_cache import normalize_query
+
+
+class SearchCache:
+    """
+    Web search results keyed by normalized query, with a TTL, LRU eviction
+    beyond max_entries and single-flight coalescing of concurrent lookups.
+
+    Expiry uses wall-clock time so entries written to persist_path stay
+    meaningful across restarts; load() drops whatever expired meanwhile.
+    Failed searches are never cached, and every caller waiting on a
+    coalesced search sees the same exception.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: int = 21600, persist_path: str | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(query: str, num_results: int) -> str:
+        return f"{num_results}:{normalize_query(query)}"
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            results, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, key: str, results: list) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (results, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def get_or_fetch(self, key: str, fetch) -> list:
+        """
+        Return cached results for key, or await fetch() once for all concurrent
+        callers. The fetch runs as its own task, so a caller that times out or is
+        cancelled does not cancel it for the others, and its result is still cached.
+        """
+        results = self.get(key)
+        if results is not None:
+            return results
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._fetch_done(key, done))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, fetch) -> list:
+        results = await fetch()
+        self.put(key, results)
+        return results
+
+    def _fetch_done(self, key: str, task) -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            # Retrieve the exception so a search nobody awaited anymore is not reported as unhandled
+            task.exception()
+
+    def load(self) -> None:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load search cache from {self.persist_path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, results, expires_at in entries:
+                if expires_at > now:
+                    self._entries[key] = (results, expires_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"Loaded {len(self._entries)} cached web searches")
+
+    def save(self) -> None:
+        if not self.persist_path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[key, results, expires_at] for key, (results, expires_at) in self._entries.items()
+                       if expires_at > now]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            logger.error(f"Could not save search cache to {self.persist_path}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
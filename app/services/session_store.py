@@ -0,0 +1,139 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from app import logger
+from app.services.tokens import count_tokens, truncate_to_tokens
+
+
+class ChatSession:
+    """Conversation state for one client session, bounded by a token budget."""
+
+    SUMMARY_MAX_TOPICS = 8
+    SUMMARY_TOPIC_CHARS = 120
+
+    def __init__(self, session_id: str, token_budget: int):
+        self.session_id = session_id
+        self.token_budget = token_budget
+        self.turns = []
+        self.summary_topics = deque(maxlen=self.SUMMARY_MAX_TOPICS)
+        self.token_count = 0
+        self.byte_size = 0
+        self.last_access = time.monotonic()
+
+    @property
+    def chat_history(self) -> list:
+        """The bounded user/bot exchanges kept for this session."""
+        return [{'user': turn['user'], 'bot': turn['bot']} for turn in self.turns]
+
+    @property
+    def summary(self) -> str:
+        if not self.summary_topics:
+            return ""
+        return "Earlier in this conversation the user asked about: " + "; ".join(self.summary_topics)
+
+    def history_messages(self) -> list:
+        """Chat completion messages for the retained history, oldest first."""
+        messages = []
+        if self.summary_topics:
+            messages.append({"role": "system", "content": self.summary})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn['user']})
+            messages.append({"role": "assistant", "content": turn['bot']})
+        return messages
+
+    def add_turn(self, user_message: str, bot_response: str) -> int:
+        """
+        Append an exchange and trim the oldest turns into the summary until the
+        session fits its token budget. Returns the change in byte size.
+        """
+        before = self.byte_size
+        tokens = count_tokens(user_message) + count_tokens(bot_response)
+        if tokens > self.token_budget:
+            # A single oversized answer still has to fit; keep its beginning.
+            bot_response = truncate_to_tokens(bot_response, max(self.token_budget - count_tokens(user_message), 0))
+            tokens = count_tokens(user_message) + count_tokens(bot_response)
+
+        self.turns.append({'user': user_message, 'bot': bot_response, 'tokens': tokens})
+        self.token_count += tokens
+        self.byte_size += len(user_message) + len(bot_response)
+
+        while self.token_count > self.token_budget and len(self.turns) > 1:
+            oldest = self.turns.pop(0)
+            self.token_count -= oldest['tokens']
+            self.byte_size -= len(oldest['user']) + len(oldest['bot'])
+            self.summary_topics.append(oldest['user'][:self.SUMMARY_TOPIC_CHARS])
+
+        return self.byte_size - before
+
+
+class SessionStore:
+    """
+    In-process store of chat sessions keyed by client-supplied session id, with
+    LRU eviction, an idle TTL and a hard cap on the bytes of retained history.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: int = 1800,
+                 token_budget: int = 2000, max_bytes: int = 50 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get_or_create(self, session_id: str | None = None) -> ChatSession:
+        """Return the session for session_id, creating it (with a fresh id if None) when absent."""
+        with self._lock:
+            now = time.monotonic()
+            self._purge_expired(now)
+            if session_id is None:
+                session_id = uuid.uuid4().hex
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id, self.token_budget)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._evict_oldest()
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = now
+            return session
+
+    def add_turn(self, session: ChatSession, user_message: str, bot_response: str) -> None:
+        """Record an exchange on session and enforce the global memory cap."""
+        with self._lock:
+            delta = session.add_turn(user_message, bot_response)
+            if self._sessions.get(session.session_id) is session:
+                self._total_bytes += delta
+            while self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+                if next(iter(self._sessions)) == session.session_id:
+                    self._sessions.move_to_end(session.session_id)
+                self._evict_oldest()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _purge_expired(self, now: float) -> None:
+        # Sessions are kept in access order, so expired ones are at the front.
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_access < self.ttl_seconds:
+                break
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        session_id, session = self._sessions.popitem(last=False)
+        self._total_bytes -= session.byte_size
+        logger.debug(f"Evicted chat session {session_id}")
@@ -0,0 +1,230 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from limits.storage import Storage
+from app.services.search_cache import SearchCache
+from app.services.session_store import ChatSession, SessionStore
+
+
+class SQLiteState:
+    """
+    One SQLite database shared by every worker process on the host.
+
+    Each thread gets its own connection in WAL mode, so readers never block
+    the single writer and concurrent writers wait up to busy_timeout instead
+    of failing. Put the file on /dev/shm to keep it in shared memory.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction that takes the lock up front, so read-modify-write is atomic."""
+        db = self.connection
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+
+class SQLiteLimitStorage(Storage):
+    """
+    Rate-limit counters for the limits package in a SQLite file, so slowapi
+    limits hold across uvicorn workers. Registered for "sqlite:///<path>"
+    storage URIs; supports the fixed-window strategy slowapi uses by default.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        self.state = SQLiteState(uri.split("://", 1)[1])
+        with self.state.transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS rate_limits "
+                       "(key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)")
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        now = time.time()
+        with self.state.transaction() as db:
+            db.execute("DELETE FROM rate_limits WHERE key = ? AND expires_at <= ?", (key, now))
+            db.execute("INSERT INTO rate_limits (key, value, expires_at) VALUES (?, ?, ?) "
+                       "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                       (key, amount, now + expiry))
+            return db.execute("SELECT value FROM rate_limits WHERE key = ?", (key,)).fetchone()[0]
+
+    def get(self, key: str) -> int:
+        row = self.state.connection.execute(
+            "SELECT value FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self.state.connection.execute(
+            "SELECT expires_at FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self.state.connection.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int | None:
+        with self.state.transaction() as db:
+            return db.execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        with self.state.transaction() as db:
+            db.execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+
+class SQLiteSearchCache(SearchCache):
+    """
+    SearchCache whose entries live in the shared SQLite file, so every worker
+    reuses every other worker's web searches. Concurrent identical searches
+    are still coalesced within a worker; hit and miss counters are per worker.
+    """
+
+    def __init__(self, state: SQLiteState, max_entries: int = 512, ttl_seconds: int = 21600):
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.state = state
+        with self.state.transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS search_cache "
+                       "(key TEXT PRIMARY KEY, results TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def get(self, key: str):
+        row = self.state.connection.execute(
+            "SELECT results FROM search_cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, results: list) -> None:
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        with self.state.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO search_cache (key, results, expires_at) VALUES (?, ?, ?)",
+                       (key, json.dumps(results), now + self.ttl_seconds))
+            db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (now,))
+            # Entries share one TTL, so the soonest to expire are the oldest
+            evicted = db.execute("DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache "
+                                 "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+        with self._lock:
+            self.evictions += evicted
+
+    def load(self) -> None:
+        # Entries are already persistent
+        pass
+
+    def save(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["entries"] = self.state.connection.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        return stats
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SessionStore backed by the shared SQLite file, so a conversation can
+    continue on any worker.
+
+    get_or_create() returns a ChatSession rebuilt from its row; add_turn()
+    re-reads the row inside a write transaction, applies the exchange and
+    writes it back, so turns recorded concurrently by two workers are both
+    kept. The idle TTL, session cap and byte cap are enforced on the table.
+    """
+
+    def __init__(self, state: SQLiteState, max_sessions: int = 1000, ttl_seconds: int = 1800,
+                 token_budget: int = 2000, max_bytes: int = 50 * 1024 * 1024):
+        super().__init__(max_sessions, ttl_seconds, token_budget, max_bytes)
+        self.state = state
+        with self.state.transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS chat_sessions (session_id TEXT PRIMARY KEY, turns TEXT NOT NULL, "
+                       "summary_topics TEXT NOT NULL, token_count INTEGER NOT NULL, byte_size INTEGER NOT NULL, "
+                       "last_access REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS chat_sessions_last_access ON chat_sessions (last_access)")
+
+    def __len__(self):
+        return self.state.connection.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+
+    def _load(self, db, session: ChatSession) -> bool:
+        row = db.execute("SELECT turns, summary_topics, token_count, byte_size FROM chat_sessions "
+                         "WHERE session_id = ?", (session.session_id,)).fetchone()
+        if row is None:
+            return False
+        session.turns = json.loads(row[0])
+        session.summary_topics.clear()
+        session.summary_topics.extend(json.loads(row[1]))
+        session.token_count, session.byte_size = row[2], row[3]
+        return True
+
+    def get_or_create(self, session_id: str | None = None) -> ChatSession:
+        now = time.time()
+        with self.state.transaction() as db:
+            db.execute("DELETE FROM chat_sessions WHERE last_access <= ?", (now - self.ttl_seconds,))
+            session = ChatSession(session_id or uuid.uuid4().hex, self.token_budget)
+            if self._load(db, session):
+                db.execute("UPDATE chat_sessions SET last_access = ? WHERE session_id = ?", (now, session.session_id))
+        return session
+
+    def add_turn(self, session: ChatSession, user_message: str, bot_response: str) -> None:
+        now = time.time()
+        with self.state.transaction() as db:
+            # Pick up turns another worker recorded since this request read the session
+            self._load(db, session)
+            session.add_turn(user_message, bot_response)
+            db.execute("INSERT OR REPLACE INTO chat_sessions VALUES (?, ?, ?, ?, ?, ?)",
+                       (session.session_id, json.dumps(session.turns), json.dumps(list(session.summary_topics)),
+                        session.token_count, session.byte_size, now))
+            db.execute("DELETE FROM chat_sessions WHERE session_id IN (SELECT session_id FROM chat_sessions "
+                       "ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_sessions,))
+            total_bytes = db.execute("SELECT COALESCE(SUM(byte_size), 0) FROM chat_sessions").fetchone()[0]
+            while total_bytes > self.max_bytes:
+                oldest = db.execute("SELECT session_id, byte_size FROM chat_sessions WHERE session_id != ? "
+                                    "ORDER BY last_access LIMIT 1", (session.session_id,)).fetchone()
+                if oldest is None:
+                    break
+                db.execute("DELETE FROM chat_sessions WHERE session_id = ?", (oldest[0],))
+                total_bytes -= oldest[1]
+
+    def stats(self) -> dict:
+        count, total_bytes = self.state.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(byte_size), 0) FROM chat_sessions").fetchone()
+        return {
+            "sessions": count,
+            "bytes": total_bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "backend": "sqlite",
+        }
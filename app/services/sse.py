@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator
+from starlette.requests import Request
+from app import logger
+from app.services.metrics import SSE_FRAMES, SSE_BYTES, SSE_DISCONNECTS
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+_END = object()
+_TIMEOUT = object()
+
+
+def encode_event(event: dict) -> bytes:
+    return b"data: " + _encode(event).encode("utf-8") + b"\n\n"
+
+
+class SSEStream:
+    """
+    Turns the chatbot's event dicts into SSE frames for a StreamingResponse.
+
+    Consecutive {'content': ...} deltas are coalesced into one frame until
+    flush_interval has passed since the first of them or flush_bytes of text
+    is waiting; any other event flushes them and goes out as its own frame.
+
+    Events are pulled by a separate task through a bounded queue, so a slow
+    client pauses the upstream read instead of buffering the whole reply.
+    When the client disconnects, noticed by polling the request or by the
+    server cancelling the response, that task is cancelled and the event
+    generator closed, which closes the model stream.
+    """
+
+    def __init__(self, events: AsyncIterator[dict], request: Request | None = None, flush_interval: float = 0.05,
+                 flush_bytes: int = 512, queue_size: int = 64, disconnect_poll: float = 0.5):
+        self.events = events
+        self.request = request
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.disconnect_poll = disconnect_poll
+        self.frames = 0
+        self.bytes = 0
+        self.disconnected = False
+        self._queue = asyncio.Queue(maxsize=queue_size)
+
+    async def _pump(self) -> None:
+        try:
+            async for event in self.events:
+                await self._queue.put(event)
+        except Exception as e:
+            logger.error(f"SSE event source failed: {e}", exc_info=True)
+        finally:
+            # Also runs on cancellation, when the generator may be parked at a yield
+            aclose = getattr(self.events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        await self._queue.put(_END)
+
+    async def _next_event(self, timeout: float | None):
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        if timeout is not None and timeout <= 0:
+            return _TIMEOUT
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return _TIMEOUT
+
+    def _frame(self, event: dict) -> bytes:
+        frame = encode_event(event)
+        self.frames += 1
+        self.bytes += len(frame)
+        return frame
+
+    async def __aiter__(self):
+        pump = asyncio.ensure_future(self._pump())
+        pending = []
+        pending_size = 0
+        flush_at = None
+        next_poll = time.monotonic() + self.disconnect_poll
+        try:
+            while True:
+                timeout = None if flush_at is None else flush_at - time.monotonic()
+                if self.request is not None:
+                    poll_in = next_poll - time.monotonic()
+                    timeout = poll_in if timeout is None else min(timeout, poll_in)
+                event = await self._next_event(timeout)
+
+                if self.request is not None and time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + self.disconnect_poll
+                    if await self.request.is_disconnected():
+                        self.disconnected = True
+                        return
+
+                if event is _END:
+                    break
+                is_delta = event is not _TIMEOUT and len(event) == 1 and "content" in event
+                is_other = event is not _TIMEOUT and not is_delta
+                if is_delta:
+                    pending.append(event["content"])
+                    pending_size += len(event["content"])
+                    if flush_at is None:
+                        flush_at = time.monotonic() + self.flush_interval
+                if pending and (is_other or pending_size >= self.flush_bytes or time.monotonic() >= flush_at):
+                    yield self._frame({"content": "".join(pending)})
+                    pending.clear()
+                    pending_size = 0
+                    flush_at = None
+                if is_other:
+                    yield self._frame(event)
+
+            if pending:
+                yield self._frame({"content": "".join(pending)})
+        except asyncio.CancelledError:
+            # The server cancels the response when it sees the disconnect first
+            self.disconnected = True
+            raise
+        finally:
+            # Synchronous so it also completes inside a cancelled scope
+            pump.cancel()
+            if self.disconnected:
+                SSE_DISCONNECTS.inc()
+            SSE_FRAMES.observe(self.frames)
+            SSE_BYTES.observe(self.bytes)
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from app import logger
+
+
+class IndexNotReady(Exception):
+    """Raised when the RAG pipeline is used before its background load has finished."""
+
+
+class StartupTracker:
+    """
+    Wall-clock time of each startup phase, in the order the phases ran.
+
+    Import phases are recorded by app/__init__.py and load phases by the
+    background index loader, so /ready shows where a slow start went.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.current = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = round(seconds, 3)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        self.current = name
+        try:
+            yield
+        finally:
+            self.current = None
+            self.record(name, time.perf_counter() - started)
+            logger.info(f"Startup phase '{name}' took {self.phases[name]}s")
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "current_phase": self.current,
+                "phases": dict(self.phases),
+                "uptime_seconds": round(time.perf_counter() - self.started, 3),
+            }
+
+
+class IndexLoader:
+    """
+    Stands in for the RAGPipeline while it loads on a background thread.
+
+    start() begins importing llama_index and loading the embedding model and
+    index without holding up the server. Until the pipeline is ready every
+    attribute access raises IndexNotReady; afterwards attributes are those of
+    the loaded pipeline, so callers use the loader as the pipeline itself.
+    """
+
+    def __init__(self, tracker: StartupTracker, **pipeline_kwargs):
+        self._tracker = tracker
+        self._pipeline_kwargs = pipeline_kwargs
+        self._pipeline = None
+        self._task = None
+        self.state = "pending"
+        self.error = None
+
+    @property
+    def ready(self) -> bool:
+        return self._pipeline is not None
+
+    def __getattr__(self, name):
+        # Only reached for attributes the loader itself does not define
+        pipeline = self.__dict__.get("_pipeline")
+        if pipeline is None:
+            raise IndexNotReady(f"Index is {self.__dict__.get('state', 'pending')}")
+        return getattr(pipeline, name)
+
+    def _load(self):
+        with self._tracker.phase("import_rag"):
+            from app.services.rag_service import RAGPipeline
+        with self._tracker.phase("pipeline"):
+            return RAGPipeline(tracker=self._tracker, **self._pipeline_kwargs)
+
+    async def _run(self) -> None:
+        self.state = "loading"
+        try:
+            self._pipeline = await asyncio.to_thread(self._load)
+            self.state = "ready"
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Index load failed: {e}", exc_info=True)
+
+    def start(self) -> None:
+        """Begin the background load; called from the app lifespan."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def wait(self) -> None:
+        if self._task is not None:
+            await self._task
+
+    def shutdown(self) -> None:
+        if self._pipeline is not None and self._pipeline.retrieval_executor is not None:
+            self._pipeline.retrieval_executor.shutdown()
+
+    async def aretrieval_stats(self) -> dict:
+        """Query cache, shard and executor stats, empty until the pipeline has loaded."""
+        if self._pipeline is None:
+            return {}
+        stats = {"cache": self._pipeline.cache_stats(), "shards": self._pipeline.shard_stats()}
+        if self._pipeline.retrieval_executor is not None:
+            stats["executor"] = self._pipeline.retrieval_executor.stats()
+        return stats
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "state": self.state, "error": self.error, **self._tracker.to_dict()}
@@ -0,0 +1,38 @@
+from functools import lru_cache
+import tiktoken
+from app import logger
+
+ENCODING_NAME = "o200k_base"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        # The BPE file is downloaded on first use; degrade to an estimate if that fails.
+        logger.error(f"Could not load tiktoken encoding {ENCODING_NAME}: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in text, estimating ~4 characters per token if tiktoken is unavailable."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
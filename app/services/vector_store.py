@@ -0,0 +1,337 @@
+import json
+import os
+from typing import Any
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from app import logger
+
+VECTOR_DIR_NAME = "vectors"
+LEGACY_VECTOR_STORE_FILE = "default__vector_store.json"
+QUANTIZATIONS = ("float32", "float16", "int8")
+FORMAT_VERSION = 1
+
+# Rows scored per matrix product, so int8/float16 upcasts never copy the whole store
+_SEARCH_BLOCK_ROWS = 8192
+# Queries scored together by query_batch, bounding the (rows, queries) score matrix
+_SEARCH_BATCH_QUERIES = 256
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store backed by one contiguous (n, dim) array on disk.
+
+    Vectors are L2-normalized on insert so cosine similarity is a single
+    matrix-vector product. They are stored as float32, float16 or int8 (with
+    a float32 scale per row) and loaded with np.load(mmap_mode="r"), so
+    startup does no parsing and every uvicorn worker shares the same page
+    cache. Writes happen in memory and are persisted by atomically replacing
+    the files, leaving readers of the previous version undisturbed.
+
+    Only embeddings and ids live here; node text stays in the docstore, as
+    with the default SimpleVectorStore.
+    """
+
+    stores_text: bool = False
+    is_embedding_query: bool = True
+    persist_dir: str | None = None
+    quantization: str = "float32"
+
+    _vectors: Any = PrivateAttr(default=None)
+    _scales: Any = PrivateAttr(default=None)
+    _node_ids: list = PrivateAttr(default_factory=list)
+    _ref_doc_ids: list = PrivateAttr(default_factory=list)
+    _positions: dict = PrivateAttr(default_factory=dict)
+
+    def __init__(self, persist_dir: str | None = None, quantization: str = "float32", **kwargs: Any):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        super().__init__(persist_dir=persist_dir, quantization=quantization, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def count(self) -> int:
+        # Not __len__: StorageContext tests the store for truthiness and would drop an empty one
+        return len(self._node_ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self._vectors.shape[1]) if self.count else 0
+
+    @classmethod
+    def from_persist_dir(cls, index_dir: str, quantization: str = "float32") -> "MmapVectorStore":
+        """
+        Memory-map the store under index_dir. A missing store is returned empty;
+        an existing one keeps the quantization it was written with.
+        """
+        persist_dir = os.path.join(index_dir, VECTOR_DIR_NAME)
+        meta_path = os.path.join(persist_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return cls(persist_dir=persist_dir, quantization=quantization)
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(persist_dir, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+
+        if meta["quantization"] != quantization:
+            logger.info(f"Vector store is {meta['quantization']}, ignoring configured {quantization}")
+        store = cls(persist_dir=persist_dir, quantization=meta["quantization"])
+        vectors = np.load(os.path.join(persist_dir, "vectors.npy"), mmap_mode="r")
+        if vectors.shape[0] != meta["count"] or len(ids["node_ids"]) != meta["count"]:
+            raise ValueError(f"Vector store at {persist_dir} is inconsistent; rebuild the index")
+        if meta["quantization"] == "int8":
+            store._scales = np.load(os.path.join(persist_dir, "scales.npy"), mmap_mode="r")
+        store._vectors = vectors
+        store._set_ids(ids["node_ids"], ids["ref_doc_ids"])
+        return store
+
+    @classmethod
+    def from_legacy_json(cls, index_dir: str, quantization: str = "float32") -> "MmapVectorStore":
+        """Convert the SimpleVectorStore JSON written by earlier versions."""
+        with open(os.path.join(index_dir, LEGACY_VECTOR_STORE_FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        embedding_dict = data.get("embedding_dict", {})
+        ref_doc_ids = data.get("text_id_to_ref_doc_id", {})
+
+        store = cls(persist_dir=os.path.join(index_dir, VECTOR_DIR_NAME), quantization=quantization)
+        node_ids = list(embedding_dict)
+        if node_ids:
+            store._append(
+                node_ids,
+                [ref_doc_ids.get(node_id) for node_id in node_ids],
+                np.asarray([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32)
+            )
+        return store
+
+    def _set_ids(self, node_ids: list, ref_doc_ids: list) -> None:
+        self._node_ids = list(node_ids)
+        self._ref_doc_ids = list(ref_doc_ids)
+        self._positions = {node_id: i for i, node_id in enumerate(self._node_ids)}
+
+    def _quantize(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        if self.quantization == "float16":
+            return vectors.astype(np.float16), None
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+            return quantized, scales.astype(np.float32)
+        return vectors.astype(np.float32), None
+
+    def _append(self, node_ids: list, ref_doc_ids: list, embeddings: np.ndarray) -> None:
+        vectors, scales = self._quantize(_normalize(embeddings))
+        if self._vectors is None or len(self._node_ids) == 0:
+            self._vectors, self._scales = vectors, scales
+        else:
+            if vectors.shape[1] != self._vectors.shape[1]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store ({self._vectors.shape[1]})")
+            self._vectors = np.concatenate([self._vectors, vectors])
+            if scales is not None:
+                self._scales = np.concatenate([self._scales, scales])
+        self._set_ids(self._node_ids + list(node_ids), self._ref_doc_ids + list(ref_doc_ids))
+
+    def _keep_rows(self, keep: np.ndarray) -> None:
+        self._vectors = np.ascontiguousarray(self._vectors[keep])
+        if self._scales is not None:
+            self._scales = np.ascontiguousarray(self._scales[keep])
+        self._set_ids([self._node_ids[i] for i in np.flatnonzero(keep)],
+                      [self._ref_doc_ids[i] for i in np.flatnonzero(keep)])
+
+    def add(self, nodes: list[BaseNode], **add_kwargs: Any) -> list[str]:
+        if not nodes:
+            return []
+        node_ids = [node.node_id for node in nodes]
+        # Re-adding a node replaces its previous vector
+        existing = [node_id for node_id in node_ids if node_id in self._positions]
+        if existing:
+            self.delete_nodes(existing)
+        self._append(
+            node_ids,
+            [node.ref_doc_id for node in nodes],
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        )
+        return node_ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        if not self._node_ids:
+            return
+        keep = np.array([doc_id != ref_doc_id for doc_id in self._ref_doc_ids], dtype=bool)
+        if not keep.all():
+            self._keep_rows(keep)
+
+    def delete_nodes(self, node_ids: list[str] | None = None, filters: Any = None, **delete_kwargs: Any) -> None:
+        if filters is not None:
+            raise NotImplementedError("MmapVectorStore does not support metadata filters")
+        if not node_ids or not self._node_ids:
+            return
+        keep = np.ones(len(self._node_ids), dtype=bool)
+        for node_id in node_ids:
+            position = self._positions.get(node_id)
+            if position is not None:
+                keep[position] = False
+        if not keep.all():
+            self._keep_rows(keep)
+
+    def clear(self) -> None:
+        self._vectors = None
+        self._scales = None
+        self._set_ids([], [])
+
+    def _candidate_rows(self, query: VectorStoreQuery) -> np.ndarray | None:
+        rows = None
+        if query.node_ids:
+            rows = np.array(sorted(self._positions[node_id] for node_id in query.node_ids
+                                   if node_id in self._positions), dtype=np.int64)
+        if query.doc_ids:
+            doc_ids = set(query.doc_ids)
+            doc_rows = np.array([i for i, doc_id in enumerate(self._ref_doc_ids) if doc_id in doc_ids], dtype=np.int64)
+            rows = doc_rows if rows is None else np.intersect1d(rows, doc_rows)
+        if rows is not None and len(rows) == len(self._node_ids):
+            # Restricting to every row is a full scan; avoid the gather copy
+            return None
+        return rows
+
+    def _scores(self, query_vectors: np.ndarray, rows: np.ndarray | None) -> np.ndarray:
+        """Scores of the candidate rows against one query (dim,), or against several (m, dim) as (rows, m)."""
+        count = len(self._node_ids) if rows is None else len(rows)
+        scores = np.empty((count,) + query_vectors.shape[:-1], dtype=np.float32)
+        for start in range(0, count, _SEARCH_BLOCK_ROWS):
+            stop = min(start + _SEARCH_BLOCK_ROWS, count)
+            index = slice(start, stop) if rows is None else rows[start:stop]
+            block = np.asarray(self._vectors[index], dtype=np.float32)
+            scores[start:stop] = block @ query_vectors.T
+            if self._scales is not None:
+                scales = self._scales[index]
+                scores[start:stop] *= scales if query_vectors.ndim == 1 else scales[:, None]
+        return scores
+
+    def _rows(self, index) -> np.ndarray:
+        """Stored vectors as float32, dequantized; they are unit length up to quantization error."""
+        rows = np.asarray(self._vectors[index], dtype=np.float32)
+        if self._scales is not None:
+            rows *= self._scales[index][:, None]
+        return rows
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self._positions
+
+    def get_embeddings(self, node_ids: list) -> np.ndarray:
+        """The stored (normalized) vectors of node_ids, in order."""
+        return self._rows(np.array([self._positions[node_id] for node_id in node_ids], dtype=np.int64))
+
+    def centroid(self) -> np.ndarray | None:
+        """Unit-length mean of all stored vectors, or None when the store is empty."""
+        if not self._node_ids:
+            return None
+        total = np.zeros(self._vectors.shape[1], dtype=np.float64)
+        for start in range(0, len(self._node_ids), _SEARCH_BLOCK_ROWS):
+            total += self._rows(slice(start, start + _SEARCH_BLOCK_ROWS)).sum(axis=0)
+        return _normalize(total.astype(np.float32))
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise NotImplementedError(f"MmapVectorStore does not support query mode {query.mode}")
+        if query.filters is not None:
+            raise NotImplementedError("MmapVectorStore does not support metadata filters")
+        if query.query_embedding is None:
+            raise ValueError("MmapVectorStore requires a query embedding")
+        if not self._node_ids:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        query_vector = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        rows = self._candidate_rows(query)
+        scores = self._scores(query_vector, rows)
+
+        top_k = min(query.similarity_top_k, len(scores))
+        if top_k <= 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        positions = top if rows is None else rows[top]
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in top],
+            ids=[self._node_ids[i] for i in positions]
+        )
+
+    def query_batch(self, query_embeddings: list, similarity_top_k: int,
+                    node_ids: list | None = None) -> list[VectorStoreQueryResult]:
+        """
+        Top-k for many query embeddings at once, in input order. Each block of
+        rows is read once and scored against all the queries in one matrix product.
+        """
+        empty = VectorStoreQueryResult(similarities=[], ids=[])
+        if not self._node_ids or not len(query_embeddings):
+            return [empty for _ in query_embeddings]
+
+        rows = self._candidate_rows(VectorStoreQuery(node_ids=node_ids, similarity_top_k=similarity_top_k))
+        results = []
+        for start in range(0, len(query_embeddings), _SEARCH_BATCH_QUERIES):
+            query_matrix = _normalize(np.asarray(query_embeddings[start:start + _SEARCH_BATCH_QUERIES],
+                                                 dtype=np.float32))
+            scores = self._scores(query_matrix, rows)
+            top_k = min(similarity_top_k, scores.shape[0])
+            if top_k <= 0:
+                results.extend(empty for _ in range(len(query_matrix)))
+                continue
+            top = np.argpartition(-scores, top_k - 1, axis=0)[:top_k]
+            for column in range(scores.shape[1]):
+                column_top = top[:, column]
+                column_top = column_top[np.argsort(-scores[column_top, column])]
+                positions = column_top if rows is None else rows[column_top]
+                results.append(VectorStoreQueryResult(
+                    similarities=[float(scores[i, column]) for i in column_top],
+                    ids=[self._node_ids[i] for i in positions]
+                ))
+        return results
+
+    def persist(self, persist_path: str | None = None, fs: Any = None) -> None:
+        """
+        Write the store next to persist_path (the path StorageContext passes in)
+        or to persist_dir. Each file is written to a temp name and renamed, with
+        meta.json last since it marks the store as complete.
+        """
+        persist_dir = self.persist_dir or os.path.join(os.path.dirname(persist_path), VECTOR_DIR_NAME)
+        os.makedirs(persist_dir, exist_ok=True)
+
+        def replace(name: str, write) -> None:
+            path = os.path.join(persist_dir, name)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+
+        dtype = np.int8 if self.quantization == "int8" else np.dtype(self.quantization)
+        vectors = self._vectors if self._vectors is not None else np.empty((0, 0), dtype=dtype)
+        replace("vectors.npy", lambda f: np.save(f, np.ascontiguousarray(vectors)))
+        if self._scales is not None:
+            replace("scales.npy", lambda f: np.save(f, np.ascontiguousarray(self._scales)))
+        ids = {"node_ids": self._node_ids, "ref_doc_ids": self._ref_doc_ids}
+        replace("ids.json", lambda f: f.write(json.dumps(ids).encode("utf-8")))
+        meta = {
+            "version": FORMAT_VERSION,
+            "quantization": self.quantization,
+            "count": len(self._node_ids),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        }
+        replace("meta.json", lambda f: f.write(json.dumps(meta).encode("utf-8")))
+        self.persist_dir = persist_dir
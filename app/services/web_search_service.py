@@ -1,58 +1,122 @@
-from serpapi import GoogleSearch
+import asyncio
+from app.config import Config
+from app.services.http_clients import HttpClients
+from app.services.search_cache import SearchCache
 
 
 class WebSearchService:
-    def __init__(self, openai_client, web_search_api):
+    def __init__(self, openai_client, web_search_api, async_openai_client=None,
+                 search_cache: SearchCache | None = None, http_clients: HttpClients | None = None):
         self.openai_client = openai_client
+        self.async_openai_client = async_openai_client
         self.web_search_api = web_search_api
+        self.search_cache = search_cache
+        # SerpAPI is called over the shared connection pools rather than the serpapi package
+        self.http_clients = http_clients or HttpClients(Config.OPENAI_BASE_URL, Config.SERP_API_BASE_URL)
 
-    def rephrase_query(self, user_question, chat_history):
-        try:
-            prompt = f"""
+    def _rephrase_messages(self, user_question, chat_history) -> list:
+        prompt = f"""
             Rephrase the following user question so it is clear, specific, and suitable for a web search.
             Previous chat:
             {chat_history}
             User question: {user_question}
             Rephrased web search query:
             """
+        return [{"role": "system", "content": prompt}]
+
+    def rephrase_query(self, user_question, chat_history):
+        try:
             # Call GPT-3.5 or GPT-4o here
             response = self.openai_client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=[{"role": "system", "content": prompt}]
+                messages=self._rephrase_messages(user_question, chat_history)
             )
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"Error rephrasing query: {e}")
             return user_question  # Fallback to original question
 
+    async def arephrase_query(self, user_question, chat_history):
+        """Async rephrase_query; errors propagate so the caller decides on the fallback."""
+        if self.async_openai_client is None:
+            return await asyncio.to_thread(self.rephrase_query, user_question, chat_history)
+        response = await self.async_openai_client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=self._rephrase_messages(user_question, chat_history)
+        )
+        return response.choices[0].message.content.strip()
+
     def do_web_search(self, query, num_results=4):
         try:
-            params = {
-                "q": query,
-                "api_key": self.web_search_api,
-                "num": num_results,
-                "engine": "google"
-            }
-            search = GoogleSearch(params)
-            results = search.get_dict()
-            
-            # Check for errors in the response
-            if "error" in results:
-                print(f"Search API error: {results['error']}")
-                return f"Search error: {results['error']}"
-            
-            # Extract top organic results
-            organic_results = results.get("organic_results", [])
-            if not organic_results:
+            formatted = self.web_search_results(query, num_results, raise_errors=True)
+            if not formatted:
                 return "No search results found."
-                
-            formatted = []
-            for r in organic_results:
-                title = r.get("title", "")
-                snippet = r.get("snippet", "")
-                link = r.get("link", "")
-                formatted.append(f"Title: {title}\nSnippet: {snippet}\nLink: {link}")
             return "\n\n".join(formatted)
         except Exception as e:
             print(f"Error in web search: {e}")
             return f"Search error: {str(e)}"
+
+    def _serpapi_params(self, query, num_results) -> dict:
+        return {
+            "q": query,
+            "api_key": self.web_search_api,
+            "num": num_results,
+            "engine": "google",
+            "output": "json",
+            "source": "python"
+        }
+
+    @staticmethod
+    def _format_results(results: dict) -> list:
+        # Check for errors in the response
+        if "error" in results:
+            raise RuntimeError(results['error'])
+
+        # Extract top organic results
+        organic_results = results.get("organic_results", [])
+        formatted = []
+        for r in organic_results:
+            title = r.get("title", "")
+            snippet = r.get("snippet", "")
+            link = r.get("link", "")
+            formatted.append(f"Title: {title}\nSnippet: {snippet}\nLink: {link}")
+        return formatted
+
+    def _serpapi_results(self, query, num_results=4):
+        """Query SerpAPI and return the top organic results as formatted strings, best first."""
+        response = self.http_clients.search_sync.get("/search", params=self._serpapi_params(query, num_results))
+        return self._format_results(response.json())
+
+    async def _aserpapi_results(self, query, num_results=4):
+        response = await self.http_clients.search.get("/search", params=self._serpapi_params(query, num_results))
+        return self._format_results(response.json())
+
+    def web_search_results(self, query, num_results=4, raise_errors=False):
+        """Return the top organic results as individual formatted strings, best first."""
+        try:
+            key = SearchCache.key(query, num_results)
+            if self.search_cache is not None:
+                cached = self.search_cache.get(key)
+                if cached is not None:
+                    return cached
+            formatted = self._serpapi_results(query, num_results)
+            if self.search_cache is not None:
+                self.search_cache.put(key, formatted)
+            return formatted
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"Error in web search: {e}")
+            return []
+
+    async def aweb_search_results(self, query, num_results=4):
+        """
+        Cached web_search_results for async callers: identical concurrent searches
+        share one SerpAPI call. Errors propagate.
+        """
+        if self.search_cache is None:
+            return await self._aserpapi_results(query, num_results)
+        return await self.search_cache.get_or_fetch(
+            SearchCache.key(query, num_results),
+            lambda: self._aserpapi_results(query, num_results)
+        )
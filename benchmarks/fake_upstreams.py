@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from fastapi import FastAPI, Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+
+class UpstreamProfile:
+    """
+    How the stand-in OpenAI and SerpAPI endpoints behave.
+
+    ttft is the delay before the first streamed token, tokens_per_second the
+    streaming rate after it, and response_tokens the length of each answer.
+    research_ratio is the share of first-turn completions that call
+    research_wrapper instead of answering, which exercises the research path.
+    jitter spreads every delay uniformly by +/- that fraction. Streams asking
+    for usage get a prompt cache hit for the longest run of leading messages
+    already seen, when it is at least cache_min_tokens long.
+    """
+
+    def __init__(self, ttft: float = 0.4, tokens_per_second: float = 60.0, response_tokens: int = 150,
+                 rephrase_latency: float = 0.3, search_latency: float = 0.8, research_ratio: float = 0.0,
+                 jitter: float = 0.2, seed: int = 0, cache_min_tokens: int = 1024):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.rephrase_latency = rephrase_latency
+        self.search_latency = search_latency
+        self.research_ratio = research_ratio
+        self.jitter = jitter
+        self.cache_min_tokens = cache_min_tokens
+        self.random = random.Random(seed)
+
+    def delay(self, seconds: float) -> float:
+        return max(0.0, seconds * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+    def to_dict(self) -> dict:
+        return {
+            "ttft": self.ttft,
+            "tokens_per_second": self.tokens_per_second,
+            "response_tokens": self.response_tokens,
+            "rephrase_latency": self.rephrase_latency,
+            "search_latency": self.search_latency,
+            "research_ratio": self.research_ratio,
+            "jitter": self.jitter,
+            "cache_min_tokens": self.cache_min_tokens,
+        }
+
+
+def _chunk(model: str, delta: dict, finish_reason: str | None = None) -> str:
+    chunk = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def _usage_chunk(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> str:
+    chunk = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens,
+                  "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def create_fake_upstream(profile: UpstreamProfile) -> FastAPI:
+    """One app serving both the OpenAI chat completions API and SerpAPI's /search."""
+    app = FastAPI()
+    app.state.requests = {"chat_stream": 0, "chat": 0, "search": 0}
+    app.state.prompt_prefixes = set()
+
+    def prompt_usage(messages: list) -> tuple[int, int]:
+        """(prompt tokens, cached tokens), counting about four characters per token."""
+        sizes = [len(json.dumps(message, ensure_ascii=False)) // 4 for message in messages]
+        digest = hashlib.sha1()
+        cached_messages = 0
+        for i, message in enumerate(messages):
+            digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode())
+            prefix = digest.hexdigest()
+            if cached_messages == i and prefix in app.state.prompt_prefixes:
+                cached_messages = i + 1
+            app.state.prompt_prefixes.add(prefix)
+        cached_tokens = sum(sizes[:cached_messages])
+        return sum(sizes), cached_tokens if cached_tokens >= profile.cache_min_tokens else 0
+
+    async def stream_completion(model: str, messages: list, usage: tuple | None):
+        await asyncio.sleep(profile.delay(profile.ttft))
+        completion_tokens = 0
+        wants_research = messages[-1]["role"] == "user" and profile.random.random() < profile.research_ratio
+        if wants_research:
+            arguments = json.dumps({"question": messages[-1]["content"]})
+            yield _chunk(model, {"role": "assistant", "function_call": {"name": "research_wrapper", "arguments": ""}})
+            yield _chunk(model, {"function_call": {"arguments": arguments}})
+            yield _chunk(model, {}, "function_call")
+        else:
+            interval = 1 / profile.tokens_per_second if profile.tokens_per_second > 0 else 0
+            for i in range(profile.response_tokens):
+                yield _chunk(model, {"content": f"token{i} "})
+                completion_tokens += 1
+                if interval:
+                    await asyncio.sleep(profile.delay(interval))
+            yield _chunk(model, {}, "stop")
+        if usage is not None:
+            yield _usage_chunk(model, *usage, completion_tokens)
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-bench")
+        if body.get("stream"):
+            app.state.requests["chat_stream"] += 1
+            usage = None
+            if (body.get("stream_options") or {}).get("include_usage"):
+                # The function schemas are part of the prompt, ahead of the messages
+                usage = prompt_usage([body.get("functions") or []] + body["messages"])
+            return StreamingResponse(stream_completion(model, body["messages"], usage),
+                                     media_type="text/event-stream")
+
+        # Non-streaming calls are query rephrasing
+        app.state.requests["chat"] += 1
+        await asyncio.sleep(profile.delay(profile.rephrase_latency))
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"rephrased: {body['messages'][-1]['content'][-80:]}"},
+                "finish_reason": "stop",
+            }],
+        }
+
+    @app.get("/search")
+    async def search(q: str = "", num: int = 4):
+        app.state.requests["search"] += 1
+        await asyncio.sleep(profile.delay(profile.search_latency))
+        return JSONResponse({
+            "organic_results": [
+                {"title": f"Result {i} for {q[:40]}", "snippet": "Benchmark snippet " * 20,
+                 "link": f"https://example.com/{i}"}
+                for i in range(num)
+            ]
+        })
+
+    # Connection warm-up probes
+    @app.head("/")
+    @app.head("/v1")
+    async def head():
+        return Response(status_code=200)
+
+    return app
@@ -0,0 +1,307 @@
+"""
+Offline load test for /api/fleetAssistant.
+
+Runs the real FastAPI app (real index and embedding model) in-process
+against local stand-ins for OpenAI and SerpAPI, drives concurrent SSE
+clients and reports time to first byte, total latency, throughput and the
+app's event-loop lag. Results are written as JSON; pass --compare with an
+earlier result to flag regressions before deploy.
+
+    python -m benchmarks.load_test --clients 20 --requests 200
+    python -m benchmarks.load_test --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+import httpx
+import uvicorn
+
+from benchmarks.fake_upstreams import UpstreamProfile, create_fake_upstream
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Lower is better for every compared metric except throughput
+COMPARED_METRICS = [
+    ("ttfb", "p50"), ("ttfb", "p95"), ("ttfb", "p99"),
+    ("latency", "p50"), ("latency", "p95"), ("latency", "p99"),
+    ("loop_lag", "p95"), ("loop_lag", "max"),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def nearest_rank(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))], 4)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": nearest_rank(50),
+        "p95": nearest_rank(95),
+        "p99": nearest_rank(99),
+        "max": round(ordered[-1], 4),
+    }
+
+
+class ServerThread:
+    """A uvicorn server on its own thread and event loop."""
+
+    def __init__(self, app, port: int):
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self, timeout: float = 30.0) -> None:
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"Server on port {self.port} did not start")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+class LoopLagProbe:
+    """Samples how late a periodic sleep wakes up on the loop it runs on."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []
+        self.recording = False
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            if self.recording:
+                self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+
+def load_questions(path: str | None, data_dir: str) -> list:
+    """Questions from a file (one per line), or built from page titles in the module files."""
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    questions = []
+    for file in sorted(glob.glob(os.path.join(data_dir, "*.json"))):
+        with open(file, "r", encoding="utf-8") as f:
+            tree = json.load(f)
+        titles = [doc["title"] for doc in tree.get("documents", [])] or [tree["title"]]
+        questions.extend(f"How do I use {title}?" for title in titles)
+    return questions or ["How do I add a crew member?"]
+
+
+async def run_request(client: httpx.AsyncClient, question: str, session_id: str) -> dict:
+    started = time.perf_counter()
+    result = {"ok": False, "status": None, "ttfb": None, "latency": None, "events": 0, "bytes": 0}
+    try:
+        async with client.stream("POST", "/api/fleetAssistant",
+                                 json={"question": question, "session_id": session_id}) as response:
+            result["status"] = response.status_code
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                if result["ttfb"] is None and chunk:
+                    result["ttfb"] = time.perf_counter() - started
+                body.extend(chunk)
+        result["latency"] = time.perf_counter() - started
+        result["events"] = body.count(b"data: ")
+        result["bytes"] = len(body)
+        result["ok"] = (response.status_code == 200 and b'"error"' not in body
+                        and re.search(rb'"end":\s*true', body) is not None)
+    except httpx.HTTPError as e:
+        result["error"] = str(e)
+        result["latency"] = time.perf_counter() - started
+    return result
+
+
+async def drive(base_url: str, clients: int, requests: int, questions: list, timeout: float) -> tuple[list, float]:
+    """Run requests spread over clients concurrent SSE clients, each keeping its own session."""
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(questions[i % len(questions)])
+    results = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            session_id = str(uuid.uuid4())
+            while not queue.empty():
+                question = queue.get_nowait()
+                results.append(await run_request(client, question, session_id))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "statuses": statuses,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "ttfb": percentiles([r["ttfb"] for r in ok]),
+        "latency": percentiles([r["latency"] for r in ok]),
+        "events_per_request": round(sum(r["events"] for r in ok) / len(ok), 1) if ok else 0.0,
+        "bytes_per_request": round(sum(r["bytes"] for r in ok) / len(ok), 1) if ok else 0.0,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that got worse than baseline by more than tolerance (a fraction)."""
+    regressions = []
+    for group, stat in COMPARED_METRICS:
+        before = baseline["summary"].get(group, {}).get(stat)
+        after = current["summary"].get(group, {}).get(stat)
+        if before and after is not None and after > before * (1 + tolerance):
+            regressions.append(f"{group}.{stat}: {before} -> {after} (+{(after / before - 1) * 100:.1f}%)")
+    before = baseline["summary"]["throughput_rps"]
+    after = current["summary"]["throughput_rps"]
+    if before and after < before * (1 - tolerance):
+        regressions.append(f"throughput_rps: {before} -> {after} ({(after / before - 1) * 100:.1f}%)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test /api/fleetAssistant against fake upstreams")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent SSE clients")
+    parser.add_argument("--requests", type=int, default=100, help="total requests")
+    parser.add_argument("--warmup", type=int, default=5, help="requests sent before measuring")
+    parser.add_argument("--questions", help="file with one question per line (default: page titles)")
+    parser.add_argument("--ttft", type=float, default=0.4, help="fake model time to first token, seconds")
+    parser.add_argument("--token-rate", type=float, default=60.0, help="fake model tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=150)
+    parser.add_argument("--rephrase-latency", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.8)
+    parser.add_argument("--research-ratio", type=float, default=0.0,
+                        help="share of questions the fake model answers with a research_wrapper call")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout, seconds")
+    parser.add_argument("--label", default="", help="free-form label stored with the results")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression, as a fraction")
+    args = parser.parse_args()
+
+    profile = UpstreamProfile(ttft=args.ttft, tokens_per_second=args.token_rate,
+                              response_tokens=args.response_tokens, rephrase_latency=args.rephrase_latency,
+                              search_latency=args.search_latency, research_ratio=args.research_ratio)
+    upstream = ServerThread(create_fake_upstream(profile), free_port())
+    upstream.start()
+    upstream_url = f"http://127.0.0.1:{upstream.port}"
+
+    # Config is read at import, so point the app at the fakes before importing it
+    os.environ.update({
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench"),
+        "SERP_API_KEY": os.environ.get("SERP_API_KEY", "bench"),
+        "OPENAI_BASE_URL": f"{upstream_url}/v1",
+        "SERP_API_BASE_URL": upstream_url,
+        "SEARCH_CACHE_PATH": "",
+    })
+    from app import create_app, limiter
+
+    limiter.enabled = False
+    app = create_app()
+    probe = LoopLagProbe()
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # The probe has to run on the server's loop, so it starts with the app
+        probe.start()
+        async with app_lifespan(app) as state:
+            yield state
+
+    app.router.lifespan_context = lifespan
+    server = ServerThread(app, free_port())
+    server.start()
+    base_url = f"http://127.0.0.1:{server.port}"
+
+    try:
+        # The index loads in the background; wait for /ready before measuring
+        deadline = time.monotonic() + 600
+        while True:
+            status = httpx.get(f"{base_url}/ready", timeout=10).json()
+            if status["ready"]:
+                break
+            if status["state"] == "failed" or time.monotonic() > deadline:
+                print(f"App did not become ready: {status}", file=sys.stderr)
+                return 2
+            time.sleep(0.5)
+
+        questions = load_questions(args.questions, "app/source_files/")
+        if args.warmup:
+            asyncio.run(drive(base_url, min(args.clients, args.warmup), args.warmup, questions, args.timeout))
+        probe.recording = True
+        results, elapsed = asyncio.run(drive(base_url, args.clients, args.requests, questions, args.timeout))
+        probe.recording = False
+
+        summary = summarize(results, elapsed)
+        summary["loop_lag"] = percentiles(probe.samples)
+        report = {
+            "label": args.label,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {"clients": args.clients, "requests": args.requests, "warmup": args.warmup,
+                       "upstream": profile.to_dict()},
+            "summary": summary,
+            "startup": status,
+            "server_stats": httpx.get(f"{base_url}/api/retrievalStats", timeout=10).json(),
+            "model_stats": httpx.get(f"{base_url}/api/modelStats", timeout=10).json(),
+        }
+    finally:
+        server.stop()
+        upstream.stop()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(summary, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["config"] != report["config"]:
+            print("Warning: baseline was run with a different configuration", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
 from app import create_app
+from app.config import Config
+import multiprocessing
 import uvicorn
 import os
 
@@ -6,4 +8,19 @@ app = create_app()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8000))
-    uvicorn.run(app, host='0.0.0.0', port=port)
+    if Config.SHARED_INDEX:
+        # Load the embedding model and index once, in a process the workers query over a Unix socket
+        from app.services.retrieval_server import run_retrieval_server
+        retrieval_server = multiprocessing.Process(
+            target=run_retrieval_server,
+            args=(Config.RETRIEVAL_SOCKET,),
+            kwargs={"data_dir": "app/source_files/", "index_dir": "app/index_storage"},
+            name="fleetops-retrieval",
+            daemon=True
+        )
+        retrieval_server.start()
+    if Config.WEB_WORKERS > 1:
+        # Workers import the app themselves, so it is passed by import string
+        uvicorn.run("main:app", host='0.0.0.0', port=port, workers=Config.WEB_WORKERS)
+    else:
+        uvicorn.run(app, host='0.0.0.0', port=port)
@@ -0,0 +1,44 @@
+from llama_index.core.schema import Document, MetadataMode, NodeRelationship
+from app.services.chunking import PageChunker
+from app.services.database_service import html_to_text
+
+
+def _page(page_id: int, text: str, title: str) -> Document:
+    return Document(text=text, id_=f"page-{page_id}", metadata={"id": page_id, "title": title})
+
+
+def test_title_only_pages_get_one_node():
+    chunker = PageChunker(chunk_size=64, chunk_overlap=8, min_chunk_tokens=16)
+    pages = [_page(1, "", "Crew Management"), _page(2, "   \n  ", "Crew Management > Onboarding")]
+
+    nodes = chunker.chunk_documents(pages)
+
+    assert [node.id_ for node in nodes] == ["page-1#0", "page-2#0"]
+    assert nodes[1].metadata == {"id": 2, "title": "Crew Management > Onboarding"}
+    assert nodes[1].relationships[NodeRelationship.SOURCE].node_id == "page-2"
+    assert "Crew Management > Onboarding" in nodes[1].get_content(metadata_mode=MetadataMode.EMBED)
+
+
+def test_pages_with_text_are_chunked_by_token_budget():
+    chunker = PageChunker(chunk_size=64, chunk_overlap=8, min_chunk_tokens=16)
+    text = " ".join(f"Step {i} registers the seafarer's documents in the vessel crew list." for i in range(40))
+
+    nodes = chunker.chunk_documents([_page(3, text, "Crew Management > Sign on")])
+
+    assert len(nodes) > 1
+    assert [node.id_ for node in nodes] == [f"page-3#{i}" for i in range(len(nodes))]
+
+
+def test_html_headings_start_new_chunks():
+    chunker = PageChunker(chunk_size=64, chunk_overlap=8, min_chunk_tokens=16)
+    html = (
+        "<h2>Adding crew</h2>"
+        "<p>Open the <b>Crew List</b> of the vessel and press Add. Enter the rank, name and nationality of the "
+        "seafarer, then the contract start and end dates.</p>"
+        "<h2>Removing crew</h2>"
+        "<p>Select the seafarer in the Crew List and press Sign Off. Enter the sign-off port and date.</p>"
+    )
+
+    nodes = chunker.chunk_documents([_page(4, html_to_text(html), "Crew Management > Crew List")])
+
+    assert [node.text.split(" ")[:2] for node in nodes] == [["Adding", "crew"], ["Removing", "crew"]]
@@ -0,0 +1,69 @@
+from app.services.context_compressor import ContextCompressor
+
+SIGN_ON = (
+    "Sailors are registered from the Personnel tab of the vessel page. "
+    "Open the vessel and select New Registration. "
+    "Enter the passport number, rank and contract dates. "
+    "Attach the medical certificate and the STCW endorsements. "
+    "Press Save to send the registration for approval."
+)
+BUNKERING = (
+    "Bunker deliveries are recorded against the voyage. "
+    "Enter the grade, quantity and supplier from the delivery note. "
+    "The sample seal numbers are required for every bunker delivery. "
+    "Sound the tanks, then sign the receipt. "
+    "Deliveries over the tank capacity are rejected."
+)
+
+
+def test_passage_without_query_terms_is_kept_whole():
+    compressor = ContextCompressor(min_sentences=2)
+
+    (corpus,), stats = compressor.compress("How do I onboard a seafarer?", [SIGN_ON])
+
+    assert corpus == [SIGN_ON]
+    assert stats.passages_kept_whole == 1
+    assert stats.sentences_dropped == 0
+
+
+def test_passage_sharing_an_incidental_word_is_kept_whole():
+    compressor = ContextCompressor(min_sentences=1)
+    passage = SIGN_ON + " The documents stay onboard until sign-off."
+
+    (corpus,), stats = compressor.compress("How do I onboard a new seafarer?", [passage])
+
+    assert corpus == [passage]
+    assert stats.passages_kept_whole == 1
+
+
+def test_matching_passage_is_cut_to_relevant_sentences():
+    compressor = ContextCompressor(min_sentences=1)
+
+    (corpus,), stats = compressor.compress("Where do I attach the medical certificate?", [SIGN_ON])
+
+    assert "Attach the medical certificate and the STCW endorsements." in corpus[0]
+    assert "Open the vessel and select New Registration." not in corpus[0]
+    assert stats.passages_kept_whole == 0
+
+
+def test_follow_up_is_scored_against_earlier_questions():
+    compressor = ContextCompressor(min_sentences=1)
+    history = ["How do I record a bunker delivery?"]
+
+    (alone,), _ = compressor.compress("And then?", [BUNKERING])
+    (corpus,), _ = compressor.compress("And then?", [BUNKERING, SIGN_ON], history=history)
+
+    # On its own "then" only matches an incidental sentence; the earlier question keeps the procedure
+    assert "Bunker deliveries are recorded against the voyage." not in alone[0]
+    assert "Bunker deliveries are recorded against the voyage." in corpus[0]
+    assert "The sample seal numbers are required for every bunker delivery." in corpus[0]
+    assert corpus[1] == SIGN_ON
+
+
+def test_only_recent_questions_count():
+    compressor = ContextCompressor(min_sentences=1, history_turns=1)
+    history = ["How do I record a bunker delivery?", "Where is the personnel tab?"]
+
+    (corpus,), _ = compressor.compress("And then?", [BUNKERING], history=history)
+
+    assert "Bunker deliveries are recorded against the voyage." not in corpus[0]
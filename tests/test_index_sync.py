@@ -0,0 +1,78 @@
+import json
+import os
+from types import SimpleNamespace
+from app.services.database_service import DatabaseService
+from app.services.index_sync import WikiIndexSync
+
+
+class FakeWikidocs(DatabaseService):
+    """The tree-building half of DatabaseService over an in-memory Wikidocs table."""
+
+    def __init__(self, rows: dict):
+        self.rows = rows
+        self.pages = []
+        self._spool = None
+
+    def fetch_page_hashes(self) -> dict:
+        return {page_id: {"hash": f"{row['title']}|{row['parent_id']}|{row['content']}",
+                          "title": row["title"], "parent_id": row["parent_id"]}
+                for page_id, row in self.rows.items()}
+
+    def fetch_pages(self, wiki_doc_ids) -> list:
+        return [{"id": page_id, **self.rows[page_id]} for page_id in wiki_doc_ids if page_id in self.rows]
+
+
+class FakePipeline:
+    def __init__(self, index_dir: str):
+        self.data_dir = "app/source_files"
+        self.index_dir = index_dir
+        self.changes = []
+
+    def flatten_pages(self, tree: dict) -> list:
+        return [SimpleNamespace(metadata={"id": doc["id"]}) for doc in tree["documents"]]
+
+    def apply_changes(self, documents: list, removed_ids: list) -> int:
+        self.changes.append(({doc.metadata["id"] for doc in documents}, set(removed_ids)))
+        return len(documents)
+
+
+def _tree_ids(data_dir: str) -> set:
+    ids = set()
+    for filename in os.listdir(data_dir):
+        with open(os.path.join(data_dir, filename), "r", encoding="utf-8") as f:
+            ids.update(doc["id"] for doc in json.load(f)["documents"])
+    return ids
+
+
+def test_deleting_a_parent_removes_the_vectors_of_its_orphaned_children(tmp_path, monkeypatch):
+    # module_to_json writes below the working directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("app/source_files")
+    rows = {
+        1: {"title": "Crew Management", "parent_id": None, "content": "Crew"},
+        2: {"title": "Onboarding", "parent_id": 1, "content": "Sign on"},
+        3: {"title": "Documents", "parent_id": 2, "content": "Passports"},
+        4: {"title": "Payroll", "parent_id": 1, "content": "Wages"},
+    }
+    db_service = FakeWikidocs(rows)
+    pipeline = FakePipeline(str(tmp_path))
+    sync = WikiIndexSync(db_service, pipeline)
+    sync.sync()
+    assert _tree_ids(pipeline.data_dir) == {1, 2, 3, 4}
+
+    del rows[2]
+    report = sync.sync()
+
+    assert report.deleted == [2]
+    assert report.orphaned == [3]
+    assert pipeline.changes[-1] == (set(), {2, 3})
+    assert _tree_ids(pipeline.data_dir) == {1, 4}
+
+    # Restoring the parent brings the unchanged orphan back into the tree and re-embeds it
+    rows[2] = {"title": "Onboarding", "parent_id": 1, "content": "Sign on"}
+    report = sync.sync()
+
+    assert report.inserted == [2]
+    assert report.orphaned == []
+    assert pipeline.changes[-1] == ({2, 3}, set())
+    assert _tree_ids(pipeline.data_dir) == {1, 2, 3, 4}
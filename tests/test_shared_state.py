@@ -0,0 +1,142 @@
+import threading
+import pytest
+from app.services import shared_state
+from app.services.shared_state import SQLiteLimitStorage, SQLiteSearchCache, SQLiteSessionStore, SQLiteState
+
+
+class Clock:
+    """Stands in for the time module in shared_state, so expiry is tested without sleeping."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(shared_state, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    return str(tmp_path / "state.sqlite3")
+
+
+def test_limit_counter_incr_get_and_clear(db_path, clock):
+    storage = SQLiteLimitStorage(f"sqlite://{db_path}")
+
+    assert storage.get("client") == 0
+    assert storage.incr("client", expiry=60) == 1
+    assert storage.incr("client", expiry=60, amount=2) == 3
+    assert storage.get("client") == 3
+    assert storage.get("other") == 0
+    # The window is fixed when the counter is created, not moved by later hits
+    assert storage.get_expiry("client") == clock.now + 60
+    assert storage.check()
+
+    storage.clear("client")
+
+    assert storage.get("client") == 0
+    assert storage.get_expiry("client") == clock.now
+
+
+def test_limit_counter_expires_with_its_window(db_path, clock):
+    storage = SQLiteLimitStorage(f"sqlite://{db_path}")
+    storage.incr("client", expiry=60)
+    storage.incr("client", expiry=60)
+
+    clock.now += 59
+    assert storage.get("client") == 2
+
+    clock.now += 1
+    assert storage.get("client") == 0
+    # The next hit opens a new window
+    assert storage.incr("client", expiry=60) == 1
+    assert storage.get_expiry("client") == clock.now + 60
+
+
+def test_limit_counter_is_shared_between_connections(db_path, clock):
+    # Two storages stand in for two uvicorn workers on the same file
+    first = SQLiteLimitStorage(f"sqlite://{db_path}")
+    second = SQLiteLimitStorage(f"sqlite://{db_path}")
+
+    first.incr("client", expiry=60)
+    assert second.incr("client", expiry=60) == 2
+    assert first.get("client") == 2
+
+    def hit(storage):
+        for _ in range(50):
+            storage.incr("client", expiry=60)
+
+    threads = [threading.Thread(target=hit, args=(storage,)) for storage in (first, second, first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert first.get("client") == 202
+    assert second.reset() == 1
+    assert first.get("client") == 0
+
+
+def test_session_turns_are_shared_between_stores(db_path, clock):
+    first = SQLiteSessionStore(SQLiteState(db_path))
+    second = SQLiteSessionStore(SQLiteState(db_path))
+
+    session = first.get_or_create("abc")
+    first.add_turn(session, "How do I add a crew member?", "Open the Crew List and press Add.")
+    # A stale copy of the session on another worker still keeps both turns
+    stale = second.get_or_create("abc")
+    first.add_turn(session, "And remove one?", "Press Sign Off.")
+    second.add_turn(stale, "Which port?", "The sign-off port.")
+
+    reloaded = first.get_or_create("abc")
+
+    assert [turn["user"] for turn in reloaded.turns] == ["How do I add a crew member?", "And remove one?", "Which port?"]
+    assert reloaded.byte_size == sum(len(turn["user"]) + len(turn["bot"]) for turn in reloaded.turns)
+    assert len(second) == 1
+    assert first.get_or_create().session_id != "abc"
+
+
+def test_sessions_expire_and_are_capped(db_path, clock):
+    store = SQLiteSessionStore(SQLiteState(db_path), max_sessions=2, ttl_seconds=60)
+    for session_id in ("a", "b", "c"):
+        clock.now += 1
+        store.add_turn(store.get_or_create(session_id), "question", "answer")
+
+    # The least recently used session is evicted past max_sessions
+    assert len(store) == 2
+    assert store.get_or_create("a").turns == []
+
+    clock.now += 60
+    assert store.get_or_create("c").turns == []
+    assert store.stats()["sessions"] == 0
+
+
+def test_search_cache_is_shared_and_expires(db_path, clock):
+    first = SQLiteSearchCache(SQLiteState(db_path), max_entries=2, ttl_seconds=60)
+    second = SQLiteSearchCache(SQLiteState(db_path), max_entries=2, ttl_seconds=60)
+    results = [{"title": "Crew list", "link": "https://example.com/crew"}]
+
+    assert first.get("crew") is None
+    first.put("crew", results)
+
+    assert second.get("crew") == results
+    assert (first.stats()["misses"], second.stats()["hits"]) == (1, 1)
+
+    clock.now += 1
+    second.put("voyage", [])
+    clock.now += 1
+    second.put("port", [])
+
+    # The oldest entry is evicted past max_entries
+    assert first.get("crew") is None
+    assert second.stats()["entries"] == 2
+    assert second.stats()["evictions"] == 1
+
+    clock.now += 60
+    assert first.get("port") is None
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from app.services.vector_store import MmapVectorStore
+
+
+def _nodes(embeddings: np.ndarray, pages: int = 10) -> list:
+    nodes = []
+    for i, embedding in enumerate(embeddings):
+        node = TextNode(id_=f"node-{i}", text="", embedding=embedding.tolist())
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=f"page-{i % pages}")
+        nodes.append(node)
+    return nodes
+
+
+def _store(embeddings: np.ndarray, quantization: str = "float32", persist_dir: str | None = None) -> MmapVectorStore:
+    store = MmapVectorStore(persist_dir=persist_dir, quantization=quantization)
+    store.add(_nodes(embeddings))
+    return store
+
+
+def _query(store: MmapVectorStore, embedding: np.ndarray, top_k: int = 10, **kwargs):
+    return store.query(VectorStoreQuery(query_embedding=embedding.tolist(), similarity_top_k=top_k, **kwargs))
+
+
+@pytest.fixture
+def embeddings() -> np.ndarray:
+    return np.random.default_rng(7).normal(size=(600, 64)).astype(np.float32)
+
+
+@pytest.fixture
+def queries(embeddings) -> np.ndarray:
+    # Noisy copies of stored vectors, so every query has a clear nearest neighbour
+    rng = np.random.default_rng(11)
+    return embeddings[rng.choice(len(embeddings), 20, replace=False)] + rng.normal(scale=0.5, size=(20, 64))
+
+
+def test_top_k_matches_brute_force(embeddings, queries):
+    store = _store(embeddings)
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    for query in queries:
+        result = _query(store, query)
+        exact = unit @ (query / np.linalg.norm(query))
+        expected = np.argsort(-exact)[:10]
+
+        assert result.ids == [f"node-{i}" for i in expected]
+        np.testing.assert_allclose(result.similarities, exact[expected], rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize("quantization, min_recall, atol", [("float16", 1.0, 1e-3), ("int8", 0.9, 2e-2)])
+def test_quantized_top_k_is_close_to_float32(embeddings, queries, quantization, min_recall, atol):
+    exact = _store(embeddings)
+    quantized = _store(embeddings, quantization)
+
+    overlap = 0
+    for query in queries:
+        expected = _query(exact, query)
+        result = _query(quantized, query)
+        overlap += len(set(expected.ids) & set(result.ids))
+
+        assert result.ids[0] == expected.ids[0]
+        np.testing.assert_allclose(result.similarities[0], expected.similarities[0], atol=atol)
+    assert overlap / (10 * len(queries)) >= min_recall
+
+
+@pytest.mark.parametrize("quantization", ["float32", "float16", "int8"])
+def test_persist_and_reload_round_trip(tmp_path, embeddings, queries, quantization):
+    store = _store(embeddings, quantization, persist_dir=str(tmp_path / "vectors"))
+    store.persist()
+
+    # A configured quantization that differs from the one on disk is ignored
+    reloaded = MmapVectorStore.from_persist_dir(str(tmp_path), quantization="float32")
+
+    assert reloaded.quantization == quantization
+    assert reloaded.count == store.count
+    assert reloaded.dim == 64
+    for query in queries[:5]:
+        assert _query(reloaded, query).ids == _query(store, query).ids
+    np.testing.assert_allclose(reloaded.get_embeddings(["node-0", "node-5"]),
+                               store.get_embeddings(["node-0", "node-5"]))
+
+
+def test_missing_store_loads_empty(tmp_path, queries):
+    store = MmapVectorStore.from_persist_dir(str(tmp_path), quantization="int8")
+
+    assert store.count == 0
+    assert _query(store, queries[0]).ids == []
+
+
+def test_delete_by_page_and_by_node(embeddings):
+    store = _store(embeddings[:50])
+    target = embeddings[3]
+
+    store.delete("page-3")
+
+    assert store.count == 45
+    assert not any(store.has_node(f"node-{i}") for i in range(3, 50, 10))
+    assert "node-3" not in _query(store, target, top_k=50).ids
+
+    store.delete_nodes(["node-0", "node-1", "missing"])
+
+    assert store.count == 43
+    assert _query(store, embeddings[2], top_k=1).ids == ["node-2"]
+    np.testing.assert_allclose(store.get_embeddings(["node-2"])[0], embeddings[2] / np.linalg.norm(embeddings[2]),
+                               rtol=1e-6)
+
+
+def test_re_adding_a_node_replaces_its_vector(embeddings):
+    store = _store(embeddings[:10])
+
+    store.add(_nodes(embeddings[20:21]))
+
+    assert store.count == 10
+    assert _query(store, embeddings[20], top_k=1).ids == ["node-0"]
+
+
+@pytest.mark.parametrize("quantization", ["float32", "int8"])
+def test_query_batch_matches_single_queries(embeddings, queries, quantization):
+    store = _store(embeddings, quantization)
+
+    results = store.query_batch(list(queries), similarity_top_k=5)
+
+    assert len(results) == len(queries)
+    for query, result in zip(queries, results):
+        single = _query(store, query, top_k=5)
+        assert result.ids == single.ids
+        np.testing.assert_allclose(result.similarities, single.similarities, rtol=1e-5, atol=1e-6)
+
+
+def test_query_batch_restricted_to_node_ids(embeddings, queries):
+    store = _store(embeddings)
+    node_ids = [f"node-{i}" for i in range(0, 600, 3)]
+
+    results = store.query_batch(list(queries[:3]), similarity_top_k=4, node_ids=node_ids)
+
+    for query, result in zip(queries[:3], results):
+        assert set(result.ids) <= set(node_ids)
+        assert result.ids == _query(store, query, top_k=4, node_ids=node_ids).ids